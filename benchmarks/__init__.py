@@ -0,0 +1 @@
+"""Benchmark dei percorsi critici della repository (eseguire dalla root: ``python -m benchmarks.<modulo>``)."""
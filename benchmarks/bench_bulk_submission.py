@@ -0,0 +1,124 @@
+"""Output e invio dei payload REST: un JSON e una POST per domanda contro NDJSON unico e POST batch gzip, sullo stub locale.
+
+    python -m benchmarks.bench_bulk_submission --payloads 2000 --batch-size 50 --latency 0.02
+
+I payload sono quelli dei formulari della repository, replicati con
+``idDomanda`` diversi. Per l'output misura tempo, byte e numero di file di
+un JSON ``indent=4`` per domanda, di un NDJSON e di un NDJSON gzip, e
+verifica che rileggendo l'NDJSON si ottengano gli stessi payload. Per l'invio
+confronta una POST per payload con le POST batch (con e senza gzip, anche
+con errori 503 per elemento) e verifica che ogni esito torni al suo file:
+lo ``idDomanda`` nella risposta è quello del payload inviato con quel nome.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+REST_DIR = ROOT / "criteria_json_restAPI"
+sys.path.insert(0, str(REST_DIR))
+
+import crieteria_json_rest as rest  # noqa: E402
+import stub_server  # noqa: E402
+from ndjson_output import NdjsonWriter, iter_records  # noqa: E402
+from submitter import Submitter  # noqa: E402
+from template_engine import CompiledTemplate  # noqa: E402
+
+
+def make_payloads(n: int):
+    template = CompiledTemplate(rest.load_template(REST_DIR / "template.json"))
+    sources = [rest.process_excel(path, template, verbose=False) for path in sorted((REST_DIR / "excel").glob("*.xlsx"))]
+    payloads = []
+    for i in range(n):
+        payload = dict(sources[i % len(sources)], idDomanda=f"{i:09d}")
+        payloads.append((f"domanda_{i:05d}.xlsx", payload))
+    return template, payloads
+
+
+def write_outputs(template: CompiledTemplate, payloads, tmp: Path) -> int:
+    failures = 0
+    t0 = time.perf_counter()
+    per_file = tmp / "json"
+    per_file.mkdir()
+    for name, payload in payloads:
+        (per_file / f"{Path(name).stem}.json").write_text(template.dumps(payload), encoding="utf-8")
+    t_files = time.perf_counter() - t0
+    size_files = sum(p.stat().st_size for p in per_file.iterdir())
+    print(f"un JSON indent=4 per domanda {t_files:6.2f}s  {len(payloads):>6,} file  {size_files / 1e6:7.1f} MB")
+
+    for label, path in (("NDJSON", tmp / "payloads.ndjson"), ("NDJSON gzip", tmp / "payloads.ndjson.gz")):
+        t0 = time.perf_counter()
+        with NdjsonWriter(path) as writer:
+            for name, payload in payloads:
+                writer.write(name, payload["idDomanda"], template.dumps(payload, compact=True))
+        elapsed = time.perf_counter() - t0
+        records = list(iter_records(path))
+        same = [(r["file"], r["payload"]) for r in records] == [(n, json.loads(json.dumps(p))) for n, p in payloads]
+        failures += not same
+        print(f"{label:<28} {elapsed:6.2f}s  {1:>6,} file  {path.stat().st_size / 1e6:7.1f} MB  "
+              f"riletti {'identici' if same else 'DIVERSI'}")
+    return failures
+
+
+def submit(endpoint: str, payloads, **options):
+    with contextlib.redirect_stdout(io.StringIO()):  # Submitter stampa una riga per invio
+        t0 = time.perf_counter()
+        with Submitter(endpoint, "bench", backoff=0.05, **options) as sub:
+            for name, payload in payloads:
+                sub.submit(name, payload)
+        return sub.results, time.perf_counter() - t0
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--payloads", type=int, default=2000)
+    p.add_argument("--batch-size", type=int, default=50)
+    p.add_argument("--concurrency", type=int, default=4)
+    p.add_argument("--latency", type=float, default=0.02, help="Latenza dello stub per richiesta")
+    p.add_argument("--item-fail-rate", type=float, default=0.1, help="503 per elemento nell'ultima prova")
+    args = p.parse_args()
+
+    template, payloads = make_payloads(args.payloads)
+    ids = {name: payload["idDomanda"] for name, payload in payloads}
+    with tempfile.TemporaryDirectory() as tmp:
+        failures = write_outputs(template, payloads, Path(tmp))
+
+    print()
+    runs = [("una POST per domanda", 0.0, {}),
+            (f"batch da {args.batch_size}", 0.0, {"batch_size": args.batch_size}),
+            (f"batch da {args.batch_size} gzip", 0.0, {"batch_size": args.batch_size, "gzip": True}),
+            (f"batch gzip, 503 al {args.item_fail_rate:.0%}", args.item_fail_rate,
+             {"batch_size": args.batch_size, "gzip": True, "retries": 6})]
+    reference = None
+    for label, item_fail_rate, options in runs:
+        config = stub_server.StubConfig(latency=args.latency, seed=0, item_fail_rate=item_fail_rate)
+        server = stub_server.serve(config=config)
+        endpoint = f"http://127.0.0.1:{server.server_port}/v1/core/evaluate"
+        results, elapsed = submit(endpoint, payloads, concurrency=args.concurrency, **options)
+        server.shutdown()
+        ok = sum(r.ok for r in results)
+        mapped = all(r.ok and json.loads(r.detail)["idDomanda"] == ids[r.name] for r in results)
+        mapped = mapped and sorted(r.name for r in results) == sorted(ids)
+        failures += not mapped
+        stats = config.stats
+        print(f"{label:<28} {elapsed:6.2f}s  {stats['requests']:>5,} richieste  {stats['bytes'] / 1e6:7.1f} MB inviati  "
+              f"{ok:,}/{len(payloads):,} ok  esiti {'ai propri file' if mapped else 'ERRATI'}"
+              + (f"  ({stats['item_503']} elementi 503 rinviati)" if item_fail_rate else ""))
+        if reference is None:
+            reference = elapsed, stats["bytes"]
+        else:
+            print(f"{'':<28} x{reference[0] / elapsed:.1f} più veloce, {stats['bytes'] / reference[1]:.0%} dei byte")
+
+    if failures:
+        sys.exit(f"[ERRORE] {failures} verifiche fallite")
+
+
+if __name__ == "__main__":
+    main()
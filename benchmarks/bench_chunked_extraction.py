@@ -0,0 +1,76 @@
+"""Tempo di estrazione criteri: chiamata singola contro modalità a blocchi, sul mock OpenAI locale.
+
+    python -m benchmarks.bench_chunked_extraction --pages 200 --token-latency 0.002
+
+Il mock simula la generazione sequenziale (latenza per token di output) e il
+limite di contesto, quindi su documenti lunghi la chiamata singola fallisce o
+è lenta quanto l'intera risposta, mentre i blocchi procedono in parallelo.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "criteria_extractor_ai"))
+
+import openai  # noqa: E402
+
+import extractor_core as core  # noqa: E402
+from besidetech_common import mock_openai  # noqa: E402
+
+
+def make_bando(pages: int, criteria_per_page: int = 3, seed: int = 0) -> str:
+    rnd = random.Random(seed)
+    words = "domanda contributo impresa investimento requisito punteggio progetto sede spesa".split()
+    out = []
+    for p in range(pages):
+        paragraphs = [f"Pagina {p + 1}"]
+        for i in range(criteria_per_page):
+            body = " ".join(rnd.choice(words) for _ in range(60))
+            paragraphs.append(f"CRITERIO {chr(65 + p % 26)}{p // 26 + 1}.{i + 1} - {body}")
+            paragraphs.append(" ".join(rnd.choice(words) for _ in range(120)))
+        out.append("\n\n".join(paragraphs))
+    return "\f".join(out)
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--pages", type=int, default=120)
+    p.add_argument("--latency", type=float, default=0.2)
+    p.add_argument("--token-latency", type=float, default=0.002)
+    p.add_argument("--context-limit", type=int, default=128_000)
+    p.add_argument("--chunk-tokens", type=int, default=6000)
+    p.add_argument("--workers", type=int, default=8)
+    args = p.parse_args()
+
+    server = mock_openai.serve(config=mock_openai.MockConfig(args.latency, args.token_latency, args.context_limit))
+    client = openai.OpenAI(api_key="mock", base_url=f"http://127.0.0.1:{server.server_port}/v1", max_retries=0)
+    text = make_bando(args.pages)
+    expected = text.count("CRITERIO ")
+    print(f"Documento: {args.pages} pagine, {len(text)} caratteri, ~{core.estimate_tokens(text)} token, {expected} criteri")
+
+    t0 = time.perf_counter()
+    try:
+        single, _ = core.request_criteria(client.chat.completions.create, core.build_user_prompt(text))
+        print(f"Chiamata singola: {len(single)} criteri in {time.perf_counter() - t0:.2f}s")
+    except openai.APIError as exc:
+        single = []
+        print(f"Chiamata singola: FALLITA dopo {time.perf_counter() - t0:.2f}s ({exc.code or exc})")
+    single_elapsed = time.perf_counter() - t0
+
+    result = core.extract_criteria_chunked(
+        client.chat.completions.create, text, max_chunk_tokens=args.chunk_tokens, workers=args.workers
+    )
+    print(f"A blocchi:        {len(result.criteria)} criteri in {result.elapsed:.2f}s "
+          f"({result.chunks} blocchi, {args.workers} in parallelo, {len(result.errors)} errori)")
+    if single:
+        print(f"Speedup: x{single_elapsed / result.elapsed:.2f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
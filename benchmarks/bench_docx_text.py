@@ -0,0 +1,164 @@
+"""Testo dei documenti Word: modello python-docx (versione precedente) contro lettura in streaming di ``document.xml``.
+
+    python -m benchmarks.bench_docx_text --paragraphs 1000 --table-every 8
+
+Genera documenti sintetici (titoli, paragrafi e tabelle di budget con celle
+unite in orizzontale e in verticale nel corpo) di ``--paragraphs`` paragrafi
+(circa 5 per pagina) e di quattro volte tanti, e misura ogni percorso in un
+processo separato: tempo e picco di memoria residente (RSS) oltre quella del
+processo dopo gli import. Verifica che il testo in streaming coincida con
+quello ricostruito da python-docx nell'ordine del corpo, con le celle unite
+una volta sola, e che una tabella annidata resti nella cella che la contiene.
+"""
+from __future__ import annotations
+
+import argparse
+import importlib
+import io
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from besidetech_common.docx_text import extract_docx_text  # noqa: E402
+
+from benchmarks.synthetic import make_docx  # noqa: E402
+
+
+def legacy_parse_docx(data: bytes) -> str:
+    """``parse_docx`` com'era prima di ``docx_text``."""
+    import docx
+
+    doc = docx.Document(io.BytesIO(data))
+    text = ""
+    for para in doc.paragraphs:
+        text += para.text + "\n"
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                text += cell.text + "\t"
+            text += "\n"
+    return text
+
+
+def reference_text(data: bytes) -> str:
+    """Testo atteso costruito con python-docx: blocchi nell'ordine del corpo, celle unite una volta."""
+    import docx
+    from docx.table import Table
+
+    lines = []
+    for block in docx.Document(io.BytesIO(data)).iter_inner_content():
+        if isinstance(block, Table):
+            seen = set()  # elementi w:tc (tenuti vivi: l'identità dei proxy lxml resta stabile)
+            for row in block.rows:
+                cells, in_row = [], set()
+                for cell in row.cells:
+                    if cell._tc in in_row:  # gridSpan: stessa cella ripetuta nella riga
+                        continue
+                    in_row.add(cell._tc)
+                    cells.append("" if cell._tc in seen else " ".join(cell.text.split()))
+                seen |= in_row
+                if any(cells):
+                    lines.append("\t".join(cells).rstrip("\t"))
+            continue
+        text = block.text.strip()
+        name = block.style.name if block.style is not None else ""
+        if text and name.startswith("Heading ") and name[8:].isdigit():
+            text = f"{'#' * int(name[8:])} {text}"
+        if text:
+            lines.append(text)
+    return "\n".join(lines)
+
+
+def nested_table_docx() -> bytes:
+    import docx
+
+    document = docx.Document()
+    outer = document.add_table(rows=1, cols=2)
+    outer.cell(0, 0).text = "Esterna"
+    inner = outer.cell(0, 1).add_table(rows=1, cols=2)
+    inner.cell(0, 0).text = "interna 1"
+    inner.cell(0, 1).text = "interna 2"
+    document.add_paragraph("Dopo la tabella")
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+def _rss_mb() -> float:
+    # VmHWM riparte da zero con exec; ru_maxrss no, e il genitore che ha generato i documenti è più grande
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux: KB
+
+
+def child(mode: str, path: str) -> None:
+    importlib.import_module("docx")  # entrambi i percorsi partono con gli import già fatti
+    data = Path(path).read_bytes()
+    base = _rss_mb()
+    t0 = time.perf_counter()
+    text = legacy_parse_docx(data) if mode == "legacy" else extract_docx_text(data, headings=True)
+    elapsed = time.perf_counter() - t0
+    print(json.dumps({"elapsed": elapsed, "rss_peak": _rss_mb() - base, "chars": len(text)}))
+
+
+def measure(mode: str, path: Path) -> dict:
+    out = subprocess.run([sys.executable, "-m", "benchmarks.bench_docx_text", "--child", mode, str(path)],
+                         cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--paragraphs", type=int, default=1000, help="Paragrafi del documento (circa 5 per pagina)")
+    p.add_argument("--table-every", type=int, default=8, help="Una tabella di budget ogni N paragrafi")
+    p.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = p.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    failures = 0
+    for label, data in (("piccolo", make_docx(60, 5, seed=1, table_every=7)),
+                        ("solo paragrafi", make_docx(40, seed=2))):
+        same = extract_docx_text(data, headings=True) == reference_text(data)
+        failures += not same
+        print(f"{label:<20} {'identico' if same else 'DIVERSO'} al testo python-docx nell'ordine del corpo")
+    nested = extract_docx_text(nested_table_docx())
+    ok = nested == "Esterna\tinterna 1 interna 2\nDopo la tabella"
+    failures += not ok
+    print(f"{'tabella annidata':<20} {'nella cella esterna' if ok else 'ERRATA: ' + repr(nested)}")
+
+    runs = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in (1, 4):
+            paragraphs = args.paragraphs * scale
+            t0 = time.perf_counter()
+            data = make_docx(paragraphs, seed=scale, table_every=args.table_every)
+            path = Path(tmp) / f"relazione_{scale}.docx"
+            path.write_bytes(data)
+            print(f"\n{paragraphs:,} paragrafi (~{paragraphs // 5} pagine), {paragraphs // args.table_every} tabelle, "
+                  f"{len(data) / 1e6:.1f} MB (generato in {time.perf_counter() - t0:.0f}s)")
+            for mode, label in (("legacy", "python-docx"), ("stream", "streaming")):
+                r = runs[mode, scale] = measure(mode, path)
+                print(f"{label:<12} {r['elapsed']:7.2f}s  picco RSS +{r['rss_peak']:6.0f} MB  {r['chars']:>10,} caratteri")
+            legacy, stream = runs["legacy", scale], runs["stream", scale]
+            print(f"streaming: x{legacy['elapsed'] / stream['elapsed']:.1f} più veloce")
+
+    print(f"\npicco RSS da x1 a x4: python-docx +{runs['legacy', 1]['rss_peak']:.0f} → +{runs['legacy', 4]['rss_peak']:.0f} MB, "
+          f"streaming +{runs['stream', 1]['rss_peak']:.0f} → +{runs['stream', 4]['rss_peak']:.0f} MB")
+    if failures:
+        sys.exit(f"[ERRORE] {failures} verifiche fallite")
+
+
+if __name__ == "__main__":
+    main()
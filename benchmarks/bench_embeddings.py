@@ -0,0 +1,131 @@
+"""Store degli embedding: documento incorporato una volta, più insiemi di criteri, sul mock OpenAI locale.
+
+    python -m benchmarks.bench_embeddings --pages 200 --criteria-sets 3 --criteria 20
+
+Per un documento sintetico misura la prima costruzione dell'indice (passaggi
+inviati all'API embeddings e salvati) e le successive (matrice riletta con
+``np.memmap``), poi confronta per ogni insieme di criteri le richieste
+embeddings e i token di prompt con il documento intero. Verifica che i
+vettori riletti coincidano con quelli calcolati, che il formato ``base64``
+(default del client) e ``float`` diano gli stessi vettori e che il top-k con
+``prepare`` (un prodotto matrice) coincida con quello query per query.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "criteria_matching_ai"))
+
+import openai  # noqa: E402
+
+import retrieval  # noqa: E402
+from besidetech_common import mock_openai  # noqa: E402
+from besidetech_common.embedding_store import EmbeddingStore, embed_texts  # noqa: E402
+
+from benchmarks.bench_retrieval_matching import TOPICS, make_document  # noqa: E402
+
+
+def make_criteria_set(n: int, offset: int):
+    return [{"criterio_id": f"S{offset}C{i + 1}",
+             "descrizione_guida": f"Illustrare {TOPICS[(i + offset) % len(TOPICS)]} previsti"} for i in range(n)]
+
+
+def on_topic(index, criteria, k: int) -> float:
+    """Quota dei top-k passaggi che stanno su una pagina dell'argomento del criterio."""
+    hits = total = 0
+    for criterion in criteria:
+        topic = next(i for i, t in enumerate(TOPICS) if t in criterion["descrizione_guida"])
+        for passage, _ in index.top_k(retrieval.criterion_query(criterion), k):
+            total += 1
+            hits += (passage.page - 1) % len(TOPICS) == topic
+    return hits / total if total else 0.0
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--pages", type=int, default=200)
+    p.add_argument("--criteria-sets", type=int, default=3)
+    p.add_argument("--criteria", type=int, default=20)
+    p.add_argument("--top-k", type=int, default=4)
+    p.add_argument("--latency", type=float, default=0.05)
+    args = p.parse_args()
+
+    config = mock_openai.MockConfig(args.latency, 0.0, context_limit=10**9)
+    server = mock_openai.serve(config=config)
+    client = openai.OpenAI(api_key="mock", base_url=f"http://127.0.0.1:{server.server_port}/v1", max_retries=0)
+    text = make_document(args.pages)
+    failures = 0
+
+    def embedding_requests() -> int:
+        with config.lock:
+            return config.stats.get("embedding_requests", 0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EmbeddingStore(Path(tmp))
+        t0 = time.perf_counter()
+        cold, reused = retrieval.build_embedding_index(client.embeddings.create, text, store=store)
+        t_cold = time.perf_counter() - t0
+        cold_requests = embedding_requests()
+        t0 = time.perf_counter()
+        warm, reused_warm = retrieval.build_embedding_index(client.embeddings.create, text, store=store)
+        t_warm = time.perf_counter() - t0
+        print(f"Documento {len(text):,} caratteri, {len(cold.passages)} passaggi, "
+              f"{store.stats()['bytes'] / 1024:.0f} KB di vettori")
+        print(f"prima costruzione {t_cold * 1000:8.1f} ms ({cold_requests} richieste embeddings)  "
+              f"riuso {t_warm * 1000:6.1f} ms ({embedding_requests() - cold_requests} richieste, memmap={isinstance(warm.vectors, np.memmap)})")
+        if reused or not reused_warm or not np.array_equal(np.asarray(cold.vectors), np.asarray(warm.vectors)):
+            failures += 1
+            print("[ERRORE] vettori riletti diversi da quelli calcolati")
+
+        sample = [p.text for p in cold.passages[:50]]
+        as_float = embed_texts(lambda **kw: client.embeddings.create(encoding_format="float", **kw), sample)
+        if not np.allclose(as_float, embed_texts(client.embeddings.create, sample), atol=1e-6):
+            failures += 1
+            print("[ERRORE] base64 e float danno vettori diversi")
+
+        bm25 = retrieval.BM25Index(cold.passages)
+        for n in range(args.criteria_sets):
+            criteria = make_criteria_set(args.criteria, n)
+            before = embedding_requests()
+            index, _ = retrieval.build_embedding_index(client.embeddings.create, text, store=store)
+            t0 = time.perf_counter()
+            result = retrieval.match_with_retrieval(client.chat.completions.create, criteria, text, index=index,
+                                                    top_k=args.top_k)
+            elapsed = time.perf_counter() - t0
+            print(f"insieme {n + 1}: {len(result.results)}/{len(criteria)} risposte in {elapsed:.2f}s, "
+                  f"{embedding_requests() - before} richieste embeddings, token di prompt {result.prompt_tokens_sent:,} "
+                  f"invece di {result.prompt_tokens_full:,}; passaggi sull'argomento: embeddings "
+                  f"{on_topic(index, criteria, args.top_k):.0%}, BM25 {on_topic(bm25, criteria, args.top_k):.0%}")
+            if len(result.results) != len(criteria) or result.errors:
+                failures += 1
+
+        queries = [retrieval.criterion_query(c) for n in range(args.criteria_sets)
+                   for c in make_criteria_set(args.criteria, n)]
+        looped, _ = retrieval.build_embedding_index(client.embeddings.create, text, store=store)
+        t0 = time.perf_counter()
+        one_by_one = [looped.top_k(q, args.top_k) for q in queries]
+        t_loop = time.perf_counter() - t0
+        batched, _ = retrieval.build_embedding_index(client.embeddings.create, text, store=store)
+        t0 = time.perf_counter()
+        batched.prepare(queries)
+        together = [batched.top_k(q, args.top_k) for q in queries]
+        t_batch = time.perf_counter() - t0
+        same = [[p.index for p, _ in hits] for hits in one_by_one] == [[p.index for p, _ in hits] for hits in together]
+        failures += not same
+        print(f"top-k di {len(queries)} criteri: query per query (una richiesta ciascuna) {t_loop * 1000:7.1f} ms, "
+              f"con prepare {t_batch * 1000:6.1f} ms (x{t_loop / t_batch:4.1f})  {'identico' if same else 'DIVERSO'}")
+
+    server.shutdown()
+    if failures:
+        sys.exit(f"[ERRORE] {failures} verifiche fallite")
+
+
+if __name__ == "__main__":
+    main()
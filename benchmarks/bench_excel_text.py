@@ -0,0 +1,135 @@
+"""Testo dei workbook Excel: DataFrame per foglio (versione precedente) contro lettura in streaming.
+
+    python -m benchmarks.bench_excel_text --rows 40000 --columns 60 --sheets 3
+
+Genera un piano finanziario sintetico (largo, sparso, con righe vuote) e
+misura ogni percorso in un processo separato: tempo, picco di memoria
+residente (RSS) oltre quella del processo dopo gli import, caratteri del
+testo e token "nan". Su un workbook piccolo e sui formulari della repository
+verifica che le celle non vuote lette coincidano.
+"""
+from __future__ import annotations
+
+import argparse
+import importlib
+import io
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from besidetech_common.excel_text import cell_text, extract_excel_text  # noqa: E402
+
+from benchmarks.synthetic import make_financial_plan  # noqa: E402
+
+
+def legacy_parse_excel(data: bytes) -> str:
+    """``parse_excel`` com'era prima di ``excel_text``."""
+    import pandas as pd
+
+    xls = pd.ExcelFile(io.BytesIO(data))
+    text = ""
+    for sheet_name in xls.sheet_names:
+        df = xls.parse(sheet_name, header=None)
+        for col in df.columns:
+            text += df[col].astype(str).str.cat(sep=' ') + " "
+        text += "\n"
+    return text.strip()
+
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux: KB
+
+
+def child(mode: str, path: str, max_rows: int, max_cells: int) -> None:
+    for module in ("openpyxl", "pandas"):  # entrambi i percorsi partono con gli import già fatti
+        importlib.import_module(module)
+
+    data = Path(path).read_bytes()
+    base = _rss_mb()
+    t0 = time.perf_counter()
+    if mode == "legacy":
+        text = legacy_parse_excel(data)
+    else:
+        text = extract_excel_text(data, max_rows or None, max_cells or None).text
+    elapsed = time.perf_counter() - t0
+    print(json.dumps({"elapsed": elapsed, "rss_peak": _rss_mb() - base, "chars": len(text),
+                      "nan": text.count("nan")}))
+
+
+def measure(mode: str, path: Path, max_rows: int = 0, max_cells: int = 0) -> dict:
+    out = subprocess.run([sys.executable, "-m", "benchmarks.bench_excel_text", "--child", mode, str(path),
+                          "--max-rows", str(max_rows), "--max-cells", str(max_cells)],
+                         cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def legacy_cells(data: bytes) -> list:
+    import pandas as pd
+
+    xls = pd.ExcelFile(io.BytesIO(data))
+    cells = []
+    for sheet_name in xls.sheet_names:
+        df = xls.parse(sheet_name, header=None)
+        for row in df.itertuples(index=False):
+            cells += [t for t in map(cell_text, (v.to_pydatetime() if hasattr(v, "to_pydatetime") else v for v in row))
+                      if t is not None]
+    return cells
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--rows", type=int, default=40_000, help="Righe per foglio")
+    p.add_argument("--columns", type=int, default=60)
+    p.add_argument("--sheets", type=int, default=3)
+    p.add_argument("--max-rows", type=int, default=0, help="Limite di righe per foglio (0 = nessuno)")
+    p.add_argument("--max-cells", type=int, default=0, help="Limite di celle per foglio (0 = nessuno)")
+    p.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = p.parse_args()
+    if args.child:
+        child(args.child[0], args.child[1], args.max_rows, args.max_cells)
+        return
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        # Stesse celle non vuote, nello stesso ordine (per riga), dei DataFrame
+        small = [make_financial_plan(Path(tmp) / "piccolo.xlsx", 300, 12, 2, seed=1)]
+        small += sorted((ROOT / "criteria_json_restAPI" / "excel").glob("*.xlsx"))[:3]
+        for path in small:
+            data = path.read_bytes()
+            new = [c for line in extract_excel_text(data, None, None).text.splitlines()
+                   if not line.startswith("[Foglio: ") for c in line.split("\t") if line]
+            old = legacy_cells(data)
+            same = new == [" ".join(c.split()) for c in old]
+            failures += not same
+            print(f"{path.name[:50]:<50} {len(new):>7,} celle  {'identiche' if same else 'DIVERSE'}")
+
+        t0 = time.perf_counter()
+        path = make_financial_plan(Path(tmp) / "piano.xlsx", args.rows, args.columns, args.sheets)
+        size = path.stat().st_size
+        print(f"\nPiano finanziario: {args.sheets} fogli × {args.rows:,} righe × {args.columns} colonne, "
+              f"{size / 1e6:.1f} MB (generato in {time.perf_counter() - t0:.0f}s)")
+        runs = [("DataFrame per foglio", measure("legacy", path)),
+                ("streaming", measure("stream", path))]
+        if args.max_rows or args.max_cells:
+            runs.append(("streaming con limiti", measure("stream", path, args.max_rows, args.max_cells)))
+        for label, r in runs:
+            print(f"{label:<22} {r['elapsed']:7.2f}s  picco RSS +{r['rss_peak']:7.0f} MB  "
+                  f"{r['chars'] / 1e6:6.1f} M caratteri  {r['nan']:>9,} 'nan'")
+        legacy, stream = runs[0][1], runs[1][1]
+        print(f"streaming: x{legacy['elapsed'] / stream['elapsed']:.1f} più veloce, "
+              f"picco RSS {stream['rss_peak'] / max(legacy['rss_peak'], 1):.0%} del precedente")
+
+    if failures:
+        sys.exit(f"[ERRORE] {failures} workbook con celle diverse")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Estrattori dei fogli del formulario: versione precedente, attuale e variante pandas vettoriale.
+
+    python -m benchmarks.bench_extractors --criteria 200 --lines 500
+
+I fogli sintetici "proposta" hanno ``--criteria`` sezioni da ``--lines`` righe
+(testo, celle vuote/NaN, numeri, codici ripetuti e intestazioni minuscole); il
+foglio dei criteri di valutazione ha un codice di gruppo ogni tre righe. Il
+risultato delle tre implementazioni deve coincidere, anche sui formulari della
+repository. La variante pandas (``str.extract``, maschere, ``groupby`` sul
+numero di sezione) è misurata compresa la costruzione del DataFrame dalle righe.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+REST_DIR = ROOT / "criteria_json_restAPI"
+sys.path.insert(0, str(REST_DIR))
+
+import crieteria_json_rest as rest  # noqa: E402
+
+Row = Tuple[Any, Any]
+NAN = float("nan")
+
+
+# ---------------------------------------------------------------------------
+# Versione precedente, copiata invariata come riferimento
+
+def legacy_extract_testo(rows) -> Dict[str, str]:
+    testi: Dict[str, str] = {}
+    current = None
+    rx = re.compile(r"(?i)^criterio\s+([A-Z]\d(?:\.\d)?)")
+    for raw, _ in rows:
+        line = str(raw).strip()
+        m = rx.match(line)
+        if m:
+            current = m.group(1).upper()
+            testi[current] = ""
+        elif current:
+            testi[current] = (testi[current] + " " + line).strip()
+    return testi
+
+
+def legacy_extract_descr(rows) -> Dict[str, str]:
+    descr: Dict[str, str] = {}
+    for key, value in rows:
+        k_raw = str(key).strip()
+        if re.fullmatch(r"[A-Z]\d{1,2}", k_raw):
+            descr[k_raw.upper()] = str(value).strip()
+    return descr
+
+
+# ---------------------------------------------------------------------------
+# Variante pandas vettoriale
+
+def pandas_extract_testo(rows) -> Dict[str, str]:
+    import pandas as pd
+
+    lines = pd.Series([a for a, _ in rows], dtype=object).astype(str).str.strip()
+    codes = lines.str.extract(rest.RE_CRITERIO.pattern, expand=False).str.upper()
+    heads = codes.notna()
+    section = heads.cumsum()
+    body = lines[~heads & (section > 0) & (lines != "")]
+    joined = body.groupby(section[body.index]).agg(" ".join)
+    out: Dict[str, str] = {}
+    for number, code in zip(section[heads], codes[heads]):
+        out[code] = joined.get(number, "")
+    return out
+
+
+def pandas_extract_descr(rows) -> Dict[str, str]:
+    import pandas as pd
+
+    df = pd.DataFrame(rows, columns=["key", "value"], dtype=object)
+    keys = df["key"].astype(str).str.strip()
+    mask = keys.str.fullmatch(rest.RE_GRUPPO.pattern)
+    values = df.loc[mask, "value"].astype(str).str.strip()
+    return dict(zip(keys[mask].str.upper(), values))
+
+
+# ---------------------------------------------------------------------------
+
+WORDS = "progetto impresa intervento sostenibilità innovazione territorio qualità energia".split()
+
+
+def make_proposta(criteria: int, lines: int, seed: int = 0) -> List[Row]:
+    rnd = random.Random(seed)
+    rows: List[Row] = [("2.   Presentazione della proposta progettuale", NAN), ("testo prima del primo criterio", NAN)]
+    for i in range(criteria):
+        code = f"{'ABCD'[i % 4]}{i // 4 % 9 + 1}.{i % 3 + 1}"
+        if i % 17 == 0:  # codice già visto: la sezione precedente viene sostituita
+            code = "A1.1"
+        header = f"CRITERIO {code} (fornire informazioni utili)"
+        rows.append((header.lower() if i % 5 == 0 else header, NAN))
+        for j in range(lines):
+            roll = rnd.random()
+            if roll < 0.2:
+                rows.append((NAN, NAN))
+            elif roll < 0.25:
+                rows.append((rnd.randint(0, 100), 1.5))
+            elif roll < 0.27:
+                rows.append(("   ", NAN))
+            else:
+                rows.append((" " + " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(3, 40))) + " ", NAN))
+    return rows
+
+
+def make_criteri(groups: int, seed: int = 0) -> List[Row]:
+    rnd = random.Random(seed)
+    rows: List[Row] = [(NAN, NAN), ("Criteri di valutazione", "Parametro")]
+    for i in range(groups):
+        rows.append((f"{'ABCD'[i % 4]}{i % 99 + 1}", " ".join(rnd.choice(WORDS) for _ in range(12))))
+        rows.append((0.5 + i, NAN))
+        rows.append(("a1" if i % 7 == 0 else "note", "x"))
+    return rows
+
+
+def _best(fn: Callable[[], Any], repeat: int) -> Tuple[float, Any]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--criteria", type=int, default=200)
+    p.add_argument("--lines", type=int, default=500, help="Righe per sezione del foglio proposta")
+    p.add_argument("--groups", type=int, default=30_000, help="Codici nel foglio dei criteri di valutazione")
+    p.add_argument("--repeat", type=int, default=3)
+    args = p.parse_args()
+
+    mismatches = 0
+    # Parità sui formulari reali
+    from openpyxl import load_workbook
+
+    for xlsx in sorted((REST_DIR / "excel").glob("*.xls*")):
+        wb = load_workbook(xlsx, read_only=True, data_only=True)
+        prop = rest.read_sheet_rows(wb[rest.find_sheet(wb.sheetnames, ["proposta", "criter"], 1)])
+        crit = rest.read_sheet_rows(wb[rest.find_sheet(wb.sheetnames, ["criter", "valut"], -1)])
+        wb.close()
+        same = (legacy_extract_testo(prop) == rest.extract_testo(prop) == pandas_extract_testo(prop)
+                and legacy_extract_descr(crit) == rest.extract_descr(crit) == pandas_extract_descr(crit))
+        mismatches += not same
+        print(f"{xlsx.name[:60]:<60} {'identico' if same else 'DIVERSO'}")
+
+    proposta = make_proposta(args.criteria, args.lines)
+    criteri = make_criteri(args.groups)
+    print(f"\nFoglio proposta: {len(proposta):,} righe, {args.criteria} sezioni; foglio criteri: {len(criteri):,} righe")
+
+    for name, rows, impls in (
+        ("extract_testo", proposta, (legacy_extract_testo, rest.extract_testo, pandas_extract_testo)),
+        ("extract_descr", criteri, (legacy_extract_descr, rest.extract_descr, pandas_extract_descr)),
+    ):
+        (t_old, old), (t_new, new), (t_pd, vec) = (_best(lambda f=f: f(rows), args.repeat) for f in impls)
+        same = old == new == vec and list(old) == list(new) == list(vec)
+        mismatches += not same
+        print(f"{name:<14} precedente {t_old * 1000:8.1f} ms  attuale {t_new * 1000:8.1f} ms (x{t_old / t_new:5.1f})  "
+              f"pandas {t_pd * 1000:8.1f} ms  {'identico' if same else 'DIVERSO'}")
+
+    if mismatches:
+        sys.exit(f"[ERRORE] {mismatches} confronti con risultati diversi")
+
+
+if __name__ == "__main__":
+    main()
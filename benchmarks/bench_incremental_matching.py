@@ -0,0 +1,99 @@
+"""Matching incrementale: una ``descrizione_guida`` modificata, tutti i criteri rinviati contro solo quello, sul mock OpenAI locale.
+
+    python -m benchmarks.bench_incremental_matching --pages 60 --criteria 30
+
+Per documento intero e retrieval BM25: prima analisi (tutti i criteri),
+poi la stessa analisi con un criterio modificato, senza ``result_cache``
+(come prima: il prompt cambia e tutto viene ripagato) e con. Conta richieste
+e token del mock e verifica che le risposte tornino nell'ordine dei criteri,
+che sia riutilizzato tutto tranne il criterio modificato e che, a documento
+intero, le risposte coincidano con quelle dell'analisi completa.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "criteria_matching_ai"))
+
+import openai  # noqa: E402
+
+import matcher_core as core  # noqa: E402
+import retrieval  # noqa: E402
+from besidetech_common import mock_openai  # noqa: E402
+from result_cache import match_incremental, match_variant, open_result_cache  # noqa: E402
+
+from benchmarks.bench_retrieval_matching import make_criteria, make_document  # noqa: E402
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--pages", type=int, default=60)
+    p.add_argument("--criteria", type=int, default=30)
+    p.add_argument("--latency", type=float, default=0.3)
+    p.add_argument("--token-latency", type=float, default=0.001)
+    p.add_argument("--answer-tokens", type=int, default=250)
+    args = p.parse_args()
+
+    config = mock_openai.MockConfig(args.latency, args.token_latency, context_limit=10**9, answer_tokens=args.answer_tokens)
+    server = mock_openai.serve(config=config)
+    client = openai.OpenAI(api_key="mock", base_url=f"http://127.0.0.1:{server.server_port}/v1", max_retries=0)
+    create = client.chat.completions.create
+    text = make_document(args.pages)
+    criteria = make_criteria(args.criteria)
+    edited = [dict(c) for c in criteria]
+    changed = len(edited) // 2
+    edited[changed]["descrizione_guida"] += " indicando anche i tempi di realizzazione"
+    print(f"Documento {len(text):,} caratteri, {len(criteria)} criteri, modificato {edited[changed]['criterio_id']}")
+
+    def whole(missing):
+        return core.request_matches(create, core.build_user_prompt(missing, text))[0]
+
+    def bm25(missing):
+        return retrieval.match_with_retrieval(create, missing, text, top_k=4, group_size=5, workers=4).results
+
+    def counters():
+        with config.lock:
+            return dict(config.stats)
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = open_result_cache(Path(tmp) / "match_results.sqlite3")
+        for label, match, variant in (("documento intero", whole, match_variant()),
+                                      ("retrieval BM25", bm25, match_variant(retrieval=True))):
+            print(f"\n{label}")
+            first = match_incremental(criteria, text, match, cache, variant)
+            for run_label, run_cache in (("modificato, senza result_cache", None), ("modificato, con result_cache", cache)):
+                before = counters()
+                t0 = time.perf_counter()
+                outcome = match_incremental(edited, text, match, run_cache, variant)
+                elapsed = time.perf_counter() - t0
+                after = counters()
+                print(f"{run_label:<32} {elapsed:6.2f}s  {after['requests'] - before['requests']:>3} richieste  "
+                      f"{after['prompt_tokens'] - before['prompt_tokens']:>9,} token di prompt  "
+                      f"{after['completion_tokens'] - before['completion_tokens']:>7,} di risposta  "
+                      f"{outcome.reused_count:>3} riutilizzate")
+                if run_cache is None:
+                    full = outcome
+
+            ids = [r["criterio_id"] for r in outcome.results]
+            ok = (ids == [c["criterio_id"] for c in edited] and outcome.sent == 1
+                  and outcome.reused == [i != changed for i in range(len(edited))]
+                  and outcome.results[changed]["descrizione_guida"] == edited[changed]["descrizione_guida"]
+                  and len(first.results) == len(criteria))
+            if match is whole:
+                ok = ok and outcome.results == full.results
+            failures += not ok
+            print(f"ordine, riuso e risposte {'corretti' if ok else 'ERRATI'}")
+
+    server.shutdown()
+    if failures:
+        sys.exit(f"[ERRORE] {failures} verifiche fallite")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Estrazione da più file: un file alla volta contro ``extract_files`` asincrono, sul mock OpenAI locale.
+
+    python -m benchmarks.bench_multi_file_extraction --files 12 --pages 10 --concurrency 8
+
+Il caso è quello di una domanda con bando, allegati e FAQ: ``--files`` testi
+sintetici, uno lungo (``--long-pages``) e gli altri di ``--pages`` pagine, con
+codici di criterio in parte ripetuti tra i file. Il riferimento è il flusso
+dell'app con un file: ogni file letto e poi inviato (a blocchi, in parallelo
+al suo interno) prima di passare al successivo. Viene misurata anche la
+lettura dei PDF in sequenza contro il pool di thread, e si verifica che i
+criteri uniti coincidano con quelli del riferimento e che ``fonti`` elenchi
+esattamente i file in cui ogni codice compare.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Set
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "criteria_extractor_ai"))
+
+import openai  # noqa: E402
+
+import extractor_core as core  # noqa: E402
+from besidetech_common import mock_openai  # noqa: E402
+from besidetech_common.ingestion import ingest  # noqa: E402
+
+from benchmarks.bench_chunked_extraction import make_bando  # noqa: E402
+from benchmarks.synthetic import make_pdf  # noqa: E402
+
+
+def expected_sources(documents) -> Dict[str, Set[str]]:
+    sources: Dict[str, Set[str]] = {}
+    for name, text in documents:
+        for code in re.findall(r"^CRITERIO (\S+)", text, re.MULTILINE):
+            sources.setdefault(code.upper(), set()).add(name)
+    return sources
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--files", type=int, default=12)
+    p.add_argument("--pages", type=int, default=10, help="Pagine dei file brevi (allegati, FAQ)")
+    p.add_argument("--long-pages", type=int, default=80, help="Pagine del bando")
+    p.add_argument("--latency", type=float, default=0.2)
+    p.add_argument("--token-latency", type=float, default=0.002)
+    p.add_argument("--chunk-tokens", type=int, default=6000)
+    p.add_argument("--workers", type=int, default=4, help="Richieste parallele per file nel riferimento")
+    p.add_argument("--concurrency", type=int, default=8, help="Richieste in corso per extract_files")
+    args = p.parse_args()
+
+    # Lettura dei file: in sequenza contro pool di thread (ingest senza cache)
+    pdfs = [(f"allegato_{i}.pdf", make_pdf(args.long_pages if i == 0 else args.pages, seed=i)) for i in range(args.files)]
+    t0 = time.perf_counter()
+    sequential = [ingest(data, name)[0].text for name, data in pdfs]
+    t_read_seq = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        threaded = [doc.text for doc, _ in pool.map(lambda item: ingest(item[1], item[0]), pdfs)]
+    t_read_pool = time.perf_counter() - t0
+    print(f"Lettura di {len(pdfs)} PDF: in sequenza {t_read_seq:.2f}s, pool di thread {t_read_pool:.2f}s "
+          f"(x{t_read_seq / t_read_pool:.1f}) {'identico' if sequential == threaded else 'DIVERSO'}")
+    failures = sequential != threaded
+
+    config = mock_openai.MockConfig(args.latency, args.token_latency, context_limit=128_000)
+    server = mock_openai.serve(config=config)
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    client = openai.OpenAI(api_key="mock", base_url=base_url, max_retries=0)
+    documents = [("bando.txt", make_bando(args.long_pages, seed=0))]
+    documents += [(f"allegato_{i}.txt", make_bando(args.pages, seed=i)) for i in range(1, args.files - 1)]
+    documents += [("faq.txt", make_bando(args.pages, criteria_per_page=1, seed=99))]
+    print(f"{len(documents)} file, {sum(len(t) for _, t in documents):,} caratteri")
+
+    t0 = time.perf_counter()
+    per_file: List[List[Dict[str, str]]] = []
+    for _, text in documents:
+        if core.estimate_tokens(text) <= args.chunk_tokens:
+            criteria, _ = core.request_criteria(client.chat.completions.create, core.build_user_prompt(text))
+            per_file.append(criteria)
+        else:
+            per_file.append(core.extract_criteria_chunked(client.chat.completions.create, text,
+                                                          max_chunk_tokens=args.chunk_tokens, workers=args.workers).criteria)
+    t_seq = time.perf_counter() - t0
+    reference = core.merge_file_criteria(zip((name for name, _ in documents), per_file))
+
+    progress_calls = 0
+
+    def on_progress(_):
+        nonlocal progress_calls
+        progress_calls += 1
+
+    async def run():
+        async with openai.AsyncOpenAI(api_key="mock", base_url=base_url, max_retries=0) as aclient:
+            return await core.extract_files(aclient.chat.completions.create, documents, max_chunk_tokens=args.chunk_tokens,
+                                            concurrency=args.concurrency, on_progress=on_progress)
+
+    t0 = time.perf_counter()
+    result = asyncio.run(run())
+    t_async = time.perf_counter() - t0
+    requests = sum(f.chunks for f in result.files)
+    errors = sum(len(f.errors) for f in result.files)
+    print(f"un file alla volta {t_seq:6.2f}s   extract_files {t_async:6.2f}s (x{t_seq / t_async:4.1f}, "
+          f"{requests} richieste, al più {args.concurrency} in corso, {errors} errori)")
+
+    sources = expected_sources(documents)
+    got = {c["criterio_id"].upper(): set(c["fonti"]) for c in result.criteria}
+    same = ([(c["criterio_id"], c["descrizione"]) for c in result.criteria]
+            == [(c["criterio_id"], c["descrizione"]) for c in reference])
+    print(f"{len(result.criteria)} criteri distinti ({sum(1 for s in got.values() if len(s) > 1)} in più file): "
+          f"{'uguali al riferimento' if same else 'DIVERSI dal riferimento'}, "
+          f"fonti {'corrette' if got == sources else 'ERRATE'}, {progress_calls} aggiornamenti di avanzamento")
+    failures += (not same) + (got != sources) + (progress_calls != requests) + errors
+    server.shutdown()
+    if failures:
+        sys.exit("[ERRORE] verifiche fallite")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Confronto tra il vecchio process_excel (tre pd.read_excel) e il reader in streaming.
+
+Per ogni workbook verifica che i due percorsi producano lo stesso JSON byte per byte
+(con lo stesso seed per ``idDomanda``) e riporta il tempo medio per file.
+
+    python -m benchmarks.bench_process_excel
+    python -m benchmarks.bench_process_excel --synthetic 20 --criteria 60 --repeat 3
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+ROOT = Path(__file__).resolve().parents[1]
+REST_DIR = ROOT / "criteria_json_restAPI"
+sys.path.insert(0, str(REST_DIR))
+
+import crieteria_json_rest as rest  # noqa: E402
+
+from benchmarks.synthetic import make_formulario  # noqa: E402
+
+
+# ---------------------------------------------------------------------------
+# Percorso precedente (pandas), copiato invariato come riferimento
+
+def _legacy_extract_soggetto(df) -> str:
+    for idx, cell in enumerate(df.iloc[:, 0].astype(str)):
+        if "denominazione" in cell.lower():
+            for j in range(idx + 1, len(df)):
+                val = str(df.iat[j, 0]).strip()
+                if val and val.lower() != "nan":
+                    return val
+            break
+    return "NON SPECIFICATO"
+
+
+def _legacy_extract_testo(df) -> Dict[str, str]:
+    testi: Dict[str, str] = {}
+    current = None
+    rx = re.compile(r"(?i)^criterio\s+([A-Z]\d(?:\.\d)?)")
+    for raw in df.iloc[:, 0].astype(str):
+        line = raw.strip()
+        m = rx.match(line)
+        if m:
+            current = m.group(1).upper()
+            testi[current] = ""
+        elif current:
+            testi[current] = (testi[current] + " " + line).strip()
+    return testi
+
+
+def _legacy_extract_descr(df) -> Dict[str, str]:
+    descr: Dict[str, str] = {}
+    for _, row in df.iterrows():
+        k_raw = str(row.iloc[0]).strip()
+        if re.fullmatch(r"[A-Z]\d{1,2}", k_raw):
+            descr[k_raw.upper()] = str(row.iloc[1]).strip()
+    return descr
+
+
+def legacy_process_excel(xlsx: Path, template: Dict[str, Any]) -> Dict[str, Any]:
+    import pandas as pd
+
+    xl = pd.ExcelFile(xlsx, engine="openpyxl")
+    sh_anag = rest.find_sheet(xl.sheet_names, ["anagraf"], 0)
+    sh_prop = rest.find_sheet(xl.sheet_names, ["proposta", "criter"], 1)
+    sh_crit = rest.find_sheet(xl.sheet_names, ["criter", "valut"], -1)
+
+    soggetto = _legacy_extract_soggetto(pd.read_excel(xlsx, sheet_name=sh_anag, header=None, engine="openpyxl"))
+    testi = _legacy_extract_testo(pd.read_excel(xlsx, sheet_name=sh_prop, header=None, engine="openpyxl"))
+    descr = _legacy_extract_descr(pd.read_excel(xlsx, sheet_name=sh_crit, header=None, engine="openpyxl"))
+    return rest.update_json(template, testi, descr, soggetto)
+
+
+# ---------------------------------------------------------------------------
+
+def _render(data: Dict[str, Any]) -> bytes:
+    return json.dumps(data, ensure_ascii=False, indent=4).encode("utf-8")
+
+
+def _time_per_file(fn: Callable[[], Dict[str, Any]], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--excel-dir", default=str(REST_DIR / "excel"))
+    p.add_argument("--template", default=str(REST_DIR / "template.json"))
+    p.add_argument("--synthetic", type=int, default=0, help="Genera N formulari sintetici invece di usare --excel-dir")
+    p.add_argument("--criteria", type=int, default=40)
+    p.add_argument("--text-size", type=int, default=400)
+    p.add_argument("--repeat", type=int, default=5)
+    args = p.parse_args()
+
+    template = rest.load_template(Path(args.template))
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.synthetic:
+            files = [make_formulario(Path(tmp) / f"sintetico_{i}.xlsx", args.criteria, args.text_size, seed=i)
+                     for i in range(args.synthetic)]
+        else:
+            files = sorted(Path(args.excel_dir).glob("*.xls*"))
+
+        old_total = new_total = 0.0
+        mismatches = 0
+        for xlsx in files:
+            random.seed(0)
+            old = _render(legacy_process_excel(xlsx, template))
+            random.seed(0)
+            new = _render(rest.process_excel(xlsx, template, verbose=False))
+            same = old == new
+            mismatches += not same
+
+            t_old = _time_per_file(lambda: legacy_process_excel(xlsx, template), args.repeat)
+            t_new = _time_per_file(lambda: rest.process_excel(xlsx, template, verbose=False), args.repeat)
+            old_total += t_old
+            new_total += t_new
+            print(f"{xlsx.name[:48]:<48} pandas {t_old * 1000:8.1f} ms  streaming {t_new * 1000:8.1f} ms  "
+                  f"x{t_old / t_new:5.2f}  {'identico' if same else 'DIVERSO'}")
+
+    if files:
+        print(f"\nTotale {len(files)} file: pandas {old_total:.3f}s, streaming {new_total:.3f}s, speedup x{old_total / new_total:.2f}")
+    if mismatches:
+        sys.exit(f"[ERRORE] {mismatches} file con JSON diverso tra i due percorsi")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Token di prompt e tempo del matching: documento intero contro retrieval BM25, sul mock OpenAI locale.
+
+    python -m benchmarks.bench_retrieval_matching --pages 100 --criteria 20
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "criteria_matching_ai"))
+
+import openai  # noqa: E402
+
+import matcher_core as core  # noqa: E402
+import retrieval  # noqa: E402
+from besidetech_common import mock_openai  # noqa: E402
+from besidetech_common.tokens import estimate_tokens  # noqa: E402
+
+TOPICS = ["fotovoltaico energia impianto", "occupazione addetti assunzioni", "accessibilità disabili percorso",
+          "digitalizzazione software prenotazioni", "cofinanziamento privato bilancio", "turismo destagionalizzazione flussi",
+          "formazione personale competenze", "ristorante sala climatizzazione", "parcheggio mobilità elettrica",
+          "certificazione qualità ambientale"]
+
+
+def make_document(pages: int, seed: int = 0) -> str:
+    rnd = random.Random(seed)
+    filler = "il progetto prevede interventi sulla struttura esistente con attenzione ai costi e ai tempi".split()
+    out = []
+    for p in range(pages):
+        topic = TOPICS[p % len(TOPICS)].split()
+        paragraphs = [" ".join(rnd.choice(filler + topic) for _ in range(90)) for _ in range(8)]
+        out.append("\n\n".join(paragraphs))
+    return "\f".join(out)
+
+
+def make_criteria(n: int):
+    return [{"criterio_id": f"C{i + 1}", "descrizione_guida": f"Descrivere {TOPICS[i % len(TOPICS)]} del progetto"} for i in range(n)]
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--pages", type=int, default=100)
+    p.add_argument("--criteria", type=int, default=20)
+    p.add_argument("--top-k", type=int, default=4)
+    p.add_argument("--group-size", type=int, default=5)
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--latency", type=float, default=0.3)
+    p.add_argument("--token-latency", type=float, default=0.001)
+    args = p.parse_args()
+
+    server = mock_openai.serve(config=mock_openai.MockConfig(args.latency, args.token_latency, context_limit=10**9))
+    client = openai.OpenAI(api_key="mock", base_url=f"http://127.0.0.1:{server.server_port}/v1", max_retries=0)
+    text = make_document(args.pages)
+    criteria = make_criteria(args.criteria)
+
+    t0 = time.perf_counter()
+    full, _ = core.request_matches(client.chat.completions.create, core.build_user_prompt(criteria, text))
+    full_elapsed = time.perf_counter() - t0
+    full_tokens = estimate_tokens(core.SYSTEM_PROMPT_MATCHER) + estimate_tokens(core.build_user_prompt(criteria, text))
+
+    t1 = time.perf_counter()
+    index = retrieval.BM25Index(retrieval.split_passages(text))
+    index_elapsed = time.perf_counter() - t1
+    result = retrieval.match_with_retrieval(
+        client.chat.completions.create, criteria, text, index=index,
+        top_k=args.top_k, group_size=args.group_size, workers=args.workers,
+    )
+    print(f"Documento: {args.pages} pagine, {len(index.passages)} passaggi (indice in {index_elapsed * 1000:.0f} ms)")
+    print(f"Documento intero: {len(full)} risposte, ~{full_tokens:,} token di prompt, {full_elapsed:.2f}s")
+    print(f"Retrieval:        {len(result.results)} risposte, ~{result.prompt_tokens_sent:,} token di prompt "
+          f"({result.groups} gruppi), {result.elapsed:.2f}s")
+    print(f"Riduzione token: x{full_tokens / max(1, result.prompt_tokens_sent):.1f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
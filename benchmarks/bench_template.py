@@ -0,0 +1,179 @@
+"""Compilazione del template: ``update_json`` originale + ``json.dumps`` contro ``CompiledTemplate``.
+
+    python -m benchmarks.bench_template --payloads 2000 --criteria 1000
+
+Verifica l'equivalenza dei payload (stesso JSON con ``indent=4``, byte per
+byte, e stesso contenuto nel formato compatto) sui formulari reali, su
+formulari sintetici e su un template sintetico grande con testi che
+contengono accenti, virgolette, a capo e caratteri di controllo, e che un
+payload con un campo fisso modificato dal chiamante venga serializzato con
+il valore nuovo; una differenza interrompe lo script con ``AssertionError``
+prima delle misure. Poi misura il tempo per payload dei due percorsi.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+REST_DIR = ROOT / "criteria_json_restAPI"
+sys.path.insert(0, str(REST_DIR))
+
+import crieteria_json_rest as rest  # noqa: E402
+from template_engine import CompiledTemplate, dumps  # noqa: E402
+
+from benchmarks.synthetic import make_formulario  # noqa: E402
+
+
+def legacy_update_json(template: Dict[str, Any], testi: Dict[str, str], descr: Dict[str, str], soggetto: str,
+                       id_domanda: Optional[str] = None) -> Dict[str, Any]:
+    """``update_json`` com'era prima di ``template_engine``."""
+    out = json.loads(json.dumps(template))
+    out["soggetto"] = soggetto
+    out["idDomanda"] = id_domanda or rest.rand_id()
+    for code, node in out["userCriteria"].items():
+        node["testo"] = testi.get(code.upper(), "NON FORNITO")
+        group = code.split(".")[0].upper()
+        if group in descr:
+            node["descrizione"] = descr[group]
+    return out
+
+
+def read_formulario(xlsx: Path) -> Tuple[Dict[str, str], Dict[str, str], str]:
+    """``(testi, descr, soggetto)`` letti con gli estrattori di ``crieteria_json_rest``."""
+    wb = rest.load_workbook(xlsx, read_only=True, data_only=True, keep_links=False)
+    try:
+        soggetto = rest.extract_soggetto(rest.iter_sheet_rows(wb[rest.find_sheet(wb.sheetnames, ["anagraf"], 0)]))
+        testi = rest.extract_testo(rest.read_sheet_rows(wb[rest.find_sheet(wb.sheetnames, ["proposta", "criter"], 1)]))
+        descr = rest.extract_descr(rest.read_sheet_rows(wb[rest.find_sheet(wb.sheetnames, ["criter", "valut"], -1)]))
+    finally:
+        wb.close()
+    return testi, descr, soggetto
+
+
+def make_template(n_criteria: int, seed: int = 0) -> Dict[str, Any]:
+    rnd = random.Random(seed)
+    template = json.loads((REST_DIR / "template.json").read_text(encoding="utf-8"))
+    template["userCriteria"] = {
+        f"{'ABCDEFGH'[i % 8]}{i // 8 % 40 + 1}.{i // 320 + 1}": {
+            "maxPunti": rnd.choice([2, 5, 10]), "minPunti": 0, "testo": "", "onOff": rnd.random() < 0.1,
+            "oggettivo": False, "descrizione": "",
+        }
+        for i in range(n_criteria)
+    }
+    return template
+
+
+TRICKY = ["qualità e sostenibilità", 'citazione "tra virgolette"', "a capo\nseconda riga", "tab\tcontrollo\x01",
+          "barra \\ rovescia", "emoji 🌱 e € simboli", "</script>", ""]
+
+
+def make_inputs(template: Dict[str, Any], seed: int) -> Tuple[Dict[str, str], Dict[str, str], str, str]:
+    rnd = random.Random(seed)
+    codes = list(template["userCriteria"])
+    testi = {c.upper(): " ".join(rnd.choice(TRICKY) for _ in range(rnd.randint(1, 30)))
+             for c in codes if rnd.random() < 0.85}
+    groups = {c.split(".")[0].upper() for c in codes}
+    descr = {g: rnd.choice(TRICKY) + " descrizione" for g in groups if rnd.random() < 0.7}
+    return testi, descr, rnd.choice(TRICKY) + " S.r.l.", f"{rnd.randint(0, 999_999_999):09d}"
+
+
+def check(compiled: CompiledTemplate, template: Dict[str, Any], testi: Dict[str, str], descr: Dict[str, str],
+          soggetto: str, id_domanda: str) -> List[str]:
+    legacy = legacy_update_json(template, testi, descr, soggetto, id_domanda)
+    new = compiled.build(testi, descr, soggetto, id_domanda)
+    problems = []
+    if json.dumps(new, ensure_ascii=False, indent=4) != json.dumps(legacy, ensure_ascii=False, indent=4):
+        problems.append("build")
+    if compiled.dumps(new) != json.dumps(legacy, ensure_ascii=False, indent=4):
+        problems.append("dumps")
+    compact = compiled.dumps(new, compact=True)
+    if compact != dumps(legacy, compact=True) or json.loads(compact) != legacy:
+        problems.append("dumps compatto")
+    if rest.update_json(compiled, testi, descr, soggetto, id_domanda) != legacy:
+        problems.append("update_json")
+    return problems
+
+
+def check_modified(compiled: CompiledTemplate, payload: Dict[str, Any]) -> List[str]:
+    """Campi fissi cambiati dopo ``build``: ``dumps`` deve serializzare i valori del payload, non quelli del template."""
+    problems = []
+    code = next(iter(payload["userCriteria"]))
+    variants = {
+        "maxPunti": lambda p: p["userCriteria"][code].__setitem__("maxPunti", p["userCriteria"][code].get("maxPunti", 0) + 1),
+        "onOff bool→int": lambda p: p["userCriteria"][code].__setitem__("onOff", 1),
+        "chiave in più nel criterio": lambda p: p["userCriteria"][code].__setitem__("nota", "aggiunta"),
+        "campo di primo livello": lambda p: p.__setitem__(next(k for k in p if k not in ("soggetto", "idDomanda", "userCriteria")), "cambiato"),
+    }
+    for label, change in variants.items():
+        modified = json.loads(json.dumps(payload))
+        change(modified)
+        for compact in (False, True):
+            if compiled.dumps(modified, compact=compact) != dumps(modified, compact=compact):
+                problems.append(f"{label}{' (compatto)' if compact else ''}")
+    return problems
+
+
+def _per_payload(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--payloads", type=int, default=2000)
+    p.add_argument("--criteria", type=int, default=1000, help="Criteri del template sintetico grande")
+    args = p.parse_args()
+
+    real_template = rest.load_template(REST_DIR / "template.json")
+    big_template = make_template(args.criteria)
+    checked = 0
+
+    # Payload dagli estrattori reali (formulari della repository e sintetici)
+    compiled = CompiledTemplate(real_template)
+    with tempfile.TemporaryDirectory() as tmp:
+        files = sorted((REST_DIR / "excel").glob("*.xls*"))
+        files += [make_formulario(Path(tmp) / f"sintetico_{i}.xlsx", 30, seed=i) for i in range(5)]
+        for i, xlsx in enumerate(files):
+            testi, descr, soggetto = read_formulario(xlsx)
+            id_domanda = f"{i:09d}"
+            problems = check(compiled, real_template, testi, descr, soggetto, id_domanda)
+            payload = rest.process_excel(xlsx, compiled, verbose=False, id_domanda=id_domanda)
+            if payload != legacy_update_json(real_template, testi, descr, soggetto, id_domanda):
+                problems.append("process_excel")
+            problems += check_modified(compiled, payload)
+            checked += 1
+            assert not problems, f"{xlsx.name}: payload diversi ({', '.join(problems)})"
+
+    # Input casuali su template reale e grande
+    for template in (real_template, big_template):
+        compiled = CompiledTemplate(template)
+        for seed in range(50):
+            problems = check(compiled, template, *make_inputs(template, seed))
+            checked += 1
+            assert not problems, f"{len(template['userCriteria'])} criteri, seed {seed}: payload diversi ({', '.join(problems)})"
+    print(f"Payload confrontati: {checked}, tutti identici")
+
+    for label, template, n in (("template reale", real_template, args.payloads),
+                               (f"template {args.criteria} criteri", big_template, max(1, args.payloads // 20))):
+        compiled = CompiledTemplate(template)
+        inputs = make_inputs(template, 1)
+        old = _per_payload(lambda: json.dumps(legacy_update_json(template, *inputs), ensure_ascii=False, indent=4), n)
+        new = _per_payload(lambda: compiled.dumps(compiled.build(*inputs)), n)
+        new_compact = _per_payload(lambda: compiled.dumps(compiled.build(*inputs), compact=True), n)
+        size = len(compiled.dumps(compiled.build(*inputs)).encode("utf-8"))
+        size_compact = len(compiled.dumps(compiled.build(*inputs), compact=True).encode("utf-8"))
+        print(f"{label:<24} originale {old * 1e6:9.1f} µs  compilato {new * 1e6:9.1f} µs (x{old / new:4.1f})  "
+              f"compatto {new_compact * 1e6:9.1f} µs  ·  {size / 1024:.1f} KB → {size_compact / 1024:.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Modalità ``--watch`` del tool REST: pipeline lettura → template → scrittura → POST contro il ciclo seriale, sullo stub locale.
+
+    python -m benchmarks.bench_watch_pipeline --files 60 --latency 0.1 --workers 2
+
+I file sono copie dei formulari della repository. Misura il ciclo seriale
+(leggi, scrivi, POST e attendi la risposta, un file alla volta), il batch
+attuale del tool e il tool in ``--watch`` con i file già presenti; poi, con
+inotify e in polling, lascia cadere i file nella cartella uno alla volta
+(scritti in un temporaneo e rinominati, come fanno i portali) e verifica che
+arrivino tutti all'endpoint. Controlla che le code restino entro
+``--queue-size`` e le POST in volo entro ``2 * --concurrency`` con un
+endpoint lento, e che dopo un SIGTERM a metà tutti i file entrati nella
+pipeline risultino inviati nel manifest, con i restanti ripresi dal
+riavvio successivo.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+
+ROOT = Path(__file__).resolve().parents[1]
+REST_DIR = ROOT / "criteria_json_restAPI"
+sys.path.insert(0, str(REST_DIR))
+
+import crieteria_json_rest as rest  # noqa: E402
+import stub_server  # noqa: E402
+from template_engine import CompiledTemplate  # noqa: E402
+
+SOURCES = sorted((REST_DIR / "excel").glob("*.xlsx"))
+
+
+def drop(directory: Path, i: int) -> Path:
+    """Copia un formulario come fa un portale: file temporaneo nascosto e rinomina."""
+    tmp = directory / f".upload_{i:05d}.tmp"
+    shutil.copyfile(SOURCES[i % len(SOURCES)], tmp)
+    return tmp.replace(directory / f"domanda_{i:05d}.xlsx")
+
+
+def file_records(metrics: Path):
+    if not metrics.exists():
+        return []
+    records = []
+    for line in metrics.read_text(encoding="utf-8").splitlines():
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue  # riga in scrittura
+    return records
+
+
+def posted(metrics: Path) -> int:
+    return sum(1 for r in file_records(metrics) if r.get("type") == "file" and "http_status" in r)
+
+
+def wait_posted(metrics: Path, n: int, timeout: float = 120.0) -> float:
+    t0 = time.perf_counter()
+    while posted(metrics) < n:
+        if time.perf_counter() - t0 > timeout:
+            raise TimeoutError(f"{posted(metrics)}/{n} POST dopo {timeout}s")
+        time.sleep(0.02)
+    return time.perf_counter() - t0
+
+
+def cli(inbox: Path, out: Path, endpoint: str, *extra: str) -> list:
+    return [sys.executable, str(REST_DIR / "crieteria_json_rest.py"), "--excel-dir", str(inbox),
+            "--template", str(REST_DIR / "template.json"), "--out-dir", str(out),
+            "--endpoint", endpoint, "--token", "bench", *extra]
+
+
+def start(command: list, log: Path) -> subprocess.Popen:
+    return subprocess.Popen(command, stdout=open(log, "w"), stderr=subprocess.STDOUT, cwd=REST_DIR)
+
+
+def serial(files, out: Path, endpoint: str) -> float:
+    """Il ciclo di partenza: un file alla volta, la POST attende la risposta prima del file successivo."""
+    template = CompiledTemplate(rest.load_template(REST_DIR / "template.json"))
+    session = requests.Session()
+    t0 = time.perf_counter()
+    for file in files:
+        enriched = rest.process_excel(file, template, verbose=False)
+        body = template.dumps(enriched)
+        (out / f"{file.stem}.json").write_text(body, encoding="utf-8")
+        session.post(endpoint, data=body.encode("utf-8"), headers={"Authorization": "Bearer bench"}, timeout=30).raise_for_status()
+    return time.perf_counter() - t0
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--files", type=int, default=60)
+    p.add_argument("--latency", type=float, default=0.1, help="Latenza dello stub per POST")
+    p.add_argument("--slow-latency", type=float, default=0.5, help="Latenza dello stub nella prova di backpressure")
+    p.add_argument("--workers", type=int, default=2)
+    p.add_argument("--concurrency", type=int, default=4)
+    p.add_argument("--queue-size", type=int, default=4)
+    p.add_argument("--drop-interval", type=float, default=0.05, help="Secondi tra un file e il successivo nelle prove di arrivo")
+    args = p.parse_args()
+
+    config = stub_server.StubConfig(latency=args.latency, seed=0)
+    server = stub_server.serve(config=config)
+    endpoint = f"http://127.0.0.1:{server.server_port}/v1/core/evaluate"
+    common = ("--workers", str(args.workers), "--concurrency", str(args.concurrency), "--queue-size", str(args.queue_size))
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        inbox = tmp / "inbox"
+        inbox.mkdir()
+        files = [drop(inbox, i) for i in range(args.files)]
+        print(f"{args.files} formulari, stub con {args.latency * 1000:.0f} ms per POST, workers={args.workers}, "
+              f"concurrency={args.concurrency}, queue-size={args.queue_size}\n")
+
+        (tmp / "serial").mkdir()
+        reference = serial(files, tmp / "serial", endpoint)
+        print(f"{'seriale (leggi, scrivi, POST)':<34} {reference:6.2f}s  {args.files / reference:6.1f} file/s")
+
+        t0 = time.perf_counter()
+        done = subprocess.run(cli(inbox, tmp / "batch", endpoint, *common), capture_output=True, text=True, cwd=REST_DIR)
+        elapsed = time.perf_counter() - t0
+        failures += done.returncode != 0 or posted(tmp / "batch" / "metrics.ndjson") != args.files
+        print(f"{'batch del tool':<34} {elapsed:6.2f}s  {args.files / elapsed:6.1f} file/s  x{reference / elapsed:.1f}")
+
+        t0 = time.perf_counter()
+        proc = start(cli(inbox, tmp / "watch", endpoint, "--watch", *common), tmp / "watch.log")
+        wait_posted(tmp / "watch" / "metrics.ndjson", args.files)
+        elapsed = time.perf_counter() - t0
+        proc.send_signal(signal.SIGTERM)
+        failures += proc.wait(30) != 0
+        print(f"{'--watch, file già presenti':<34} {elapsed:6.2f}s  {args.files / elapsed:6.1f} file/s  x{reference / elapsed:.1f}  "
+              f"(avvio del processo incluso)")
+
+        print()
+        for label, extra in (("arrivo uno alla volta, inotify", ()), ("arrivo uno alla volta, polling", ("--watch-polling", "--poll-interval", "0.5"))):
+            landing = tmp / f"landing_{len(extra)}"
+            landing.mkdir()
+            out = tmp / f"out_{len(extra)}"
+            proc = start(cli(landing, out, endpoint, "--watch", *common, *extra), tmp / "drip.log")
+            time.sleep(1.0)  # avvio dell'interprete e del watcher
+            t0 = time.perf_counter()
+            for i in range(args.files):
+                drop(landing, i)
+                time.sleep(args.drop_interval)
+            arrival = time.perf_counter() - t0
+            tail = wait_posted(out / "metrics.ndjson", args.files)
+            proc.send_signal(signal.SIGTERM)
+            code = proc.wait(30)
+            mode = "inotify" if "(inotify)" in (tmp / "drip.log").read_text() else "polling"
+            failures += code != 0 or mode != label.split(", ")[1]
+            print(f"{label:<34} {args.files}/{args.files} inviati ({mode}), ultimo file inviato {tail:.2f}s dopo la fine "
+                  f"degli arrivi ({arrival:.2f}s)")
+
+        # Endpoint lento: le code non superano --queue-size, le POST in volo 2 * concurrency
+        print()
+        config.latency = args.slow_latency
+        slow = tmp / "slow"
+        proc = start(cli(inbox, slow, endpoint, "--watch", *common, "--status-interval", "0.1"), tmp / "slow.log")
+        stop_at = max(1, args.files // 10)
+        while sum(1 for r in file_records(slow / "metrics.ndjson") if r.get("type") == "file") < stop_at:
+            time.sleep(0.02)
+        proc.send_signal(signal.SIGTERM)
+        code = proc.wait(120)
+        snapshots = [r for r in file_records(slow / "metrics.ndjson") if r.get("type") == "queues"]
+        max_queue = max(s["queue"] for r in snapshots for s in r["stages"].values())
+        max_flight = max(r["post"]["in_flight"] for r in snapshots)
+        manifest = {}
+        for line in (slow / "manifest.ndjson").read_text(encoding="utf-8").splitlines():
+            record = json.loads(line)
+            manifest.setdefault(record["file"], {}).update(record)
+        sent = sum(1 for e in manifest.values() if e.get("post_status") == "ok")
+        pending = sum(1 for e in manifest.values() if e.get("post_status") != "ok")
+        bounded = max_queue <= args.queue_size and max_flight <= 2 * args.concurrency
+        print(f"{'endpoint a ' + format(args.slow_latency * 1000, '.0f') + ' ms per POST':<34} code al massimo {max_queue}/{args.queue_size}, "
+              f"POST in volo al massimo {max_flight}/{2 * args.concurrency} ({len(snapshots)} righe di stato)  "
+              f"{'entro i limiti' if bounded else 'OLTRE I LIMITI'}")
+        graceful = code == 0 and pending == 0
+        print(f"{'SIGTERM dopo ' + str(stop_at) + ' POST':<34} uscita {code}, {sent} file entrati nella pipeline tutti inviati, "
+              f"{pending} in sospeso  {'ok' if graceful else 'ERRATO'}")
+
+        config.latency = args.latency
+        done = subprocess.run(cli(inbox, slow, endpoint, *common), capture_output=True, text=True, cwd=REST_DIR)
+        resumed = posted(slow / "metrics.ndjson")
+        complete = done.returncode == 0 and sent + resumed == args.files
+        print(f"{'riavvio':<34} {resumed} file restanti elaborati e inviati, totale {sent + resumed}/{args.files}  "
+              f"{'ok' if complete else 'ERRATO'}")
+        failures += (not bounded) + (not graceful) + (not complete)
+
+    server.shutdown()
+    if failures:
+        sys.exit(f"[ERRORE] {failures} verifiche fallite")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Scansione di una colonna Excel: accesso per cella (``_parse_records`` originale) contro ``scanner``.
+
+    python -m benchmarks.bench_xls_scanner --rows 100000 --legacy-rows 1500
+
+Il workbook sintetico alterna righe ``CRITERIO A1.2`` + descrizione, righe
+``B12 - descrizione`` e testo libero. L'accesso per cella in sola lettura è
+quadratico, quindi la versione originale viene misurata solo sulle prime
+``--legacy-rows`` righe (e stimata sull'intero foglio); sullo stesso intervallo
+i record devono coincidere.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "criteria_extractor_xls"))
+
+from openpyxl import load_workbook  # noqa: E402
+
+import scanner  # noqa: E402
+from benchmarks.synthetic import make_criteria_workbook  # noqa: E402
+
+
+def legacy_parse_records(sheet, col_letter: str, row_start: int, row_end: int) -> List[Dict[str, str]]:
+    """``_parse_records`` com'era in ``extract_criteria.py``."""
+    records: List[Dict[str, str]] = []
+    col_letter = col_letter.upper()
+    pending: Optional[str] = None
+
+    for row in range(row_start, row_end + 1):
+        value = sheet[f"{col_letter}{row}"].value
+        if value is None:
+            continue
+        text = str(value).strip()
+        if not text:
+            continue
+
+        if pending:
+            records.append({pending: text})
+            pending = None
+            continue
+
+        m_sub = scanner.RE_SUB.match(text)
+        if m_sub:
+            pending = m_sub.group(1)
+            continue
+
+        m_main = scanner.RE_MAIN.match(text)
+        if m_main:
+            code, desc = m_main.group(1), m_main.group(2).strip()
+            records.append({code: desc})
+    return records
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--rows", type=int, default=100_000)
+    p.add_argument("--sheets", type=int, default=2)
+    p.add_argument("--legacy-rows", type=int, default=1500)
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "sintetico.xlsx"
+        t0 = time.perf_counter()
+        make_criteria_workbook(path, args.rows, args.sheets)
+        print(f"Workbook: {args.sheets} fogli x {args.rows} righe, {path.stat().st_size / 1e6:.1f} MB "
+              f"(generato in {time.perf_counter() - t0:.1f}s)")
+
+        wb = load_workbook(path, data_only=True, read_only=True)
+        sheet = wb[wb.sheetnames[0]]
+
+        t0 = time.perf_counter()
+        legacy = legacy_parse_records(sheet, "A", 1, args.legacy_rows)
+        legacy_s = time.perf_counter() - t0
+        new_part = scanner.records_from_hits(scanner.scan_sheet(sheet, ["A"], 1, args.legacy_rows))
+        estimate = legacy_s * (args.rows / args.legacy_rows) ** 2
+
+        t0 = time.perf_counter()
+        hits = scanner.scan_sheet(sheet, ["A"])
+        full_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        all_hits = scanner.scan_workbook(wb, ["A", "C"])
+        multi_s = time.perf_counter() - t0
+        wb.close()
+
+    print(f"Originale, prime {args.legacy_rows} righe:   {legacy_s:.2f}s "
+          f"(stima su {args.rows} righe ~{estimate / 60:.0f} min)")
+    print(f"Scanner, {args.rows} righe colonna A:      {full_s:.2f}s, {len(hits)} codici")
+    print(f"Scanner, colonne A,C su {args.sheets} fogli:     {multi_s:.2f}s, {len(all_hits)} codici")
+    print(f"Record identici sulle prime {args.legacy_rows} righe: {legacy == new_part} ({len(legacy)} record)")
+    if legacy != new_part:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
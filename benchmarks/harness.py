@@ -0,0 +1,140 @@
+"""Misure ripetute, percentili, memoria di picco e confronto con una baseline.
+
+``measure`` esegue la funzione ``warmup`` volte senza misurarla, poi ``repeat``
+volte cronometrando ogni chiamata; una chiamata ulteriore, separata, è
+eseguita sotto ``tracemalloc`` per il picco di memoria (il tracciamento
+rallenta e non deve finire nei tempi). Il picco conta solo le allocazioni
+Python del processo corrente: i processi figli (estrazione PDF in parallelo)
+non sono inclusi.
+
+Le misure si salvano in JSON con ``save`` e si confrontano con ``compare``:
+un caso è una regressione se il p50 o il picco di memoria peggiorano oltre la
+soglia relativa rispetto alla baseline.
+"""
+from __future__ import annotations
+
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+@dataclass
+class Measurement:
+    name: str
+    unit: str  # cosa conta ``items`` (file, pagine, richieste...)
+    items: int  # unità elaborate per chiamata
+    runs: int
+    p50: float  # secondi per chiamata
+    p95: float
+    mean: float
+    peak_bytes: int
+
+    @property
+    def throughput(self) -> float:
+        """Unità al secondo, sul p50."""
+        return self.items / self.p50 if self.p50 > 0 else math.inf
+
+
+def percentile(samples: Sequence[float], q: float) -> float:
+    """Percentile con interpolazione lineare (``q`` tra 0 e 100)."""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    pos = (len(ordered) - 1) * q / 100
+    low = math.floor(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def measure(name: str, fn: Callable[[], Any], *, items: int = 1, unit: str = "op", repeat: int = 5,
+            warmup: int = 1, trace_memory: bool = True) -> Measurement:
+    for _ in range(warmup):
+        fn()
+    samples: List[float] = []
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+
+    peak = 0
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return Measurement(name, unit, items, len(samples), percentile(samples, 50), percentile(samples, 95),
+                       statistics.fmean(samples), peak)
+
+
+def environment() -> Dict[str, Any]:
+    return {"python": sys.version.split()[0], "platform": platform.platform(), "machine": platform.machine()}
+
+
+def save(path: Path, measurements: Sequence[Measurement], params: Optional[Dict[str, Any]] = None) -> None:
+    data = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "params": params or {},
+        "results": [asdict(m) for m in measurements],
+    }
+    path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+def load(path: Path) -> Tuple[Dict[str, Any], Dict[str, Measurement]]:
+    """``(dati senza risultati, misure per nome)``."""
+    data = json.loads(path.read_text(encoding="utf-8"))
+    results = {r["name"]: Measurement(**r) for r in data.pop("results", [])}
+    return data, results
+
+
+@dataclass
+class Comparison:
+    name: str
+    time_ratio: float  # p50 attuale / p50 baseline
+    memory_ratio: float
+    regression: bool
+
+
+def compare(current: Sequence[Measurement], baseline: Dict[str, Measurement], threshold: float = 0.2,
+            memory_threshold: float = 0.2) -> List[Comparison]:
+    """Confronto per nome; i casi assenti dalla baseline sono ignorati."""
+    out: List[Comparison] = []
+    for m in current:
+        base = baseline.get(m.name)
+        if base is None:
+            continue
+        time_ratio = m.p50 / base.p50 if base.p50 > 0 else 1.0
+        memory_ratio = m.peak_bytes / base.peak_bytes if base.peak_bytes > 0 else 1.0
+        regression = time_ratio > 1 + threshold or memory_ratio > 1 + memory_threshold
+        out.append(Comparison(m.name, time_ratio, memory_ratio, regression))
+    return out
+
+
+def _fmt_time(seconds: float) -> str:
+    return f"{seconds * 1000:.1f} ms" if seconds < 1 else f"{seconds:.2f} s"
+
+
+def format_table(measurements: Sequence[Measurement], comparisons: Sequence[Comparison] = ()) -> str:
+    by_name = {c.name: c for c in comparisons}
+    header = f"{'caso':<28} {'p50':>10} {'p95':>10} {'throughput':>20} {'picco mem':>10}"
+    if comparisons:
+        header += f" {'vs baseline':>22}"
+    lines = [header, "-" * len(header)]
+    for m in measurements:
+        line = (f"{m.name:<28} {_fmt_time(m.p50):>10} {_fmt_time(m.p95):>10} "
+                f"{f'{m.throughput:,.1f} {m.unit}/s':>20} {m.peak_bytes / 1e6:>7.1f} MB")
+        c = by_name.get(m.name)
+        if c is not None:
+            flag = "  REGRESSIONE" if c.regression else ""
+            line += f" {f'x{c.time_ratio:.2f} t, x{c.memory_ratio:.2f} mem':>22}{flag}"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,232 @@
+"""Suite dei percorsi critici con p50/p95, throughput, picco di memoria e confronto con una baseline.
+
+    python -m benchmarks.suite --save benchmarks/baseline.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json --threshold 0.25
+    python -m benchmarks.suite --quick --only ingest
+
+Casi misurati (tutti su input generati da ``synthetic``):
+
+- ``formulario/process_excel``: formulari → JSON (``crieteria_json_rest``);
+- ``formulario/update_json``: solo la compilazione del template;
+- ``xls/scan_sheet``: scansione di un foglio grande (``criteria_extractor_xls``);
+- ``ingest/pdf|docx|excel``: estrazione del testo dei documenti sorgente;
+- ``rest/submit``: invio dei JSON allo stub di /v1/core/evaluate;
+- ``openai/match`` e ``openai/match_planned``: matching sul mock OpenAI locale.
+
+Con ``--baseline`` esce con codice 1 se almeno un caso è peggiorato oltre la
+soglia (p50 o picco di memoria). Le baseline dipendono dalla macchina: vanno
+confrontate solo misure raccolte sullo stesso ambiente.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import sys
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+REST_DIR = ROOT / "criteria_json_restAPI"
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(REST_DIR))
+sys.path.insert(0, str(ROOT / "criteria_extractor_xls"))
+sys.path.insert(0, str(ROOT / "criteria_matching_ai"))
+
+from benchmarks import harness, synthetic  # noqa: E402
+from benchmarks.bench_retrieval_matching import make_criteria, make_document  # noqa: E402
+
+# (nome, dimensione normale, dimensione --quick)
+SIZES: Dict[str, Tuple[int, int]] = {
+    "formulari": (10, 3),
+    "criteri": (60, 20),
+    "righe_xls": (50_000, 5_000),
+    "pagine_pdf": (200, 30),
+    "paragrafi_docx": (3_000, 300),
+    "righe_excel": (5_000, 500),
+    "invii": (200, 40),
+    "criteri_match": (40, 10),
+    "pagine_match": (40, 10),
+}
+
+Case = Tuple[str, Callable[[], object], int, str]  # (nome, funzione, unità per chiamata, nome unità)
+
+
+def formulario_cases(tmp: Path, size: Callable[[str], int]) -> List[Case]:
+    import crieteria_json_rest as rest
+
+    template = rest.load_template(REST_DIR / "template.json")
+    files = [synthetic.make_formulario(tmp / f"formulario_{i}.xlsx", size("criteri"), seed=i)
+             for i in range(size("formulari"))]
+    testi = {code.upper(): "testo del criterio " * 20 for code in template["userCriteria"]}
+    descr = {code.split(".")[0].upper(): "descrizione" for code in template["userCriteria"]}
+
+    def process() -> None:
+        for path in files:
+            rest.process_excel(path, template, verbose=False)
+
+    def update() -> None:
+        for _ in range(100):
+            rest.update_json(template, testi, descr, "Impresa S.r.l.", id_domanda="000000001")
+
+    return [
+        ("formulario/process_excel", process, len(files), "file"),
+        ("formulario/update_json", update, 100, "json"),
+    ]
+
+
+def xls_cases(tmp: Path, size: Callable[[str], int]) -> List[Case]:
+    from openpyxl import load_workbook
+
+    import scanner
+
+    rows = size("righe_xls")
+    path = synthetic.make_criteria_workbook(tmp / "criteri.xlsx", rows)
+
+    def scan() -> None:
+        wb = load_workbook(path, data_only=True, read_only=True)
+        try:
+            scanner.scan_sheet(wb[wb.sheetnames[0]], ["A", "C"])
+        finally:
+            wb.close()
+
+    return [("xls/scan_sheet", scan, rows, "righe")]
+
+
+def ingest_cases(tmp: Path, size: Callable[[str], int]) -> List[Case]:
+    from besidetech_common import ingestion
+
+    pages, paragraphs, rows = size("pagine_pdf"), size("paragrafi_docx"), size("righe_excel")
+    pdf = synthetic.make_pdf(pages)
+    docx = synthetic.make_docx(paragraphs, table_rows=paragraphs // 10)
+    xlsx = synthetic.make_data_workbook(rows)
+    return [
+        ("ingest/pdf", lambda: ingestion.parse_pdf(pdf), pages, "pagine"),
+        ("ingest/docx", lambda: ingestion.parse_docx(docx), paragraphs, "paragrafi"),
+        ("ingest/excel", lambda: ingestion.parse_excel(xlsx), rows * 2, "righe"),
+    ]
+
+
+@contextlib.contextmanager
+def _servers(latency: float):
+    import stub_server
+
+    from besidetech_common import mock_openai
+
+    stub = stub_server.serve(config=stub_server.StubConfig(latency=latency, seed=0))
+    mock = mock_openai.serve(config=mock_openai.MockConfig(latency=latency, context_limit=10 ** 9, seed=0))
+    try:
+        yield stub, mock
+    finally:
+        stub.shutdown()
+        mock.shutdown()
+
+
+def network_cases(size: Callable[[str], int], stub, mock) -> List[Case]:
+    import openai
+
+    import crieteria_json_rest as rest
+    import matcher_core
+    import planner
+    from submitter import Submitter
+
+    template = rest.load_template(REST_DIR / "template.json")
+    payloads = [rest.update_json(template, {}, {}, f"Impresa {i}", id_domanda=f"{i:09d}") for i in range(size("invii"))]
+    endpoint = f"http://127.0.0.1:{stub.server_port}/v1/core/evaluate"
+
+    def submit() -> None:
+        with contextlib.redirect_stdout(io.StringIO()):  # Submitter stampa una riga per invio
+            with Submitter(endpoint, "bench", concurrency=8, retries=0) as sub:
+                for i, data in enumerate(payloads):
+                    sub.submit(f"payload_{i}", data)
+
+    client = openai.OpenAI(api_key="mock", base_url=f"http://127.0.0.1:{mock.server_port}/v1", max_retries=0)
+    criteria = make_criteria(size("criteri_match"))
+    document = make_document(size("pagine_match"))
+    prompt = matcher_core.build_user_prompt(criteria, document)
+
+    def match() -> None:
+        matcher_core.request_matches(client.chat.completions.create, prompt)
+
+    def match_planned() -> None:
+        planner.match_planned(client.chat.completions.create, criteria, document, output_tokens=2_048)
+
+    return [
+        ("rest/submit", submit, len(payloads), "invii"),
+        ("openai/match", match, len(criteria), "criteri"),
+        ("openai/match_planned", match_planned, len(criteria), "criteri"),
+    ]
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--quick", action="store_true", help="Input ridotti, per una verifica veloce")
+    p.add_argument("--only", action="append", default=[], help="Esegue solo i casi il cui nome contiene il testo (ripetibile)")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--warmup", type=int, default=1)
+    p.add_argument("--latency", type=float, default=0.02, help="Latenza simulata di stub e mock OpenAI (s)")
+    p.add_argument("--no-memory", action="store_true", help="Salta la misura del picco di memoria")
+    p.add_argument("--save", type=Path, help="Scrive le misure in JSON (da usare come baseline)")
+    p.add_argument("--baseline", type=Path, help="JSON salvato con --save con cui confrontare le misure")
+    p.add_argument("--threshold", type=float, default=0.2, help="Peggioramento relativo del p50 tollerato")
+    p.add_argument("--memory-threshold", type=float, default=0.2, help="Peggioramento relativo del picco tollerato")
+    args = p.parse_args()
+
+    def size(key: str) -> int:
+        return SIZES[key][1 if args.quick else 0]
+
+    def wanted(name: str) -> bool:
+        return not args.only or any(part in name for part in args.only)
+
+    measurements: List[harness.Measurement] = []
+
+    def run(cases: List[Case]) -> None:
+        for name, fn, items, unit in cases:
+            if not wanted(name):
+                continue
+            print(f"→ [{name}] ...", flush=True)
+            measurements.append(harness.measure(name, fn, items=items, unit=unit, repeat=args.repeat,
+                                                warmup=args.warmup, trace_memory=not args.no_memory))
+
+    def any_wanted(*names: str) -> bool:  # evita di generare input per gruppi esclusi da --only
+        return any(wanted(name) for name in names)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp = Path(tmp_dir)
+        if any_wanted("formulario/process_excel", "formulario/update_json"):
+            run(formulario_cases(tmp, size))
+        if any_wanted("xls/scan_sheet"):
+            run(xls_cases(tmp, size))
+        if any_wanted("ingest/pdf", "ingest/docx", "ingest/excel"):
+            run(ingest_cases(tmp, size))
+        if any_wanted("rest/submit", "openai/match", "openai/match_planned"):
+            with _servers(args.latency) as (stub, mock):
+                run(network_cases(size, stub, mock))
+
+    if not measurements:
+        sys.exit(f"[ERRORE] Nessun caso corrisponde a {args.only}")
+
+    comparisons: List[harness.Comparison] = []
+    if args.baseline:
+        info, baseline = harness.load(args.baseline)
+        comparisons = harness.compare(measurements, baseline, args.threshold, args.memory_threshold)
+        if info.get("params", {}).get("quick") != args.quick:
+            print("[WARN] La baseline è stata raccolta con dimensioni diverse (--quick): il confronto non è significativo.")
+
+    print()
+    print(harness.format_table(measurements, comparisons))
+
+    if args.save:
+        harness.save(args.save, measurements, {"quick": args.quick, "repeat": args.repeat, "latency": args.latency})
+        print(f"\n[INFO] Misure salvate in {args.save}")
+
+    regressions = [c.name for c in comparisons if c.regression]
+    if regressions:
+        sys.exit(f"[ERRORE] Regressioni rispetto alla baseline: {', '.join(regressions)}")
+    if comparisons:
+        print(f"\n[FINE] Nessuna regressione su {len(comparisons)} casi confrontati.")
+
+
+if __name__ == "__main__":
+    main()
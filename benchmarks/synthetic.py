@@ -0,0 +1,221 @@
+"""Generatori di input sintetici per i benchmark.
+
+Tutti deterministici a parità di ``seed``:
+
+- ``make_formulario``: workbook con la struttura dei formulari in
+  ``criteria_json_restAPI/excel`` (anagrafica, proposta con ``CRITERIO X``,
+  criteri di valutazione);
+- ``make_criteria_workbook``: foglio grande con codici ``CRITERIO``/``A12 -``
+  sparsi, per ``criteria_extractor_xls``;
+- ``make_pdf``: PDF scritto a mano (solo font Helvetica, nessuna dipendenza);
+- ``make_docx``: documento Word con paragrafi, titoli e tabelle (anche con celle unite);
+- ``make_data_workbook``: workbook "di dati" da caricare come documento sorgente;
+- ``make_financial_plan``: piano finanziario largo e sparso (molte celle vuote).
+"""
+from __future__ import annotations
+
+import io
+import random
+from pathlib import Path
+from typing import List, Optional
+
+WORDS = ("il progetto prevede interventi sulla struttura ricettiva esistente con attenzione ai costi ai tempi "
+         "alla sostenibilità energetica accessibilità occupazione digitalizzazione turismo formazione").split()
+
+
+def _sentence(rnd: random.Random, words: int) -> str:
+    return " ".join(rnd.choice(WORDS) for _ in range(words))
+
+
+# ---------------------------------------------------------------------------
+# Excel
+
+def make_formulario(path: Path, n_criteria: int = 20, text_size: int = 400, seed: int = 0) -> Path:
+    from openpyxl import Workbook
+
+    rnd = random.Random(seed)
+    words = "progetto impresa intervento sostenibilità innovazione territorio qualità energia".split()
+
+    def text(n: int) -> str:
+        out: List[str] = []
+        while sum(len(w) + 1 for w in out) < n:
+            out.append(rnd.choice(words))
+        return " ".join(out)
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "copertina"
+    ws["A1"] = "Formulario"
+
+    anag = wb.create_sheet("1. Anagrafica")
+    anag["A1"] = " Anagrafica Soggetto Proponente"
+    anag["A3"] = "Denominazione/Ragione Sociale"
+    anag["A4"] = f"Impresa {seed} S.r.l."
+    for r in range(5, 130):
+        anag.cell(row=r, column=1, value=text(30) if r % 2 else None)
+        anag.cell(row=r, column=1 + r % 60, value=r * 1.0)
+
+    prop = wb.create_sheet("2. Proposta prog. e criteri")
+    prop["A1"] = "2.   Presentazione della proposta progettuale"
+    row = 2
+    for i in range(n_criteria):
+        code = f"{'ABCD'[i % 4]}{i // 4 % 9 + 1}.{i % 3 + 1}"
+        prop.cell(row=row, column=1, value=f"CRITERIO {code} (fornire informazioni utili)")
+        prop.cell(row=row + 1, column=1, value=" " + text(text_size))
+        prop.cell(row=row + 3, column=1, value="NA" if i % 5 == 0 else text(text_size // 4))
+        prop.cell(row=row + 3, column=3, value=i)
+        row += 5
+
+    crit = wb.create_sheet("7.Criteri  di valutazione")
+    crit["A2"] = "Criteri di valutazione"
+    crit["B2"] = "Parametro"
+    row = 3
+    for i in range(n_criteria):
+        crit.cell(row=row, column=1, value=f"{'ABCD'[i % 4]}{i // 4 % 9 + 1}")
+        crit.cell(row=row, column=2, value=text(80))
+        crit.cell(row=row, column=4, value=10)
+        crit.cell(row=row + 1, column=1, value=0.5 + i)
+        row += 3
+
+    wb.save(path)
+    return path
+
+
+def make_criteria_workbook(path: Path, rows: int, sheets: int = 1, seed: int = 0) -> Path:
+    """Fogli che alternano ``CRITERIO A1.2`` + descrizione, ``B12 - descrizione`` e testo libero."""
+    from openpyxl import Workbook
+
+    rnd = random.Random(seed)
+    wb = Workbook(write_only=True)
+    for s in range(sheets):
+        ws = wb.create_sheet(f"Foglio{s + 1}")
+        r = 0
+        while r < rows:
+            roll = rnd.random()
+            if roll < 0.15:
+                ws.append([f"CRITERIO {rnd.choice('ABCD')}{rnd.randint(1, 9)}.{rnd.randint(1, 20)}", None, "note"])
+                ws.append([f"Descrizione del criterio alla riga {r + 2}", None, f"C{rnd.randint(1, 99)} - colonna C"])
+                r += 2
+                continue
+            if roll < 0.3:
+                ws.append([f"{rnd.choice('ABCD')}{rnd.randint(1, 99)} - requisito {r + 1}"])
+            elif roll < 0.4:
+                ws.append([None])
+            else:
+                ws.append([f"testo libero {rnd.randint(0, 10 ** 6)}", rnd.random()])
+            r += 1
+    wb.save(path)
+    return path
+
+
+def make_data_workbook(rows: int, columns: int = 8, sheets: int = 2, seed: int = 0) -> bytes:
+    """Workbook di testo e numeri misti, come un allegato di dati caricato nelle app."""
+    from openpyxl import Workbook
+
+    rnd = random.Random(seed)
+    wb = Workbook(write_only=True)
+    for s in range(sheets):
+        ws = wb.create_sheet(f"Dati{s + 1}")
+        ws.append([f"Colonna {c + 1}" for c in range(columns)])
+        for r in range(rows):
+            ws.append([_sentence(rnd, 4) if c % 2 == 0 else (None if rnd.random() < 0.1 else round(rnd.random() * 1000, 2))
+                       for c in range(columns)])
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+def make_financial_plan(path: Path, rows: int, columns: int = 60, sheets: int = 3, fill: float = 0.3,
+                        seed: int = 0) -> Path:
+    """Piano finanziario: etichetta di voce, anni in intestazione e importi sparsi (``fill`` = celle piene)."""
+    import datetime as dt
+
+    from openpyxl import Workbook
+
+    rnd = random.Random(seed)
+    wb = Workbook(write_only=True)
+    for s in range(sheets):
+        ws = wb.create_sheet(f"Piano {s + 1}")
+        ws.append(["Voce di spesa", "Data"] + [f"Anno {2025 + c}" for c in range(columns - 2)])
+        for r in range(rows):
+            row: List[object] = [f"{_sentence(rnd, 3)} {r}" if rnd.random() < 0.9 else None,
+                                 dt.date(2025, 1 + r % 12, 1) if r % 10 == 0 else None]
+            row += [round(rnd.random() * 10_000, 2) if rnd.random() < fill else None for _ in range(columns - 2)]
+            ws.append(row)
+            if r % 50 == 49:
+                ws.append([])  # righe vuote di separazione tra i blocchi
+    wb.save(path)
+    return path
+
+
+# ---------------------------------------------------------------------------
+# PDF e DOCX
+
+def _escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: int, lines_per_page: int = 45, seed: int = 0) -> bytes:
+    """PDF di ``pages`` pagine A4 con ``lines_per_page`` righe di testo ciascuna."""
+    rnd = random.Random(seed)
+    objects: List[Optional[bytes]] = [None, None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for p in range(pages):
+        lines = [f"Pagina {p + 1} - CRITERIO A{p + 1}.1 Requisiti del progetto"]
+        lines += [_sentence(rnd, 12) for _ in range(lines_per_page - 1)]
+        body = "BT /F1 10 Tf 12 TL 50 800 Td " + " ".join(f"({_escape(l)}) Tj T*" for l in lines) + " ET"
+        stream = body.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        page_ids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % i for i in page_ids) + b"] /Count %d >>" % pages
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + obj + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def make_docx(paragraphs: int, table_rows: int = 0, seed: int = 0, table_every: int = 0) -> bytes:
+    """Documento Word con un titolo ``CRITERIO`` ogni 10 paragrafi e, se richiesto, una tabella finale.
+
+    Con ``table_every`` ogni ``table_every`` paragrafi c'è anche una tabella di
+    budget nel corpo, con l'intestazione unita su tre colonne e la prima
+    colonna unita in verticale sulle righe di ogni voce.
+    """
+    import docx
+
+    rnd = random.Random(seed)
+    document = docx.Document()
+    for i in range(paragraphs):
+        if i % 10 == 0:
+            document.add_heading(f"CRITERIO {'ABCD'[i // 10 % 4]}{i // 40 + 1}.{i // 10 % 5 + 1}", level=2)
+        document.add_paragraph(_sentence(rnd, 60))
+        if table_every and i % table_every == table_every - 1:
+            budget = document.add_table(rows=7, cols=3)
+            budget.cell(0, 0).merge(budget.cell(0, 2)).text = f"Budget della sezione {i // table_every + 1}"
+            for r in range(1, 7):
+                budget.cell(r, 1).text = _sentence(rnd, 4)
+                budget.cell(r, 2).text = f"{rnd.random() * 1000:.2f}"
+            for r in (1, 4):
+                budget.cell(r, 0).merge(budget.cell(r + 2, 0)).text = f"Voce {r // 3 + 1}"
+    if table_rows:
+        table = document.add_table(rows=table_rows, cols=3)
+        for r, row in enumerate(table.rows):
+            row.cells[0].text = f"Voce {r + 1}"
+            row.cells[1].text = _sentence(rnd, 6)
+            row.cells[2].text = f"{rnd.random() * 1000:.2f}"
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
@@ -0,0 +1 @@
+"""Componenti condivisi dalle app AI (estrazione e matching dei criteri)."""
@@ -0,0 +1,162 @@
+"""Testo dei documenti Word letto direttamente da ``word/document.xml``.
+
+``parse_docx`` costruiva l'intero modello di python-docx, scriveva prima
+tutti i paragrafi e poi tutte le tabelle (perdendo l'ordine del documento) e
+ripeteva il testo delle celle unite, una volta per ogni colonna o riga che
+coprono. Qui l'XML viene letto in streaming con ``iterparse`` direttamente
+dallo zip: paragrafi e righe di tabella escono nell'ordine del corpo, ogni
+elemento concluso viene svuotato (memoria costante rispetto alla lunghezza
+del documento) e le celle unite compaiono una volta sola:
+
+- unione orizzontale (``gridSpan``): nell'XML è già una sola cella;
+- unione verticale (``vMerge`` di continuazione): la cella resta vuota, così
+  le colonne delle righe successive restano allineate.
+
+Ogni riga di tabella diventa una riga di testo con le celle separate da
+tabulazione; una tabella annidata finisce nel testo della cella che la
+contiene. Con ``headings`` i titoli sono preceduti da ``#`` ripetuto quanto il
+livello (da ``outlineLvl`` del paragrafo o dello stile, o dal nome di stile
+"heading N", che Word scrive in inglese anche nei documenti localizzati).
+"""
+from __future__ import annotations
+
+import io
+import re
+import zipfile
+from typing import Dict, Iterator, List, Optional
+from xml.etree.ElementTree import Element, iterparse
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+_P, _TBL, _TR, _TC, _BODY = W + "p", W + "tbl", W + "tr", W + "tc", W + "body"
+_T, _TAB, _BR, _CR, _HYPHEN = W + "t", W + "tab", W + "br", W + "cr", W + "noBreakHyphen"
+_VAL = W + "val"
+# Le caselle di testo sono scritte due volte (mc:Choice e, per i lettori vecchi, mc:Fallback)
+_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+_HEADING_NAME = re.compile(r"(?i)^heading\s*(\d)$")
+
+
+def heading_levels(styles_xml: bytes) -> Dict[str, int]:
+    """styleId → livello di titolo (1 = primo livello) per gli stili di paragrafo che ne hanno uno."""
+    levels: Dict[str, int] = {}
+    for _, style in iterparse(io.BytesIO(styles_xml)):
+        if style.tag != W + "style":
+            continue
+        style_id = style.get(W + "styleId")
+        outline = style.find(f"{W}pPr/{W}outlineLvl")
+        name = style.find(W + "name")
+        m = _HEADING_NAME.match(name.get(_VAL, "")) if name is not None else None
+        if style_id and outline is not None and outline.get(_VAL, "").isdigit() and int(outline.get(_VAL)) < 9:
+            levels[style_id] = int(outline.get(_VAL)) + 1
+        elif style_id and m:
+            levels[style_id] = int(m.group(1))
+        style.clear()
+    return levels
+
+
+def _paragraph_text(p: Element) -> str:
+    parts: List[str] = []
+    for el in p.iter():
+        tag = el.tag
+        if tag == _T:
+            if el.text:
+                parts.append(el.text)
+        elif tag == _TAB:
+            parts.append("\t")
+        elif tag in (_BR, _CR):
+            parts.append("\n")
+        elif tag == _HYPHEN:
+            parts.append("-")
+    return "".join(parts)
+
+
+def _heading_level(p: Element, levels: Dict[str, int]) -> Optional[int]:
+    ppr = p.find(W + "pPr")
+    if ppr is None:
+        return None
+    outline = ppr.find(W + "outlineLvl")
+    if outline is not None and outline.get(_VAL, "").isdigit() and int(outline.get(_VAL)) < 9:
+        return int(outline.get(_VAL)) + 1
+    style = ppr.find(W + "pStyle")
+    return levels.get(style.get(_VAL, "")) if style is not None else None
+
+
+def _is_merge_continuation(tc: Element) -> bool:
+    vmerge = tc.find(f"{W}tcPr/{W}vMerge")
+    return vmerge is not None and vmerge.get(_VAL, "continue") == "continue"
+
+
+def iter_blocks(document_xml: io.BufferedIOBase, levels: Optional[Dict[str, int]] = None) -> Iterator[str]:
+    """Paragrafi e righe di tabella del corpo, nell'ordine del documento (righe vuote escluse)."""
+    body: Optional[Element] = None
+    tables = 0  # profondità di tabella corrente
+    fallback = 0  # dentro mc:Fallback: contenuto duplicato, da saltare
+    cells: List[List[str]] = []  # testi delle celle aperte (la più interna in fondo)
+    rows: List[List[str]] = []  # celle delle righe aperte
+    for event, el in iterparse(document_xml, events=("start", "end")):
+        tag = el.tag
+        if event == "start":
+            if tag == _FALLBACK:
+                fallback += 1
+            elif fallback:
+                continue
+            elif tag == _TBL:
+                tables += 1
+            elif tag == _TR:
+                rows.append([])
+            elif tag == _TC:
+                cells.append([])
+            elif tag == _BODY:
+                body = el
+            continue
+
+        if tag == _FALLBACK:
+            fallback -= 1
+            el.clear()
+        elif fallback:
+            continue
+        elif tag == _P:
+            text = _paragraph_text(el).strip()
+            if text and levels is not None and not cells:
+                level = _heading_level(el, levels)
+                if level:
+                    text = f"{'#' * level} {text}"
+            el.clear()  # anche per i paragrafi annidati (caselle di testo): il padre non li rilegge
+            if not text:
+                continue
+            if cells:
+                cells[-1].append(" ".join(text.split()))
+            else:
+                yield text
+        elif tag == _TC:
+            texts = cells.pop()
+            rows[-1].append("" if _is_merge_continuation(el) else " ".join(texts))
+            el.clear()
+        elif tag == _TR:
+            row = rows.pop()
+            el.clear()
+            if not any(row):
+                continue
+            line = "\t".join(row).rstrip("\t")
+            if cells:  # riga di una tabella annidata: resta nella cella che la contiene
+                cells[-1].append(line.replace("\t", " "))
+            else:
+                yield line
+        elif tag == _TBL:
+            tables -= 1
+            el.clear()
+        if body is not None and not cells and not tables and tag in (_P, _TBL):
+            body.clear()  # i figli già letti del corpo non servono più
+
+
+def extract_docx_text(data: bytes, headings: bool = False) -> str:
+    """Testo del documento, un blocco (paragrafo o riga di tabella) per riga."""
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        levels: Optional[Dict[str, int]] = None
+        if headings:
+            try:
+                levels = heading_levels(archive.read("word/styles.xml"))
+            except KeyError:
+                levels = {}
+        with archive.open("word/document.xml") as document_xml:
+            return "\n".join(iter_blocks(document_xml, levels))
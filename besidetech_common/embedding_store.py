@@ -0,0 +1,168 @@
+"""Vettori dei passaggi di un documento, calcolati una volta e tenuti su disco.
+
+Gli stessi documenti dei richiedenti vengono confrontati con più insiemi di
+criteri durante un bando: invece di reinviare ogni volta il documento intero,
+i passaggi vengono incorporati una sola volta con l'API embeddings e salvati
+come matrice float32 (righe normalizzate, quindi il coseno è un prodotto
+scalare) in un file ``<chiave>.f32`` letto con ``np.memmap``, più un file
+``<chiave>.json`` con modello, dimensioni e posizione dei passaggi.
+
+La chiave è lo SHA-256 del testo più un hash di modello e parametri di
+suddivisione. Il file JSON viene scritto per ultimo e fa da segno di
+completamento: una matrice senza il suo JSON (processo interrotto) non viene
+mai letta. Oltre ``max_bytes`` si eliminano le voci usate meno di recente.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Da incrementare quando cambia il formato dei file
+STORE_VERSION = 1
+
+DEFAULT_DIR = Path(os.getenv("BESIDETECH_CACHE_DIR", Path.home() / ".cache" / "besidetech")) / "embeddings"
+DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
+
+
+def text_key(text: str, **params: Any) -> str:
+    """``<sha256 del testo>-<hash dei parametri>``: lo stesso testo con un altro modello è un'altra voce."""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    canonical = json.dumps(dict(params, version=STORE_VERSION), sort_keys=True, separators=(",", ":"), default=str)
+    return f"{digest}-{hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]}"
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def embed_texts(create: Callable[..., Any], texts: Sequence[str], model: str = DEFAULT_EMBEDDING_MODEL,
+                batch_size: int = 256, workers: int = 4) -> np.ndarray:
+    """Matrice ``(len(texts), dim)`` di vettori normalizzati; ``create`` è ``client.embeddings.create``.
+
+    I testi sono inviati a blocchi di ``batch_size`` (fino a ``workers`` richieste
+    in parallelo); i vettori seguono l'ordine dei testi.
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    batches = [list(texts[i:i + batch_size]) for i in range(0, len(texts), max(1, batch_size))]
+
+    def run(batch: List[str]) -> np.ndarray:
+        # Il testo vuoto non è accettato dall'API
+        response = create(model=model, input=[t if t.strip() else " " for t in batch])
+        rows = sorted(response.data, key=lambda item: item.index)
+        if len(rows) != len(batch):
+            raise ValueError(f"L'API embeddings ha restituito {len(rows)} vettori per {len(batch)} testi")
+        return np.asarray([row.embedding for row in rows], dtype=np.float32)
+
+    if len(batches) == 1:
+        return normalize_rows(run(batches[0]))
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches)))) as pool:
+        return normalize_rows(np.concatenate(list(pool.map(run, batches))))
+
+
+@dataclass
+class StoredEmbeddings:
+    key: str
+    vectors: np.ndarray  # (righe, dim) float32, mappata in sola lettura
+    meta: Dict[str, Any]
+
+
+class EmbeddingStore:
+    """Matrici ``.f32`` mappate in memoria con il JSON di metadati accanto (LRU per mtime)."""
+
+    def __init__(self, directory: Path = DEFAULT_DIR, max_bytes: int = 2 * 1024 * 1024 * 1024) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _paths(self, key: str):
+        return self.directory / f"{key}.f32", self.directory / f"{key}.json"
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> Optional[StoredEmbeddings]:
+        stored = self._load(key)
+        self._count(stored is not None)
+        return stored
+
+    def _load(self, key: str) -> Optional[StoredEmbeddings]:
+        matrix_path, meta_path = self._paths(key)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            rows, dim = int(meta["rows"]), int(meta["dim"])
+            if meta.get("version") != STORE_VERSION or matrix_path.stat().st_size != rows * dim * 4:
+                raise ValueError(key)
+            vectors = (np.memmap(matrix_path, dtype="<f4", mode="r", shape=(rows, dim)) if rows * dim
+                       else np.zeros((rows, dim), dtype=np.float32))
+            os.utime(meta_path)  # segna l'uso per l'LRU
+        except (OSError, ValueError, KeyError, TypeError):
+            return None  # assente, scritta a metà o di un'altra versione
+        return StoredEmbeddings(key, vectors, meta)
+
+    def put(self, key: str, vectors: np.ndarray, **meta: Any) -> StoredEmbeddings:
+        """Salva la matrice e restituisce la voce mappata (o in memoria se il disco non è scrivibile)."""
+        vectors = np.ascontiguousarray(vectors, dtype="<f4")
+        rows, dim = vectors.shape if vectors.ndim == 2 else (0, 0)
+        meta = dict(meta, version=STORE_VERSION, rows=rows, dim=dim, created_at=time.time())
+        matrix_path, meta_path = self._paths(key)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        matrix_tmp, meta_tmp = matrix_path.with_suffix(suffix), meta_path.with_suffix(".json" + suffix)
+        try:
+            vectors.tofile(matrix_tmp)
+            os.replace(matrix_tmp, matrix_path)
+            meta_tmp.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+            os.replace(meta_tmp, meta_path)
+        except OSError:
+            matrix_tmp.unlink(missing_ok=True)
+            meta_tmp.unlink(missing_ok=True)
+            return StoredEmbeddings(key, vectors, meta)
+        self._evict()
+        stored = self._load(key)
+        return stored if stored is not None else StoredEmbeddings(key, vectors, meta)
+
+    def _evict(self) -> None:
+        entries = []
+        for meta_path in self.directory.glob("*.json"):
+            matrix_path = meta_path.with_suffix(".f32")
+            try:
+                used = meta_path.stat().st_mtime
+                size = meta_path.stat().st_size + (matrix_path.stat().st_size if matrix_path.exists() else 0)
+            except OSError:
+                continue
+            entries.append((used, size, meta_path, matrix_path))
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, meta_path, matrix_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            meta_path.unlink(missing_ok=True)  # prima il JSON: la voce smette subito di essere valida
+            matrix_path.unlink(missing_ok=True)
+            total -= size
+
+    def stats(self) -> Dict[str, int]:
+        files = list(self.directory.glob("*.json"))
+        size = sum(p.stat().st_size for p in self.directory.glob("*.f32") if p.exists())
+        return {"entries": len(files), "bytes": size}
+
+    def clear(self) -> None:
+        for pattern in ("*.json", "*.f32", "*.tmp"):
+            for path in self.directory.glob(pattern):
+                path.unlink(missing_ok=True)
@@ -0,0 +1,151 @@
+"""Testo dei workbook Excel letto riga per riga, con memoria limitata.
+
+``parse_excel`` caricava ogni foglio in un DataFrame, convertiva ogni colonna
+in stringhe (celle vuote comprese, che diventavano "nan") e concatenava il
+risultato: sui piani finanziari da 50-100 MB la memoria cresceva di gigabyte.
+Qui i fogli ``.xlsx`` sono aperti con openpyxl in sola lettura e letti con
+``iter_rows`` (l'XML del foglio non viene mai caricato per intero); i ``.xls``
+con xlrd, un foglio alla volta. Ne risulta un testo con un'intestazione per
+foglio e una riga per ogni riga non vuota, con le celle separate da
+tabulazione; celle vuote, solo spazi e NaN vengono saltate.
+
+Oltre ``max_rows`` righe non vuote o ``max_cells`` celle non vuote per foglio
+il resto del foglio non viene letto e il testo riporta un avviso.
+"""
+from __future__ import annotations
+
+import datetime as dt
+import io
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_MAX_ROWS = int(os.getenv("BESIDETECH_EXCEL_MAX_ROWS", 20_000))
+DEFAULT_MAX_CELLS = int(os.getenv("BESIDETECH_EXCEL_MAX_CELLS", 200_000))
+
+_OLE_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"  # .xls (BIFF in un contenitore OLE)
+
+
+@dataclass
+class ExcelText:
+    text: str
+    sheets: int = 0
+    rows: int = 0  # righe non vuote lette
+    cells: int = 0  # celle non vuote lette
+    warnings: List[str] = field(default_factory=list)
+
+
+def cell_text(value: Any) -> Optional[str]:
+    """Testo della cella, oppure ``None`` se vuota (None, NaN, stringa di soli spazi)."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        text = " ".join(value.split())  # a capo e tabulazioni interne non devono rompere la riga
+        return text or None
+    if isinstance(value, bool):
+        return "VERO" if value else "FALSO"
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return None
+        return str(int(value)) if value.is_integer() and abs(value) < 1e15 else repr(value)
+    if isinstance(value, dt.datetime):
+        return value.date().isoformat() if value.time() == dt.time() else value.isoformat(sep=" ")
+    if isinstance(value, (dt.date, dt.time)):
+        return value.isoformat()
+    return " ".join(str(value).split()) or None
+
+
+def _xlsx_sheets(data: bytes) -> Iterator[Tuple[str, Iterator[Sequence[Any]]]]:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(io.BytesIO(data), read_only=True, data_only=True, keep_links=False)
+    try:
+        for ws in wb.worksheets:
+            yield ws.title, ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _xls_sheets(data: bytes) -> Iterator[Tuple[str, Iterator[Sequence[Any]]]]:
+    import xlrd
+
+    book = xlrd.open_workbook(file_contents=data, on_demand=True)
+    try:
+        for index in range(book.nsheets):
+            sheet = book.sheet_by_index(index)
+            yield sheet.name, _xls_rows(book, sheet)
+            book.unload_sheet(index)
+    finally:
+        book.release_resources()
+
+
+def _xls_rows(book: Any, sheet: Any) -> Iterator[List[Any]]:
+    import xlrd
+
+    for r in range(sheet.nrows):
+        values: List[Any] = []
+        for cell in sheet.row(r):
+            if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+                values.append(None)
+            elif cell.ctype == xlrd.XL_CELL_DATE:
+                try:
+                    values.append(xlrd.xldate_as_datetime(cell.value, book.datemode))
+                except (ValueError, OverflowError):
+                    values.append(cell.value)
+            elif cell.ctype == xlrd.XL_CELL_BOOLEAN:
+                values.append(bool(cell.value))
+            else:
+                values.append(cell.value)
+        yield values
+
+
+def iter_sheet_lines(rows: Iterator[Sequence[Any]], max_rows: Optional[int] = None,
+                     max_cells: Optional[int] = None) -> Iterator[Tuple[int, str, int]]:
+    """``(numero di riga, testo, celle)`` delle righe non vuote; si ferma ai limiti (``None`` = nessun limite)."""
+    read_rows = read_cells = 0
+    for number, values in enumerate(rows, start=1):
+        cells = [text for text in map(cell_text, values) if text is not None]
+        if not cells:
+            continue
+        if max_cells is not None and read_cells + len(cells) > max_cells:
+            cells = cells[:max_cells - read_cells]
+        yield number, "\t".join(cells), len(cells)
+        read_rows += 1
+        read_cells += len(cells)
+        if (max_rows is not None and read_rows >= max_rows) or (max_cells is not None and read_cells >= max_cells):
+            return
+
+
+def _has_more_text(rows: Iterator[Sequence[Any]]) -> bool:
+    """Vero se nelle righe rimaste c'è almeno una cella con testo (le righe vuote, anche se formattate, non contano)."""
+    return any(cell_text(value) is not None for values in rows for value in values)
+
+
+def extract_excel_text(data: bytes, max_rows: Optional[int] = DEFAULT_MAX_ROWS,
+                       max_cells: Optional[int] = DEFAULT_MAX_CELLS, row_numbers: bool = False) -> ExcelText:
+    """Testo di un ``.xlsx``/``.xlsm`` o ``.xls`` (riconosciuto dai primi byte).
+
+    Ogni foglio inizia con ``[Foglio: <nome>]``; con ``row_numbers`` ogni riga
+    è preceduta dal suo numero nel foglio (``R12:``).
+    """
+    sheets = _xls_sheets(data) if data[:8] == _OLE_MAGIC else _xlsx_sheets(data)
+    result = ExcelText("")
+    parts: List[str] = []
+    for name, rows in sheets:
+        result.sheets += 1
+        parts.append(f"[Foglio: {name}]")
+        sheet_rows = sheet_cells = 0
+        for number, line, cells in iter_sheet_lines(rows, max_rows, max_cells):
+            parts.append(f"R{number}: {line}" if row_numbers else line)
+            sheet_rows += 1
+            sheet_cells += cells
+        result.rows += sheet_rows
+        result.cells += sheet_cells
+        if (max_rows is not None and sheet_rows >= max_rows) or (max_cells is not None and sheet_cells >= max_cells):
+            if _has_more_text(rows):  # il foglio continua oltre il limite
+                result.warnings.append(f"Foglio '{name}': raggiunto il limite di lettura ({sheet_rows:,} righe, "
+                                       f"{sheet_cells:,} celle non vuote), il resto del foglio non è stato letto.")
+        parts.append("")
+    result.text = "\n".join(parts).strip()
+    return result
@@ -0,0 +1,195 @@
+"""Estrazione del testo dai file caricati, con cache indirizzata per contenuto.
+
+Streamlit riesegue l'intero script a ogni interazione: senza cache lo stesso
+PDF/Excel/DOCX verrebbe riletto a ogni modifica di un widget. ``ingest`` usa
+come chiave lo SHA-256 dei byte (più formato e versione del parser) e cerca
+il testo prima in memoria, poi su disco; entrambi i livelli eliminano le voci
+usate meno di recente oltre il proprio limite di dimensione.
+
+I parser pesanti (PyPDF2, openpyxl/xlrd) sono importati solo quando serve il
+formato corrispondente; i DOCX sono letti direttamente dall'XML (``docx_text``).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Da incrementare quando cambia il testo prodotto da un parser
+PARSER_VERSION = 3
+
+DEFAULT_DIR = Path(os.getenv("BESIDETECH_CACHE_DIR", Path.home() / ".cache" / "besidetech")) / "ingestion"
+
+
+@dataclass
+class Document:
+    text: str
+    page_offsets: Optional[List[int]] = None  # solo per i PDF
+    warnings: List[str] = field(default_factory=list)
+
+
+def parse_pdf(data: bytes, workers: Optional[int] = None) -> Document:
+    from besidetech_common.pdf_text import extract_pdf_text
+
+    pdf = extract_pdf_text(data, workers=workers)
+    warnings = [f"Pagina {page} del PDF non leggibile: {error}" for page, error in pdf.errors]
+    return Document(pdf.text, pdf.page_offsets, warnings)
+
+
+def parse_excel(data: bytes) -> Document:
+    """Righe non vuote di ogni foglio lette in streaming, entro i limiti di ``excel_text``."""
+    from besidetech_common.excel_text import extract_excel_text
+
+    excel = extract_excel_text(data)
+    return Document(excel.text, warnings=excel.warnings)
+
+
+def parse_docx(data: bytes) -> Document:
+    """Paragrafi e righe di tabella nell'ordine del documento, titoli marcati con ``#``."""
+    from besidetech_common.docx_text import extract_docx_text
+
+    return Document(extract_docx_text(data, headings=True))
+
+
+PARSERS: Dict[str, Callable[[bytes], Document]] = {
+    "pdf": parse_pdf,
+    "excel": parse_excel,
+    "docx": parse_docx,
+}
+
+
+def file_kind(file_name: str) -> Optional[str]:
+    name = file_name.lower()
+    if name.endswith(".pdf"):
+        return "pdf"
+    if name.endswith((".xlsx", ".xls")):
+        return "excel"
+    if name.endswith(".docx"):
+        return "docx"
+    return None
+
+
+def content_key(data: bytes, kind: str) -> str:
+    key = f"{hashlib.sha256(data).hexdigest()}-{kind}-v{PARSER_VERSION}"
+    if kind == "excel":  # i limiti di lettura cambiano il testo
+        from besidetech_common.excel_text import DEFAULT_MAX_CELLS, DEFAULT_MAX_ROWS
+
+        key += f"-r{DEFAULT_MAX_ROWS}c{DEFAULT_MAX_CELLS}"
+    return key
+
+
+class IngestionCache:
+    """Cache a due livelli: dizionario LRU in memoria e file JSON su disco (LRU per mtime)."""
+
+    def __init__(self, directory: Optional[Path] = DEFAULT_DIR, memory_bytes: int = 64 * 1024 * 1024,
+                 disk_bytes: int = 1024 * 1024 * 1024) -> None:
+        self.directory = Path(directory) if directory is not None else None
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory: "OrderedDict[str, Tuple[Document, int]]" = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+    def _disk_path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Document]:
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                self._memory.move_to_end(key)
+                self.hits["memory"] += 1
+                return cached[0]
+        if self.directory is not None:
+            path = self._disk_path(key)
+            try:
+                doc = Document(**json.loads(path.read_text(encoding="utf-8")))
+                os.utime(path)  # segna l'uso per l'LRU su disco
+            except (OSError, ValueError, TypeError):
+                doc = None  # assente, o scritto a metà da un processo interrotto
+            if doc is not None:
+                with self._lock:
+                    self.hits["disk"] += 1
+                self._remember(key, doc)
+                return doc
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, doc: Document) -> None:
+        self._remember(key, doc)
+        if self.directory is None:
+            return
+        path = self._disk_path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp.write_text(json.dumps(asdict(doc), ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, path)
+            self._evict_disk()
+        except OSError:
+            tmp.unlink(missing_ok=True)  # disco pieno o non scrivibile: resta la cache in memoria
+
+    def _remember(self, key: str, doc: Document) -> None:
+        size = len(doc.text) + 8 * len(doc.page_offsets or [])
+        with self._lock:
+            if key in self._memory:
+                self._memory_size -= self._memory.pop(key)[1]
+            self._memory[key] = (doc, size)
+            self._memory_size += size
+            while self._memory_size > self.memory_bytes and len(self._memory) > 1:
+                self._memory_size -= self._memory.popitem(last=False)[1][1]
+
+    def _evict_disk(self) -> None:
+        files = []
+        for path in self.directory.glob("*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+        if self.directory is not None:
+            for path in self.directory.glob("*.json"):
+                path.unlink(missing_ok=True)
+
+
+def ingest(data: bytes, file_name: str, cache: Optional[IngestionCache] = None,
+           pdf_workers: Optional[int] = None) -> Tuple[Document, bool]:
+    """Testo del file e ``True`` se servito dalla cache.
+
+    Solleva ``ValueError`` per i formati non supportati e lascia passare le
+    eccezioni del parser per i file illeggibili (che non vengono messi in cache).
+    ``pdf_workers`` limita i processi usati per i PDF (1 = nessun pool, utile
+    quando più documenti sono già elaborati in parallelo).
+    """
+    kind = file_kind(file_name)
+    if kind is None:
+        raise ValueError(f"Formato file non supportato: {file_name}")
+    key = content_key(data, kind)
+    if cache is not None:
+        doc = cache.get(key)
+        if doc is not None:
+            return doc, True
+    doc = parse_pdf(data, pdf_workers) if kind == "pdf" else PARSERS[kind](data)
+    if cache is not None:
+        cache.put(key, doc)
+    return doc, False
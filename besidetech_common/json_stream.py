@@ -0,0 +1,118 @@
+"""Parsing incrementale della risposta JSON di un modello in streaming.
+
+Le risposte delle app hanno la forma ``{"criteri": [{...}, {...}]}`` (o
+direttamente una lista). ``ArrayItemParser`` riceve il testo a pezzi, così
+come arriva dallo stream, e restituisce ogni oggetto della lista appena la
+sua parentesi di chiusura è arrivata, senza riparsare il testo già visto.
+``stream_array_items`` collega il parser a ``create(stream=True)``: se lo
+stream si interrompe gli elementi già restituiti restano validi e l'errore
+finisce in ``StreamOutcome``.
+"""
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+_STRUCTURAL = re.compile(r'[{}\[\]"\\]')
+
+Note = Tuple[str, str]  # (livello "info"/"warning", messaggio)
+
+
+class ArrayItemParser:
+    """Estrae gli elementi della prima lista JSON (al primo o al secondo livello) man mano che si completano."""
+
+    def __init__(self) -> None:
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._target: Optional[int] = None  # profondità della lista da cui estrarre gli elementi
+        self._target_open = False
+        self._item: List[str] = []  # pezzi dell'elemento in corso
+        self._item_open = False
+        self.items = 0
+
+    def feed(self, chunk: str) -> List[Any]:
+        completed: List[Any] = []
+        start = 0 if self._item_open else None
+        skip_until = 0
+        if self._escape:
+            self._escape = False
+            skip_until = 1
+        for m in _STRUCTURAL.finditer(chunk):
+            pos = m.start()
+            if pos < skip_until:
+                continue
+            char = m.group()
+            if self._in_string:
+                if char == "\\":
+                    if pos + 1 == len(chunk):
+                        self._escape = True
+                    skip_until = pos + 2
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if (char == "[" and self._target is None and len(self._stack) <= 1
+                        and (not self._stack or self._stack[0] == "{")):
+                    self._target, self._target_open = len(self._stack) + 1, True
+                elif char == "{" and self._target_open and len(self._stack) == self._target:
+                    self._item_open, start = True, pos
+                self._stack.append(char)
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if char == "]" and self._target_open and len(self._stack) == self._target - 1:
+                    self._target_open = False
+                if char == "}" and self._item_open and len(self._stack) == self._target:
+                    self._item.append(chunk[start:pos + 1])
+                    text, self._item, self._item_open, start = "".join(self._item), [], False, None
+                    try:
+                        completed.append(json.loads(text))
+                        self.items += 1
+                    except ValueError:
+                        pass  # elemento malformato: lo scarta il parsing finale
+        if self._item_open and start is not None:
+            self._item.append(chunk[start:])
+        return completed
+
+
+@dataclass
+class StreamOutcome:
+    content: str = ""
+    finish_reason: Optional[str] = None
+    error: Optional[str] = None
+    notes: List[Note] = field(default_factory=list)
+
+    @property
+    def complete(self) -> bool:
+        return self.error is None and self.finish_reason == "stop"
+
+
+def stream_array_items(create: Callable[..., Any], outcome: StreamOutcome, **params: Any) -> Iterator[Any]:
+    """Chiama ``create(stream=True, **params)`` e restituisce gli elementi della lista appena completi.
+
+    Gli errori della chiamata iniziale (autenticazione, connessione, contesto)
+    vengono sollevati; quelli a stream avviato sono registrati in ``outcome``.
+    """
+    stream = create(stream=True, **params)
+    parser = ArrayItemParser()
+    parts: List[str] = []
+    try:
+        for chunk in stream:
+            for choice in chunk.choices:
+                if choice.index != 0:
+                    continue
+                piece = choice.delta.content if choice.delta is not None else None
+                if piece:
+                    parts.append(piece)
+                    yield from parser.feed(piece)
+                if choice.finish_reason:
+                    outcome.finish_reason = choice.finish_reason
+    except Exception as exc:
+        outcome.error = f"{type(exc).__name__}: {exc}"
+    finally:
+        outcome.content = "".join(parts)
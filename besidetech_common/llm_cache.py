@@ -0,0 +1,239 @@
+"""Cache su disco (SQLite) delle risposte OpenAI, indirizzata per contenuto.
+
+La chiave è lo SHA-256 della richiesta canonica (modello, messaggi, temperatura,
+formato di risposta e ogni altro parametro), quindi lo stesso file analizzato
+con lo stesso prompt e gli stessi parametri riceve la stessa risposta senza
+rifare la chiamata. Ogni voce conserva la risposta grezza e l'uso di token.
+Le voci più vecchie di ``max_age_days`` vengono eliminate e, oltre
+``max_entries`` o ``max_bytes``, si eliminano quelle usate meno di recente.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+DEFAULT_PATH = Path(os.getenv("BESIDETECH_CACHE_DIR", Path.home() / ".cache" / "besidetech")) / "llm_cache.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT,
+    response TEXT NOT NULL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+def request_key(params: Dict[str, Any]) -> str:
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path: Path = DEFAULT_PATH, max_entries: int = 5000, max_bytes: int = 512 * 1024 * 1024,
+                 max_age_days: float = 30.0) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(_SCHEMA)
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.max_age:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._db.execute("UPDATE responses SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+        return row[0]
+
+    def put(self, key: str, response: str, model: str = "", usage: Optional[Dict[str, int]] = None) -> None:
+        usage = usage or {}
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, prompt_tokens, completion_tokens, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, response, usage.get("prompt_tokens"), usage.get("completion_tokens"),
+                 len(response.encode("utf-8")), now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age,))
+        self._db.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        self._db.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM ("
+            "SELECT key, SUM(size) OVER (ORDER BY last_access DESC) AS running FROM responses) WHERE running > ?)",
+            (self.max_bytes,),
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.execute("VACUUM")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries, size, tokens = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(prompt_tokens + completion_tokens), 0) FROM responses"
+            ).fetchone()
+        return {"entries": entries, "bytes": size, "tokens": tokens}
+
+
+class CachedCompletions:
+    """Stessa firma di ``client.chat.completions.create``, con la cache davanti.
+
+    Con ``bypass`` la cache non viene letta ma la nuova risposta la aggiorna.
+    Le richieste ``stream=True`` condividono la voce con quelle senza stream.
+    ``hits`` e ``misses`` contano le chiamate servite da questa istanza.
+    """
+
+    def __init__(self, client: Any, cache: Optional[ResponseCache], bypass: bool = False) -> None:
+        self.client = client
+        self.cache = cache
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def create(self, **params: Any) -> Any:
+        if self.cache is None:
+            return self.client.chat.completions.create(**params)
+        if params.get("stream"):
+            return self._create_stream(params)
+
+        from openai.types.chat import ChatCompletion
+
+        key = request_key(params)
+        if not self.bypass:
+            raw = self.cache.get(key)
+            if raw is not None:
+                self._count(True)
+                return ChatCompletion.model_validate_json(raw)
+
+        response = self.client.chat.completions.create(**params)
+        self._count(False)
+        if any(choice.finish_reason == "length" for choice in response.choices):
+            return response  # risposta troncata: non va riproposta
+        usage = response.usage.model_dump() if response.usage is not None else None
+        self.cache.put(key, response.model_dump_json(), params.get("model", ""), usage)
+        return response
+
+    def _create_stream(self, params: Dict[str, Any]) -> Iterator[Any]:
+        """Con ``stream=True``: la stessa chiave della richiesta senza stream, servita come stream sintetico."""
+        key = request_key({k: v for k, v in params.items() if k not in ("stream", "stream_options")})
+        if not self.bypass:
+            raw = self.cache.get(key)
+            if raw is not None:
+                self._count(True)
+                return _replay(raw)
+        stream = self.client.chat.completions.create(**params)
+        self._count(False)
+        return self._record(key, params.get("model", ""), stream)
+
+    def _record(self, key: str, model: str, stream: Iterable[Any]) -> Iterator[Any]:
+        parts: List[str] = []
+        finish_reason = None
+        usage = None
+        last = None
+        for chunk in stream:
+            last = chunk
+            for choice in chunk.choices:
+                if choice.index == 0:
+                    if choice.delta is not None and choice.delta.content:
+                        parts.append(choice.delta.content)
+                    finish_reason = choice.finish_reason or finish_reason
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage.model_dump()
+            yield chunk
+        if last is None or finish_reason != "stop":
+            return  # stream interrotto o troncato: non va riproposto
+        completion = {
+            "id": last.id, "object": "chat.completion", "created": last.created, "model": last.model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(parts)}, "finish_reason": finish_reason}],
+            "usage": usage,
+        }
+        self.cache.put(key, json.dumps(completion, ensure_ascii=False), model, usage)
+
+
+class AsyncCachedCompletions:
+    """Come ``CachedCompletions`` per ``AsyncOpenAI``: ``await create(**params)``, senza stream.
+
+    Usa le stesse chiavi, quindi condivide le voci con le chiamate sincrone;
+    letture e scritture su SQLite girano in un thread per non bloccare il loop.
+    """
+
+    def __init__(self, client: Any, cache: Optional[ResponseCache], bypass: bool = False) -> None:
+        self.client = client
+        self.cache = cache
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+
+    async def create(self, **params: Any) -> Any:
+        if params.get("stream"):
+            raise ValueError("AsyncCachedCompletions non supporta stream=True")
+        if self.cache is None:
+            return await self.client.chat.completions.create(**params)
+
+        import asyncio
+
+        from openai.types.chat import ChatCompletion
+
+        key = request_key(params)
+        if not self.bypass:
+            raw = await asyncio.to_thread(self.cache.get, key)
+            if raw is not None:
+                self.hits += 1
+                return ChatCompletion.model_validate_json(raw)
+
+        response = await self.client.chat.completions.create(**params)
+        self.misses += 1
+        if any(choice.finish_reason == "length" for choice in response.choices):
+            return response  # risposta troncata: non va riproposta
+        usage = response.usage.model_dump() if response.usage is not None else None
+        await asyncio.to_thread(self.cache.put, key, response.model_dump_json(), params.get("model", ""), usage)
+        return response
+
+
+def _replay(raw: str) -> Iterator[Any]:
+    """Una risposta in cache come stream di un solo pezzo (``ChatCompletionChunk``)."""
+    from openai.types.chat import ChatCompletionChunk
+
+    completion = json.loads(raw)
+    yield ChatCompletionChunk.model_validate({
+        "id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"],
+        "model": completion["model"],
+        "choices": [{"index": c["index"], "delta": {"role": "assistant", "content": c["message"]["content"]},
+                     "finish_reason": c["finish_reason"]} for c in completion["choices"]],
+    })
@@ -0,0 +1,299 @@
+"""Server locale compatibile con l'API OpenAI, per test e benchmark senza rete.
+
+    python -m besidetech_common.mock_openai --port 8900 --latency 0.3 --token-latency 0.005
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 streamlit run criteria_extractor_ai/criteri_extractor_ai.py
+
+Risponde a ``POST /v1/chat/completions`` in modo deterministico: ai prompt
+dell'estrattore restituisce un criterio per ogni riga del messaggio utente che
+inizia con ``CRITERIO <codice>`` (o ``Art. <n>``); ai prompt del matcher
+(``CRITERI A CUI RISPONDERE:``) una risposta per ogni criterio ricevuto.
+La latenza simula la generazione: ``latency + token_latency`` per ogni token
+di output; con ``"stream": true`` la risposta arriva a pezzi come eventi SSE.
+Oltre ``context_limit`` token (prompt più ``max_tokens``) risponde 400
+``context_length_exceeded`` e oltre ``max_tokens`` token di output tronca la
+risposta con ``finish_reason: "length"``, come l'API reale. ``GET /stats`` restituisce i contatori.
+
+``POST /v1/embeddings`` restituisce vettori deterministici (feature hashing
+delle parole, ``dimensions`` di default 256), in formato ``float`` o
+``base64`` come l'API: testi con parole in comune hanno coseno più alto.
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from besidetech_common.tokens import CHARS_PER_TOKEN, estimate_tokens
+
+RE_MOCK_WORD = re.compile(r"\w{3,}", re.UNICODE)
+DEFAULT_EMBEDDING_DIMENSIONS = 256
+RE_MOCK_CRITERION = re.compile(r"^\s*(?:CRITERIO\s+([A-Z]\d+(?:\.\d+)*)|(Art\.\s*\d+))\s*[-:.)]?\s*(.*)$", re.IGNORECASE)
+
+
+class MockConfig:
+    def __init__(self, latency: float = 0.05, token_latency: float = 0.0, context_limit: int = 128_000,
+                 fail_rate: float = 0.0, seed: Optional[int] = None, answer_tokens: int = 0) -> None:
+        self.latency = latency
+        self.answer_tokens = answer_tokens  # lunghezza minima (circa) di ogni risposta del matcher
+        self.token_latency = token_latency
+        self.context_limit = context_limit
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats: Dict[str, int] = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "errors": 0}
+
+    def count(self, **values: int) -> None:
+        with self.lock:
+            for key, n in values.items():
+                self.stats[key] = self.stats.get(key, 0) + n
+
+
+def extraction_answer(user_text: str) -> Dict[str, Any]:
+    """Criteri trovati riga per riga nel testo, nel formato chiesto dal SYSTEM_PROMPT dell'estrattore."""
+    criteri: List[Dict[str, str]] = []
+    lines = user_text.splitlines()
+    for idx, line in enumerate(lines):
+        m = RE_MOCK_CRITERION.match(line)
+        if not m:
+            continue
+        code = (m.group(1) or m.group(2)).upper()
+        descr = m.group(3).strip()
+        if not descr:
+            descr = next((l.strip() for l in lines[idx + 1:] if l.strip()), "")
+        criteri.append({"criterio_id": code, "descrizione": descr})
+    return {"criteri": criteri}
+
+
+def matching_answer(user_text: str, answer_tokens: int = 0) -> Dict[str, Any]:
+    """Una risposta per criterio, che riporta quanto testo del documento è stato ricevuto.
+
+    Con ``answer_tokens`` ogni risposta viene allungata fino a circa quei token,
+    per simulare le risposte argomentate del modello reale.
+    """
+    head, _, document = user_text.partition("\n\n")
+    criteria_json = head.split(":", 1)[1] if ":" in head else "[]"
+    try:
+        criteria = json.loads(criteria_json)
+    except ValueError:
+        criteria = []
+    pages = sorted(set(re.findall(r"pagina (\d+)\]", document)), key=int)
+    risultati = []
+    padding = " Il documento descrive interventi e risultati attesi." * max(0, int(answer_tokens * CHARS_PER_TOKEN) // 52)
+    for item in criteria if isinstance(criteria, list) else []:
+        if not isinstance(item, dict):
+            continue
+        risultati.append({
+            "criterio_id": item.get("criterio_id", ""),
+            "descrizione_guida": item.get("descrizione_guida", ""),
+            "risposta_al_criterio_dal_documento": (
+                f"Risposta simulata basata su {len(document)} caratteri del documento"
+                + (f" (pagine {', '.join(pages)})." if pages else ".") + padding
+            ),
+        })
+    return {"risultati": risultati}
+
+
+def build_answer(messages: List[Dict[str, Any]], answer_tokens: int = 0) -> Dict[str, Any]:
+    user_text = "\n".join(str(m.get("content") or "") for m in messages if m.get("role") == "user")
+    if user_text.startswith("CRITERI A CUI RISPONDERE:"):
+        return matching_answer(user_text, answer_tokens)
+    return extraction_answer(user_text)
+
+
+def embedding_vector(text: str, dimensions: int = DEFAULT_EMBEDDING_DIMENSIONS) -> np.ndarray:
+    """Vettore normalizzato delle parole del testo, ognuna su una coordinata scelta dal suo CRC32."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in RE_MOCK_WORD.findall(text.lower()):
+        h = zlib.crc32(word.encode("utf-8"))
+        vector[h % dimensions] += 1.0 if h & 0x80000000 else -1.0
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: MockConfig
+
+    def log_message(self, fmt: str, *args: Any) -> None:
+        pass
+
+    def _reply(self, status: int, body: Dict[str, Any]) -> None:
+        raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _error(self, status: int, message: str, code: str, kind: str = "invalid_request_error") -> None:
+        self.config.count(errors=1)
+        self._reply(status, {"error": {"message": message, "type": kind, "param": None, "code": code}})
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/").endswith("/stats"):
+            with self.config.lock:
+                self._reply(200, dict(self.config.stats))
+        else:
+            self._error(404, "not found", "not_found")
+
+    def do_POST(self) -> None:
+        raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        try:
+            request = json.loads(raw or b"{}")
+        except ValueError:
+            self._error(400, "invalid json body", "invalid_json")
+            return
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            self._chat(request)
+        elif self.path.rstrip("/").endswith("/embeddings"):
+            self._embeddings(request)
+        else:
+            self._error(404, f"unknown path {self.path}", "not_found")
+
+    def _usage(self, messages: List[Dict[str, Any]], content: str) -> Tuple[int, int]:
+        prompt = sum(estimate_tokens(str(m.get("content") or "")) for m in messages)
+        return prompt, estimate_tokens(content)
+
+    def _chat(self, request: Dict[str, Any]) -> None:
+        cfg = self.config
+        messages = request.get("messages") or []
+        with cfg.lock:
+            failing = cfg.rng.random() < cfg.fail_rate
+        if failing:
+            time.sleep(cfg.latency)
+            self._error(500, "mock server error", "server_error", "server_error")
+            return
+
+        content = json.dumps(build_answer(messages, cfg.answer_tokens), ensure_ascii=False)
+        prompt_tokens, completion_tokens = self._usage(messages, content)
+        max_tokens = request.get("max_completion_tokens") or request.get("max_tokens")
+        if prompt_tokens + (max_tokens or 0) > cfg.context_limit:
+            self._error(400, f"This model's maximum context length is {cfg.context_limit} tokens, "
+                             f"however you requested {prompt_tokens + (max_tokens or 0)} tokens.", "context_length_exceeded")
+            return
+        finish_reason = "stop"
+        if max_tokens and completion_tokens > max_tokens:
+            # Risposta tagliata come fa l'API: JSON incompleto e finish_reason "length"
+            content = content[:int(max_tokens * CHARS_PER_TOKEN)]
+            completion_tokens, finish_reason = max_tokens, "length"
+        cfg.count(requests=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        if request.get("stream"):
+            self._stream(request, content, usage, finish_reason)
+            return
+        time.sleep(cfg.latency + cfg.token_latency * completion_tokens)
+
+        self._reply(200, {
+            "id": f"chatcmpl-mock-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": finish_reason,
+            }],
+            "usage": usage,
+        })
+
+    def _embeddings(self, request: Dict[str, Any]) -> None:
+        texts = request.get("input")
+        if isinstance(texts, str):
+            texts = [texts]
+        if not isinstance(texts, list) or not texts or not all(isinstance(t, str) and t for t in texts):
+            self._error(400, "'input' must be a non-empty string or array of non-empty strings", "invalid_input")
+            return
+        dimensions = int(request.get("dimensions") or DEFAULT_EMBEDDING_DIMENSIONS)
+        as_base64 = request.get("encoding_format") == "base64"
+        data = []
+        for i, text in enumerate(texts):
+            vector = embedding_vector(text, dimensions)
+            embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii") if as_base64 else vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        prompt_tokens = sum(estimate_tokens(t) for t in texts)
+        self.config.count(embedding_requests=1, embedding_inputs=len(texts), embedding_tokens=prompt_tokens)
+        time.sleep(self.config.latency)
+        self._reply(200, {
+            "object": "list",
+            "data": data,
+            "model": request.get("model", "mock"),
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        })
+
+    def _stream(self, request: Dict[str, Any], content: str, usage: Dict[str, int], finish_reason: str = "stop",
+                piece_chars: int = 16) -> None:
+        """Server-sent events come ``stream=True`` dell'API: un delta ogni ``piece_chars`` caratteri (~4 token)."""
+        cfg = self.config
+        base = {"id": f"chatcmpl-mock-{int(time.time() * 1000)}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": request.get("model", "mock")}
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(choices: List[Dict[str, Any]], **extra: Any) -> None:
+            self.wfile.write(f"data: {json.dumps(dict(base, choices=choices, **extra), ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        time.sleep(cfg.latency)
+        event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        for start in range(0, len(content), piece_chars):
+            piece = content[start:start + piece_chars]
+            time.sleep(cfg.token_latency * estimate_tokens(piece))
+            event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+        event([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+        if (request.get("stream_options") or {}).get("include_usage"):
+            event([], usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def serve(host: str = "127.0.0.1", port: int = 0, config: Optional[MockConfig] = None) -> ThreadingHTTPServer:
+    """Avvia il server in un thread daemon; il base URL è ``http://host:server_port/v1``."""
+    handler = type("BoundMockOpenAIHandler", (MockOpenAIHandler,), {"config": config or MockConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Mock locale dell'API OpenAI (chat completions ed embeddings)")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8900)
+    p.add_argument("--latency", type=float, default=0.05, help="Latenza fissa per richiesta (s)")
+    p.add_argument("--token-latency", type=float, default=0.0, help="Secondi per token di output")
+    p.add_argument("--context-limit", type=int, default=128_000, help="Token massimi di prompt")
+    p.add_argument("--fail-rate", type=float, default=0.0, help="Probabilità di errore 500")
+    p.add_argument("--seed", type=int)
+    p.add_argument("--answer-tokens", type=int, default=0, help="Lunghezza minima in token di ogni risposta del matcher")
+    args = p.parse_args()
+
+    config = MockConfig(args.latency, args.token_latency, args.context_limit, args.fail_rate, args.seed, args.answer_tokens)
+    server = serve(args.host, args.port, config)
+    print(f"[INFO] Mock OpenAI su http://{args.host}:{server.server_port}/v1 (Ctrl+C per uscire)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        print(f"[FINE] Statistiche: {json.dumps(config.stats)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Estrazione del testo dai PDF pagina per pagina, con gli offset di pagina.
+
+Le pagine vengono lette in streaming (``iter_pages``) oppure, per i documenti
+lunghi, a blocchi di pagine in un pool di processi; i testi delle pagine sono
+uniti una sola volta con un form feed (``\\f``) come separatore, che
+``retrieval`` e lo splitter a blocchi dell'estrattore già riconoscono come
+confine di pagina. ``PdfText.page_offsets`` conserva l'offset di inizio di
+ogni pagina nel testo unito, così i prompt possono citare le pagine.
+"""
+from __future__ import annotations
+
+import io
+import os
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Tuple
+
+import PyPDF2
+
+PAGE_SEPARATOR = "\f"
+
+
+@dataclass
+class PdfText:
+    text: str
+    page_offsets: List[int]  # offset di inizio di ogni pagina in ``text``
+    errors: List[Tuple[int, str]] = field(default_factory=list)  # (pagina 1-based, messaggio)
+
+    @property
+    def pages(self) -> int:
+        return len(self.page_offsets)
+
+    def page_of(self, offset: int) -> int:
+        """Pagina (1-based) che contiene il carattere ``offset``."""
+        return max(1, bisect_right(self.page_offsets, offset))
+
+    def page_text(self, page: int) -> str:
+        start = self.page_offsets[page - 1]
+        end = self.page_offsets[page] - len(PAGE_SEPARATOR) if page < self.pages else len(self.text)
+        return self.text[start:end]
+
+
+def _reader(data: bytes) -> PyPDF2.PdfReader:
+    return PyPDF2.PdfReader(io.BytesIO(data))
+
+
+def _page_text(reader: PyPDF2.PdfReader, index: int) -> Tuple[str, Optional[str]]:
+    try:
+        return reader.pages[index].extract_text() or "", None
+    except Exception as e:  # una pagina illeggibile non deve far perdere il resto del documento
+        return "", f"{type(e).__name__}: {e}"
+
+
+def iter_pages(data: bytes, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """Restituisce ``(pagina 1-based, testo)`` una pagina alla volta, da ``start`` a ``stop`` (0-based, escluso)."""
+    reader = _reader(data)
+    stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+    for index in range(start, stop):
+        yield index + 1, _page_text(reader, index)[0]
+
+
+def count_pages(data: bytes) -> int:
+    return len(_reader(data).pages)
+
+
+_worker_reader: Optional[PyPDF2.PdfReader] = None
+
+
+def _init_worker(data: bytes) -> None:
+    # Il PDF arriva una volta per processo, non una volta per blocco di pagine
+    global _worker_reader
+    _worker_reader = _reader(data)
+
+
+def _extract_range(start: int, stop: int) -> List[Tuple[str, Optional[str]]]:
+    return [_page_text(_worker_reader, index) for index in range(start, stop)]
+
+
+def default_workers() -> int:
+    return max(1, min(8, os.cpu_count() or 1))
+
+
+def extract_pdf_text(data: bytes, workers: Optional[int] = None, pages_per_task: int = 16,
+                     min_parallel_pages: int = 48) -> PdfText:
+    """Testo del PDF con gli offset di pagina.
+
+    Sotto ``min_parallel_pages`` pagine (o con ``workers=1``) le pagine sono
+    lette nel processo corrente; altrimenti a blocchi di ``pages_per_task`` in
+    un pool di processi. Se il pool non è disponibile si torna alla lettura
+    sequenziale. Solleva le eccezioni di PyPDF2 se il file non è un PDF valido.
+    """
+    reader = _reader(data)
+    total = len(reader.pages)
+    workers = default_workers() if workers is None else max(1, workers)
+
+    results: List[Tuple[str, Optional[str]]] = []
+    if workers > 1 and total >= min_parallel_pages:
+        ranges = [(start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task)]
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), initializer=_init_worker,
+                                     initargs=(data,)) as pool:
+                futures = [pool.submit(_extract_range, start, stop) for start, stop in ranges]
+                for future in futures:
+                    results.extend(future.result())
+        except (OSError, RuntimeError, ImportError):
+            results = []  # pool non disponibile (es. ambiente senza fork): lettura sequenziale
+    if not results:
+        results = [_page_text(reader, index) for index in range(total)]
+
+    page_offsets: List[int] = []
+    offset = 0
+    for page_text, _ in results:
+        page_offsets.append(offset)
+        offset += len(page_text) + len(PAGE_SEPARATOR)
+    errors = [(page, error) for page, (_, error) in enumerate(results, start=1) if error]
+    return PdfText(PAGE_SEPARATOR.join(text for text, _ in results), page_offsets, errors)
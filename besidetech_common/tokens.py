@@ -0,0 +1,39 @@
+"""Stima dei token per prompt e risposte.
+
+Usa ``tiktoken`` se installato, altrimenti una stima di ~4 caratteri per token,
+sufficiente per dimensionare blocchi e budget.
+"""
+from __future__ import annotations
+
+import math
+from functools import lru_cache
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:  # dipendenza opzionale
+    tiktoken = None
+
+CHARS_PER_TOKEN = 4.0
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception:  # ad es. file BPE non scaricabile offline
+            return None
+
+
+def estimate_tokens(text: Optional[str], model: str = "gpt-4o-mini") -> int:
+    if not text:
+        return 0
+    enc = _encoding(model)
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
@@ -1,169 +1,163 @@
 import streamlit as st
 import openai
-import PyPDF2
-import pandas as pd
-import docx
-import io
+import asyncio
 import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 
-# --- System Prompt per OpenAI  ---
-SYSTEM_PROMPT = """Sei un assistente AI avanzato, specializzato nell'analisi semantica di documenti per identificare e estrarre i concetti chiave che fungono da criteri, requisiti, punti di valutazione, o sezioni tematiche principali, insieme alle loro descrizioni.
-
-Il tuo compito è analizzare attentamente il testo fornito. Anche se non ci sono codici espliciti (come A1, B2.1), devi identificare le frasi o i paragrafi che stabiliscono regole, linee guida, specifiche, o argomenti centrali che potrebbero essere considerati "criteri" in un senso più ampio.
-
-Per ogni "criterio" identificato:
-1.  **Identificatore del Criterio (`criterio_id`):**
-    * Se trovi un codice alfanumerico esplicito (es. A1, 1.2.3, Art. 5, CRITERIO X), usa quello.
-    * Se il criterio è introdotto da un titolo di sezione o un'intestazione chiara e concisa (es. "Requisiti Tecnici", "Articolo 5: Protezione dei Dati"), usa quel titolo come ID.
-    * Se non c'è un codice o un titolo ovvio, cerca di derivare un ID breve e significativo dalle prime parole chiave della descrizione del criterio (es. "Sicurezza_Dati_Personali", "Valutazione_Rischi_Operativi", "Procedura_Backup_Dati"). L'ID dovrebbe essere il più univoco e rappresentativo possibile. Evita ID troppo generici o eccessivamente lunghi.
-    * Come ultima risorsa, se non è possibile derivare un ID significativo in altro modo, puoi usare un placeholder come "Criterio Inferito N" (dove N è un numero progressivo per distinguerli), ma privilegia sempre le opzioni precedenti.
-
-2.  **Descrizione del Criterio (`descrizione`):**
-    * Estrai il testo che definisce, spiega, o dettaglia di cosa tratta quel criterio, requisito o sezione tematica. Cattura il testo più rilevante e completo che ne costituisce la spiegazione principale o la definizione. Assicurati di includere l'intera frase o il paragrafo pertinente.
-
-Restituisci i risultati come un elenco JSON di oggetti. Ogni oggetto deve contenere due chiavi:
-- "criterio_id": una stringa con l'identificatore del criterio.
-- "descrizione": una stringa con il testo descrittivo associato.
-
-Esempio di output JSON desiderato (con alcuni ID inferiti o basati su titoli):
-[
-  {
-    "criterio_id": "A1",
-    "descrizione": "Questo è il testo che descrive il Criterio A1 e ne specifica i dettagli principali."
-  },
-  {
-    "criterio_id": "Requisiti Hardware Minimi",
-    "descrizione": "Il sistema deve essere compatibile con processori Intel i5 di ottava generazione o superiori e richiedere almeno 8GB di RAM e 256GB di spazio su disco SSD."
-  },
-  {
-    "criterio_id": "Crittografia_Comunicazioni",
-    "descrizione": "Tutte le comunicazioni tra il client e il server devono essere crittografate utilizzando TLS 1.2 o versioni successive, con algoritmi di cifratura approvati."
-  },
-  {
-    "criterio_id": "Criterio Inferito 1",
-    "descrizione": "Le password utente devono avere una lunghezza minima di 12 caratteri, includere lettere maiuscole, minuscole, numeri e simboli speciali, e devono essere cambiate ogni 90 giorni."
-  }
-]
-
-Se nel testo non viene identificato alcun elemento che possa ragionevolmente essere interpretato come criterio, requisito o sezione tematica rilevante con una descrizione associata, restituisci una lista JSON vuota:
-[]
-
-Assicurati che l'output sia ESATTAMENTE una lista JSON valida di oggetti come specificato. Non includere spiegazioni, commenti o testo al di fuori della struttura JSON. Sii diligente nel trovare descrizioni complete e pertinenti. L'obiettivo è cogliere l'essenza di ogni punto chiave del documento che possa fungere da criterio o requisito. Evita di creare criteri da frasi troppo brevi o frammentarie se non rappresentano chiaramente un punto di valutazione o una regola.
-"""
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # besidetech_common
+
+from besidetech_common.llm_cache import AsyncCachedCompletions, CachedCompletions, ResponseCache
+from besidetech_common.ingestion import IngestionCache, file_kind, ingest
+from besidetech_common.json_stream import StreamOutcome
+
+from extractor_core import DEFAULT_MODEL, build_user_prompt, extract_criteria_chunked, extract_files, request_criteria, stream_criteria
 
 # --- Funzioni di Estrazione Testo  ---
-def extract_text_from_pdf(file_bytes):
-    try:
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
-        text = ""
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            text += page.extract_text() or ""
-        return text
-    except Exception as e:
-        st.error(f"Errore durante la lettura del PDF: {e}")
-        return None
+_READ_ERRORS = {"pdf": "del PDF", "excel": "del file Excel", "docx": "del file DOCX"}
 
-def extract_text_from_excel(file_bytes):
-    try:
-        xls = pd.ExcelFile(io.BytesIO(file_bytes))
-        text = ""
-        for sheet_name in xls.sheet_names:
-            df = xls.parse(sheet_name, header=None)
-            for col in df.columns:
-                text += df[col].astype(str).str.cat(sep=' ') + " "
-            text += "\n"
-        return text.strip()
-    except Exception as e:
-        st.error(f"Errore durante la lettura del file Excel: {e}")
-        return None
 
-def extract_text_from_docx(file_bytes):
+@st.cache_resource
+def get_ingestion_cache():
+    return IngestionCache()
+
+
+def extract_document(file_bytes, file_name):
+    """Testo del file caricato (Document), riletto solo se i byte non sono già in cache."""
+    kind = file_kind(file_name)
+    if kind is None:
+        st.error("Formato file non supportato.")
+        return None
     try:
-        doc = docx.Document(io.BytesIO(file_bytes))
-        text = ""
-        for para in doc.paragraphs:
-            text += para.text + "\n"
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    text += cell.text + "\t"
-                text += "\n"
-        return text
+        document, _ = ingest(file_bytes, file_name, get_ingestion_cache())
     except Exception as e:
-        st.error(f"Errore durante la lettura del file DOCX: {e}")
+        st.error(f"Errore durante la lettura {_READ_ERRORS[kind]}: {e}")
         return None
+    for warning in document.warnings:
+        st.warning(warning)
+    return document
+
+
+def extract_documents(uploaded_files, workers=4):
+    """Testi di più file letti in parallelo in thread.
+
+    I PDF sono letti senza pool di processi (``pdf_workers=1``): i file sono già
+    in parallelo, un pool per PDF moltiplicherebbe i processi.
+
+    Restituisce ``(nome, testo)`` nell'ordine di caricamento, saltando i file
+    illeggibili o vuoti; ogni file ha la sua riga di stato.
+    """
+    cache = get_ingestion_cache()
+    rows = [st.empty() for _ in uploaded_files]
+    texts = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(uploaded_files)))) as pool:
+        futures = {}
+        for i, uploaded in enumerate(uploaded_files):
+            if file_kind(uploaded.name) is None:
+                rows[i].error(f"`{uploaded.name}`: formato file non supportato.")
+                continue
+            rows[i].caption(f"⏳ `{uploaded.name}`: lettura in corso...")
+            futures[pool.submit(ingest, uploaded.getvalue(), uploaded.name, cache, pdf_workers=1)] = i
+        for future in as_completed(futures):
+            i = futures[future]
+            name = uploaded_files[i].name
+            try:
+                document, hit = future.result()
+            except Exception as e:
+                rows[i].error(f"`{name}`: errore durante la lettura {_READ_ERRORS[file_kind(name)]}: {e}")
+                continue
+            for warning in document.warnings:
+                st.warning(f"`{name}`: {warning}")
+            if not document.text.strip():
+                rows[i].warning(f"`{name}`: nessun testo estratto.")
+                continue
+            texts[i] = document.text
+            rows[i].caption(f"📄 `{name}`: {len(document.text):,} caratteri" + (" (dalla cache)" if hit else ""))
+    return [(uploaded_files[i].name, texts[i]) for i in sorted(texts)]
 
 # --- Funzione per chiamare OpenAI ---
-def get_criteria_from_openai(text_content, api_key):
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache()
+
+
+def _show_notes(notes):
+    for level, message in notes:
+        (st.info if level == "info" else st.warning)(message)
+
+
+def _show_cache_usage(completions):
+    if completions.hits:
+        st.caption(f"♻️ {completions.hits} risposte riutilizzate dalla cache, {completions.misses} nuove chiamate")
+
+
+def _stream_criteria_table(completions, text_content, started):
+    """Chiamata singola in streaming: la tabella cresce a ogni criterio completato."""
+    outcome = StreamOutcome()
+    table = st.empty()
+    criteria = []
+    first_at = None
+    try:
+        for criterion in stream_criteria(completions.create, build_user_prompt(text_content), outcome):
+            if first_at is None:
+                first_at = time.perf_counter() - started
+            criteria.append(criterion)
+            table.dataframe(criteria, use_container_width=True, hide_index=True)
+    except json.JSONDecodeError:
+        st.error(f"Errore nel decodificare la risposta JSON da OpenAI: {outcome.content}")
+    except ValueError as e_format:
+        st.warning(str(e_format))
+    table.empty()
+    _show_notes(outcome.notes)
+    if not outcome.complete:
+        st.warning(f"Risposta interrotta ({outcome.error or outcome.finish_reason or 'stream chiuso'}): mantenuti i {len(criteria)} criteri già ricevuti.")
+    first = f"primo criterio dopo {first_at:.1f}s, " if first_at is not None else ""
+    st.caption(f"⏱️ Streaming: {first}risposta completa in {time.perf_counter() - started:.1f}s")
+    _show_cache_usage(completions)
+    return criteria
+
+
+def get_criteria_from_openai(text_content, api_key, chunked=False, max_chunk_tokens=6000, workers=4, bypass_cache=False, stream=False):
     if not text_content:
         st.warning("Il contenuto del file è vuoto o non è stato possibile estrarlo.")
         return []
     try:
         client = openai.OpenAI(api_key=api_key)
-        # Possiamo aumentare aumentare max_tokens in base a quanto vogliamo la risposta lunga
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": f"Ecco il testo del documento da cui estrarre i criteri e le loro descrizioni:\n\n{text_content}"}
-            ],
-            temperature=0.0, # Facendo cosi il modello lo rendo meno creativo e più affine ai dati che gli passo"
-            response_format={"type": "json_object"}
-            #max_tokens=4000 # 
-        )
-        
-        json_string_response = response.choices[0].message.content
-        
+        completions = CachedCompletions(client, get_response_cache(), bypass=bypass_cache)
+        started = time.perf_counter()
+        if chunked:
+            result = extract_criteria_chunked(
+                completions.create, text_content, max_chunk_tokens=max_chunk_tokens, workers=workers
+            )
+            _show_notes(result.notes)
+            for chunk_index, error in result.errors:
+                st.warning(f"Blocco {chunk_index + 1} di {result.chunks} non elaborato: {error}")
+            st.caption(f"⏱️ {result.chunks} blocchi elaborati in parallelo in {result.elapsed:.1f}s")
+            _show_cache_usage(completions)
+            return result.criteria
+
+        if stream:
+            return _stream_criteria_table(completions, text_content, started)
+
+        # Stessa richiesta (prompt, modello, temperatura) del servizio HTTP e delle CLI
         try:
-            data = json.loads(json_string_response)
-
-            if isinstance(data, list):
-                parsed_criteria = data
-            elif isinstance(data, dict):
-                found_list = None
-                
-                common_keys = ["criteri", "criteria", "results", "items", "data", "extracted_criteria"]
-                for potential_key in common_keys:
-                    if potential_key in data and isinstance(data[potential_key], list):
-                        found_list = data[potential_key]
-                        break
-                if not found_list: 
-                    for key_in_dict in data:
-                        if isinstance(data[key_in_dict], list):
-                            found_list = data[key_in_dict]
-                            st.info(f"Trovata lista di criteri sotto la chiave generica '{key_in_dict}' nel JSON.")
-                            break
-                
-                if found_list is not None:
-                    parsed_criteria = found_list
-                else:
-                    st.warning(f"La risposta JSON era un dizionario, ma non conteneva una lista di criteri riconoscibile: {json_string_response}")
-                    return []
-            else:
-                st.warning(f"Formato JSON inatteso. La risposta non è una lista né un dizionario contenente una lista di criteri: {json_string_response}")
-                return []
-
-            validated_criteria = []
-            for item in parsed_criteria:
-                if isinstance(item, dict) and "criterio_id" in item and "descrizione" in item:
-                 
-                    item["criterio_id"] = str(item["criterio_id"]).strip()
-                    item["descrizione"] = str(item["descrizione"]).strip()
-                    if item["criterio_id"] and item["descrizione"]: #  non siano stringhe vuote dopo lo strip
-                         validated_criteria.append(item)
-                    else:
-                        st.warning(f"Elemento ignorato: 'criterio_id' o 'descrizione' vuoti dopo la pulizia. Originale: {item}")
-                else:
-                    st.warning(f"Elemento ignorato: formato imprevisto o chiavi mancanti ('criterio_id', 'descrizione') nell'oggetto JSON: {item}")
+            validated_criteria, notes = request_criteria(completions.create, build_user_prompt(text_content), DEFAULT_MODEL)
+            st.caption(f"⏱️ Chiamata singola completata in {time.perf_counter() - started:.1f}s")
+            _show_cache_usage(completions)
+            _show_notes(notes)
             return validated_criteria
 
-        except json.JSONDecodeError:
-            st.error(f"Errore nel decodificare la risposta JSON da OpenAI: {json_string_response}")
+        except json.JSONDecodeError as e_json:
+            st.error(f"Errore nel decodificare la risposta JSON da OpenAI: {e_json.doc}")
             st.info("Potrebbe essere necessario aggiustare il system prompt, controllare la risposta del modello, o il testo inviato potrebbe essere troppo lungo/complesso per un output JSON coerente con questo modello.")
             return []
-        except Exception as e_parse:
-            st.error(f"Errore durante il parsing della risposta strutturata: {e_parse}. Risposta grezza: {json_string_response}")
+        except ValueError as e_format:
+            st.warning(str(e_format))
+            return []
+        except (KeyError, TypeError, AttributeError) as e_parse:
+            st.error(f"Errore durante il parsing della risposta strutturata: {e_parse}")
             return []
 
     except openai.APIConnectionError as e:
@@ -175,39 +169,113 @@ def get_criteria_from_openai(text_content, api_key):
     except openai.APIError as e: 
         st.error(f"Errore API OpenAI: {e}")
         if "context_length_exceeded" in str(e).lower():
-            st.warning("Il testo del documento potrebbe essere troppo lungo per il modello selezionato. Bisogna usaree un documento più corto o un modello con una finestra di contesto maggiore, se disponibile.")
+            st.warning("Il testo del documento potrebbe essere troppo lungo per il modello selezionato. Prova la modalità a blocchi nella barra laterale, oppure usa un documento più corto o un modello con una finestra di contesto maggiore.")
     except Exception as e:
         st.error(f"Errore imprevisto durante la chiamata a OpenAI: {e}")
     return []
 
+def get_criteria_from_files_openai(documents, api_key, max_chunk_tokens=6000, concurrency=8, bypass_cache=False):
+    """Criteri di più file con il client asincrono: un limite di richieste in corso per tutti i file."""
+    bars = [st.progress(0.0, text=f"`{name}`: in attesa") for name, _ in documents]
+
+    def on_progress(file_result):
+        label = f"`{file_result.name}`: blocco {file_result.done}/{file_result.chunks}"
+        if file_result.errors:
+            label += f" ({len(file_result.errors)} con errore)"
+        bars[file_result.index].progress(file_result.done / file_result.chunks, text=label)
+
+    async def run():
+        async with openai.AsyncOpenAI(api_key=api_key) as client:
+            completions = AsyncCachedCompletions(client, get_response_cache(), bypass=bypass_cache)
+            result = await extract_files(completions.create, documents, max_chunk_tokens=max_chunk_tokens,
+                                         concurrency=concurrency, on_progress=on_progress)
+            return result, completions
+
+    try:
+        result, completions = asyncio.run(run())
+    except Exception as e:
+        st.error(f"Errore imprevisto durante le chiamate a OpenAI: {e}")
+        return []
+    for file_result in result.files:
+        bars[file_result.index].progress(1.0, text=f"`{file_result.name}`: {len(file_result.criteria)} criteri "
+                                                   f"in {file_result.elapsed:.1f}s")
+        _show_notes(file_result.notes)
+        for chunk_index, error in file_result.errors:
+            st.warning(f"`{file_result.name}`, blocco {chunk_index + 1} di {file_result.chunks} non elaborato: {error}")
+    st.caption(f"⏱️ {len(documents)} file, {sum(f.chunks for f in result.files)} richieste "
+               f"(al più {concurrency} in parallelo) in {result.elapsed:.1f}s")
+    _show_cache_usage(completions)
+    return result.criteria
+
+
+def show_criteria_table(criteria_data, download_name):
+    import pandas as pd  # caricato solo quando c'è una tabella da mostrare
+
+    criteria_df = pd.DataFrame(criteria_data)
+
+    st.data_editor(
+        criteria_df,
+        use_container_width=True,
+        column_config={
+            "criterio_id": st.column_config.TextColumn("ID Criterio/Sezione", width="medium", help="Identificatore del criterio (esplicito o inferito)."),
+            "descrizione": st.column_config.TextColumn("Descrizione", width="large", help="Testo che descrive il criterio/sezione."),
+            "fonti": st.column_config.ListColumn("File di provenienza", help="File caricati in cui il criterio compare.")
+        },
+        hide_index=True,
+        num_rows="dynamic" # Permette di vedere più righe se lo spazio lo consente
+    )
+
+    json_output = json.dumps(criteria_data, indent=2, ensure_ascii=False)
+    st.download_button(
+        label="📥 Scarica JSON Strutturato",
+        data=json_output,
+        file_name=download_name,
+        mime="application/json"
+    )
+
 # --- Interfaccia Streamlit ---
 st.set_page_config(layout="wide", page_title="Besidetech Extradtor Criteri")
 
 st.title("📄 Besidetech Extractor Criteri From Files")
-st.markdown("""
+st.markdown(f"""
 Carica un file (PDF, Excel, Word DOCX) per estrarre criteri, requisiti o sezioni tematiche chiave e le relative descrizioni, anche quando non esplicitamente codificati.
-L'applicazione utilizza il modello `gpt-4o-mini` di OpenAI per interpretare il testo.
+L'applicazione utilizza il modello `{DEFAULT_MODEL}` di OpenAI per interpretare il testo.
 L'output sarà un JSON strutturato con "criterio_id" e "descrizione".
 """)
 
 api_key = st.text_input("🔑 Inserisci la tua API Key di OpenAI", type="password")
-uploaded_file = st.file_uploader("📂 Carica il tuo documento", type=["pdf", "xlsx", "xls", "docx"])
+# Prima della barra laterale: con più file "Token per blocco" è in uso anche senza modalità a blocchi
+uploaded_files = st.file_uploader("📂 Carica uno o più documenti", type=["pdf", "xlsx", "xls", "docx"], accept_multiple_files=True)
+multi_file = len(uploaded_files) > 1
+
+st.sidebar.subheader("Documenti lunghi")
+chunked_mode = st.sidebar.checkbox("Modalità a blocchi", value=False, help="Divide il testo in blocchi sovrapposti elaborati in parallelo, poi unisce e deduplica i criteri.")
+max_chunk_tokens = st.sidebar.number_input("Token per blocco", min_value=500, max_value=100_000, value=6000, step=500, disabled=not (chunked_mode or multi_file),
+                                           help="Usato dalla modalità a blocchi e, con più file caricati, per dividere i documenti lunghi.")
+chunk_workers = st.sidebar.number_input("Richieste in parallelo", min_value=1, max_value=16, value=4, step=1, disabled=not chunked_mode)
+
+st.sidebar.subheader("Risposta")
+stream_mode = st.sidebar.checkbox("Mostra i criteri man mano che arrivano", value=True, disabled=chunked_mode, help="Riceve la risposta in streaming e aggiunge ogni criterio alla tabella appena è completo. Se la risposta si interrompe, i criteri già ricevuti vengono mantenuti.")
+
+st.sidebar.subheader("Cache risposte OpenAI")
+bypass_cache = st.sidebar.checkbox("Ignora cache (forza nuova chiamata)", value=False, help="Le risposte sono memorizzate su disco per modello, prompt e parametri: la stessa analisi ripetuta torna subito dalla cache.")
+cache_stats = get_response_cache().stats()
+st.sidebar.caption(f"{cache_stats['entries']} risposte in cache · {cache_stats['bytes'] / 1_000_000:.1f} MB · {cache_stats['tokens']:,} token")
+if st.sidebar.button("Svuota cache"):
+    get_response_cache().clear()
+
+st.sidebar.subheader("Più file")
+multi_workers = st.sidebar.number_input("Richieste in parallelo", key="multi_workers", min_value=1, max_value=32, value=8, step=1, help="Con più file caricati le richieste di tutti i file partono insieme fino a questo limite. I documenti oltre i 'Token per blocco' vengono divisi in blocchi.")
+uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None
 
 if uploaded_file is not None:
     file_bytes = uploaded_file.getvalue()
     file_name = uploaded_file.name
     st.write(f"File caricato: `{file_name}`")
 
-    text_content = None
     with st.spinner(f"Estrazione del testo da `{file_name}`..."):
-        if file_name.lower().endswith(".pdf"):
-            text_content = extract_text_from_pdf(file_bytes)
-        elif file_name.lower().endswith((".xlsx", ".xls")):
-            text_content = extract_text_from_excel(file_bytes)
-        elif file_name.lower().endswith(".docx"):
-            text_content = extract_text_from_docx(file_bytes)
-        else:
-            st.error("Formato file non supportato.")
+        document = extract_document(file_bytes, file_name)
+    text_content = document.text if document else None
 
     if text_content:
         max_preview_chars = 1000
@@ -224,32 +292,12 @@ if uploaded_file is not None:
                     st.warning("Il testo estratto sembra troppo corto per un'analisi significativa. Verifica il contenuto del file.")
                 else:
                     with st.spinner("Analisi del testo con OpenAI in corso... Potrebbe richiedere qualche istante, specialmente per documenti lunghi."):
-                        criteria_data = get_criteria_from_openai(text_content, api_key) 
+                        criteria_data = get_criteria_from_openai(text_content, api_key, chunked_mode, int(max_chunk_tokens), int(chunk_workers), bypass_cache, stream_mode)
                     
                     st.subheader("✅ Criteri Estratti con Descrizioni")
                     if criteria_data:
                         st.success(f"Trovati {len(criteria_data)} criteri/sezioni con descrizioni.")
-                        
-                        criteria_df = pd.DataFrame(criteria_data)
-                        
-                        st.data_editor(
-                            criteria_df,
-                            use_container_width=True,
-                            column_config={
-                                "criterio_id": st.column_config.TextColumn("ID Criterio/Sezione", width="medium", help="Identificatore del criterio (esplicito o inferito)."),
-                                "descrizione": st.column_config.TextColumn("Descrizione", width="large", help="Testo che descrive il criterio/sezione.")
-                            },
-                            hide_index=True,
-                            num_rows="dynamic" # Permette di vedere più righe se lo spazio lo consente
-                        )
-                        
-                        json_output = json.dumps(criteria_data, indent=2, ensure_ascii=False)
-                        st.download_button(
-                            label="📥 Scarica JSON Strutturato",
-                            data=json_output,
-                            file_name=f"criteri_dettagliati_{file_name.split('.')[0]}.json",
-                            mime="application/json"
-                        )
+                        show_criteria_table(criteria_data, f"criteri_dettagliati_{file_name.split('.')[0]}.json")
                     else:
                         st.info("Nessun criterio (con descrizione) trovato nel documento secondo il modello OpenAI, o la risposta non era nel formato JSON atteso. Controllare anche il System Prompt o la qualità del testo estratto.")
         else:
@@ -257,4 +305,27 @@ if uploaded_file is not None:
     elif uploaded_file:
         st.error("Non è stato possibile estrarre il testo dal file. Controlla i messaggi di errore sopra.")
 
+if multi_file:
+    st.write(f"{len(uploaded_files)} file caricati")
+    with st.spinner("Estrazione del testo dai file..."):
+        documents = extract_documents(uploaded_files)
+
+    if documents:
+        if api_key:
+            if st.button("Estrai Criteri e Descrizioni da tutti i file con OpenAI"):
+                with st.spinner(f"Analisi di {len(documents)} file con OpenAI in corso..."):
+                    criteria_data = get_criteria_from_files_openai(documents, api_key, int(max_chunk_tokens), int(multi_workers), bypass_cache)
+
+                st.subheader("✅ Criteri Estratti da tutti i file")
+                if criteria_data:
+                    shared = sum(1 for c in criteria_data if len(c["fonti"]) > 1)
+                    st.success(f"Trovati {len(criteria_data)} criteri/sezioni distinti ({shared} presenti in più file).")
+                    show_criteria_table(criteria_data, "criteri_dettagliati_tutti_i_file.json")
+                else:
+                    st.info("Nessun criterio (con descrizione) trovato nei file secondo il modello OpenAI, o le risposte non erano nel formato JSON atteso.")
+        else:
+            st.warning("Inserisci la tua API Key di OpenAI per procedere.")
+    else:
+        st.error("Non è stato possibile estrarre il testo da nessuno dei file. Controlla i messaggi di errore sopra.")
+
 st.sidebar.markdown("---")
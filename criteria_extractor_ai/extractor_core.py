@@ -0,0 +1,437 @@
+"""Estrazione dei criteri con OpenAI, separata dall'interfaccia Streamlit.
+
+Contiene il system prompt, il parsing della risposta JSON e la modalità a
+blocchi per documenti lunghi: il testo viene diviso in blocchi sovrapposti
+entro un budget di token (rispettando pagine e paragrafi), i blocchi vengono
+elaborati in parallelo e i criteri risultanti uniti senza duplicati.
+``extract_files`` fa lo stesso per più file insieme con il client asincrono:
+tutte le richieste condividono un limite di concorrenza e i criteri uniti
+riportano in ``fonti`` i file in cui compaiono.
+
+Le funzioni ricevono ``create``, cioè ``client.chat.completions.create`` o un
+oggetto con la stessa firma, così da poter essere usate anche fuori dall'app
+(``acreate`` è la versione asincrona, ad es. di ``AsyncOpenAI``).
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from besidetech_common.json_stream import StreamOutcome, stream_array_items
+from besidetech_common.tokens import CHARS_PER_TOKEN, estimate_tokens
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+# --- System Prompt per OpenAI  ---
+SYSTEM_PROMPT = """Sei un assistente AI avanzato, specializzato nell'analisi semantica di documenti per identificare e estrarre i concetti chiave che fungono da criteri, requisiti, punti di valutazione, o sezioni tematiche principali, insieme alle loro descrizioni.
+
+Il tuo compito è analizzare attentamente il testo fornito. Anche se non ci sono codici espliciti (come A1, B2.1), devi identificare le frasi o i paragrafi che stabiliscono regole, linee guida, specifiche, o argomenti centrali che potrebbero essere considerati "criteri" in un senso più ampio.
+
+Per ogni "criterio" identificato:
+1.  **Identificatore del Criterio (`criterio_id`):**
+    * Se trovi un codice alfanumerico esplicito (es. A1, 1.2.3, Art. 5, CRITERIO X), usa quello.
+    * Se il criterio è introdotto da un titolo di sezione o un'intestazione chiara e concisa (es. "Requisiti Tecnici", "Articolo 5: Protezione dei Dati"), usa quel titolo come ID.
+    * Se non c'è un codice o un titolo ovvio, cerca di derivare un ID breve e significativo dalle prime parole chiave della descrizione del criterio (es. "Sicurezza_Dati_Personali", "Valutazione_Rischi_Operativi", "Procedura_Backup_Dati"). L'ID dovrebbe essere il più univoco e rappresentativo possibile. Evita ID troppo generici o eccessivamente lunghi.
+    * Come ultima risorsa, se non è possibile derivare un ID significativo in altro modo, puoi usare un placeholder come "Criterio Inferito N" (dove N è un numero progressivo per distinguerli), ma privilegia sempre le opzioni precedenti.
+
+2.  **Descrizione del Criterio (`descrizione`):**
+    * Estrai il testo che definisce, spiega, o dettaglia di cosa tratta quel criterio, requisito o sezione tematica. Cattura il testo più rilevante e completo che ne costituisce la spiegazione principale o la definizione. Assicurati di includere l'intera frase o il paragrafo pertinente.
+
+Restituisci i risultati come un elenco JSON di oggetti. Ogni oggetto deve contenere due chiavi:
+- "criterio_id": una stringa con l'identificatore del criterio.
+- "descrizione": una stringa con il testo descrittivo associato.
+
+Esempio di output JSON desiderato (con alcuni ID inferiti o basati su titoli):
+[
+  {
+    "criterio_id": "A1",
+    "descrizione": "Questo è il testo che descrive il Criterio A1 e ne specifica i dettagli principali."
+  },
+  {
+    "criterio_id": "Requisiti Hardware Minimi",
+    "descrizione": "Il sistema deve essere compatibile con processori Intel i5 di ottava generazione o superiori e richiedere almeno 8GB di RAM e 256GB di spazio su disco SSD."
+  },
+  {
+    "criterio_id": "Crittografia_Comunicazioni",
+    "descrizione": "Tutte le comunicazioni tra il client e il server devono essere crittografate utilizzando TLS 1.2 o versioni successive, con algoritmi di cifratura approvati."
+  },
+  {
+    "criterio_id": "Criterio Inferito 1",
+    "descrizione": "Le password utente devono avere una lunghezza minima di 12 caratteri, includere lettere maiuscole, minuscole, numeri e simboli speciali, e devono essere cambiate ogni 90 giorni."
+  }
+]
+
+Se nel testo non viene identificato alcun elemento che possa ragionevolmente essere interpretato come criterio, requisito o sezione tematica rilevante con una descrizione associata, restituisci una lista JSON vuota:
+[]
+
+Assicurati che l'output sia ESATTAMENTE una lista JSON valida di oggetti come specificato. Non includere spiegazioni, commenti o testo al di fuori della struttura JSON. Sii diligente nel trovare descrizioni complete e pertinenti. L'obiettivo è cogliere l'essenza di ogni punto chiave del documento che possa fungere da criterio o requisito. Evita di creare criteri da frasi troppo brevi o frammentarie se non rappresentano chiaramente un punto di valutazione o una regola.
+"""
+
+# Chiavi sotto cui il modello tende a restituire la lista quando risponde con un oggetto
+COMMON_LIST_KEYS = ["criteri", "criteria", "results", "items", "data", "extracted_criteria"]
+
+Note = Tuple[str, str]  # (livello "info"/"warning", messaggio)
+
+
+def parse_criteria_response(json_string_response: str) -> Tuple[List[Dict[str, str]], List[Note]]:
+    """Valida la risposta del modello e restituisce (criteri, note).
+
+    Solleva ``json.JSONDecodeError`` se la risposta non è JSON e ``ValueError``
+    se il JSON non contiene una lista di criteri riconoscibile.
+    """
+    data = json.loads(json_string_response)
+    notes: List[Note] = []
+
+    if isinstance(data, list):
+        parsed_criteria = data
+    elif isinstance(data, dict):
+        found_list = None
+        for potential_key in COMMON_LIST_KEYS:
+            if potential_key in data and isinstance(data[potential_key], list):
+                found_list = data[potential_key]
+                break
+        if not found_list:
+            for key_in_dict in data:
+                if isinstance(data[key_in_dict], list):
+                    found_list = data[key_in_dict]
+                    notes.append(("info", f"Trovata lista di criteri sotto la chiave generica '{key_in_dict}' nel JSON."))
+                    break
+        if found_list is None:
+            raise ValueError(f"La risposta JSON era un dizionario, ma non conteneva una lista di criteri riconoscibile: {json_string_response}")
+        parsed_criteria = found_list
+    else:
+        raise ValueError(f"Formato JSON inatteso. La risposta non è una lista né un dizionario contenente una lista di criteri: {json_string_response}")
+
+    validated_criteria = []
+    for item in parsed_criteria:
+        criterion, note = validate_criterion(item)
+        if criterion is not None:
+            validated_criteria.append(criterion)
+        else:
+            notes.append(note)
+    return validated_criteria, notes
+
+
+def validate_criterion(item: Any) -> Tuple[Optional[Dict[str, str]], Optional[Note]]:
+    """Il criterio ripulito, oppure ``None`` e la nota che spiega perché è stato scartato."""
+    if isinstance(item, dict) and "criterio_id" in item and "descrizione" in item:
+        item["criterio_id"] = str(item["criterio_id"]).strip()
+        item["descrizione"] = str(item["descrizione"]).strip()
+        if item["criterio_id"] and item["descrizione"]:
+            return item, None
+        return None, ("warning", f"Elemento ignorato: 'criterio_id' o 'descrizione' vuoti dopo la pulizia. Originale: {item}")
+    return None, ("warning", f"Elemento ignorato: formato imprevisto o chiavi mancanti ('criterio_id', 'descrizione') nell'oggetto JSON: {item}")
+
+
+def build_user_prompt(text_content: str, part: int | None = None, parts: int | None = None) -> str:
+    if part is None:
+        return f"Ecco il testo del documento da cui estrarre i criteri e le loro descrizioni:\n\n{text_content}"
+    return (f"Ecco la parte {part} di {parts} del documento da cui estrarre i criteri e le loro descrizioni "
+            f"(estrai solo i criteri presenti in questa parte):\n\n{text_content}")
+
+
+def _request_params(user_prompt: str, model: str) -> Dict[str, Any]:
+    return dict(
+        model=model,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=0.0,
+        response_format={"type": "json_object"},
+    )
+
+
+def request_criteria(create: Callable[..., Any], user_prompt: str, model: str = DEFAULT_MODEL) -> Tuple[List[Dict[str, str]], List[Note]]:
+    response = create(**_request_params(user_prompt, model))
+    return parse_criteria_response(response.choices[0].message.content)
+
+
+async def arequest_criteria(acreate: Callable[..., Awaitable[Any]], user_prompt: str,
+                            model: str = DEFAULT_MODEL) -> Tuple[List[Dict[str, str]], List[Note]]:
+    response = await acreate(**_request_params(user_prompt, model))
+    return parse_criteria_response(response.choices[0].message.content)
+
+
+def stream_criteria(create: Callable[..., Any], user_prompt: str, outcome: StreamOutcome,
+                    model: str = DEFAULT_MODEL) -> Iterator[Dict[str, str]]:
+    """Come ``request_criteria`` ma in streaming: ogni criterio è restituito appena il suo oggetto JSON è completo.
+
+    Note, motivo di chiusura ed eventuale interruzione finiscono in ``outcome``;
+    i criteri già restituiti restano validi anche se lo stream si interrompe.
+    """
+    seen = 0
+    for item in stream_array_items(
+        create, outcome,
+        model=model,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=0.0,
+        response_format={"type": "json_object"},
+    ):
+        seen += 1
+        criterion, note = validate_criterion(item)
+        if criterion is not None:
+            yield criterion
+        else:
+            outcome.notes.append(note)
+    if not seen and outcome.complete and outcome.content.strip():
+        # Lista non riconosciuta durante lo streaming: parsing completo della risposta
+        criteria, notes = parse_criteria_response(outcome.content)
+        outcome.notes.extend(notes)
+        yield from criteria
+
+# --- Suddivisione in blocchi ---
+
+# Confini preferiti, dal più forte al più debole: pagina (form feed) o paragrafo, riga, frase
+_BOUNDARIES = [re.compile(r"\f|\n[ \t]*\n"), re.compile(r"\n"), re.compile(r"(?<=[.!?;:])\s+")]
+
+
+@dataclass
+class Chunk:
+    index: int
+    start: int
+    end: int
+    text: str
+    tokens: int
+
+
+def _segments(text: str, start: int, end: int, max_tokens: int, level: int = 0) -> Iterable[Tuple[int, int, int]]:
+    """Divide text[start:end] in segmenti (start, end, token) entro max_tokens, tagliando sui confini naturali."""
+    tokens = estimate_tokens(text[start:end])
+    if tokens <= max_tokens:
+        yield start, end, tokens
+        return
+    if level >= len(_BOUNDARIES):
+        step = max(1, int(max_tokens * CHARS_PER_TOKEN))
+        for pos in range(start, end, step):
+            stop = min(end, pos + step)
+            yield pos, stop, estimate_tokens(text[pos:stop])
+        return
+    pos = start
+    for m in _BOUNDARIES[level].finditer(text, start, end):
+        if m.end() > pos:
+            yield from _segments(text, pos, m.end(), max_tokens, level + 1)
+            pos = m.end()
+    if pos < end:
+        yield from _segments(text, pos, end, max_tokens, level + 1)
+
+
+def split_into_chunks(text: str, max_tokens: int = 6000, overlap_tokens: int = 300) -> List[Chunk]:
+    """Blocchi di al più ``max_tokens`` token; ognuno riprende gli ultimi segmenti del precedente fino a ``overlap_tokens``."""
+    segments = [seg for seg in _segments(text, 0, len(text), max_tokens, 0) if text[seg[0]:seg[1]].strip()]
+    chunks: List[Chunk] = []
+    current: List[Tuple[int, int, int]] = []
+    current_tokens = 0
+    fresh = False
+
+    def emit() -> None:
+        start, end = current[0][0], current[-1][1]
+        chunks.append(Chunk(len(chunks), start, end, text[start:end], current_tokens))
+
+    for seg in segments:
+        if fresh and current_tokens + seg[2] > max_tokens:
+            emit()
+            tail: List[Tuple[int, int, int]] = []
+            tail_tokens = 0
+            for prev in reversed(current):
+                if tail_tokens + prev[2] > overlap_tokens:
+                    break
+                tail.insert(0, prev)
+                tail_tokens += prev[2]
+            current, current_tokens, fresh = tail, tail_tokens, False
+        while current and current_tokens + seg[2] > max_tokens:
+            current_tokens -= current.pop(0)[2]
+        current.append(seg)
+        current_tokens += seg[2]
+        fresh = True
+    if fresh:
+        emit()
+    return chunks
+
+
+# --- Unione dei risultati ---
+
+_INFERRED_ID = re.compile(r"(?i)^criterio\s+inferito(\s+\d+)?$")
+
+
+def _norm(value: str) -> str:
+    return re.sub(r"\s+", " ", value).strip().casefold()
+
+
+def merge_criteria(per_chunk: Iterable[List[Dict[str, str]]]) -> List[Dict[str, str]]:
+    """Unisce le liste dei blocchi in ordine di documento.
+
+    Lo stesso ``criterio_id`` trovato in più blocchi (ad es. nella sovrapposizione)
+    viene tenuto una volta sola con la descrizione più completa. Gli ID generici
+    "Criterio Inferito N" sono confrontati per descrizione e rinumerati.
+    """
+    merged: Dict[str, Dict[str, str]] = {}
+    for items in per_chunk:
+        for item in items:
+            key = _merge_key(item)
+            prev = merged.get(key)
+            if prev is None:
+                merged[key] = dict(item)
+            elif len(item["descrizione"]) > len(prev["descrizione"]):
+                prev["descrizione"] = item["descrizione"]
+    return _renumber_inferred(list(merged.values()))
+
+
+def merge_file_criteria(per_file: Iterable[Tuple[str, List[Dict[str, str]]]]) -> List[Dict[str, Any]]:
+    """Come ``merge_criteria`` tra file diversi: ogni criterio riporta in ``fonti`` i file in cui compare."""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for name, items in per_file:
+        for item in items:
+            key = _merge_key(item)
+            prev = merged.get(key)
+            if prev is None:
+                merged[key] = dict(item, fonti=[name])
+                continue
+            if len(item["descrizione"]) > len(prev["descrizione"]):
+                prev["descrizione"] = item["descrizione"]
+            if name not in prev["fonti"]:
+                prev["fonti"].append(name)
+    return _renumber_inferred(list(merged.values()))
+
+
+def _merge_key(item: Dict[str, str]) -> str:
+    if _INFERRED_ID.match(item["criterio_id"]):
+        return "~" + _norm(item["descrizione"])
+    return _norm(item["criterio_id"])
+
+
+def _renumber_inferred(result: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    n = 0
+    for item in result:
+        if _INFERRED_ID.match(item["criterio_id"]):
+            n += 1
+            item["criterio_id"] = f"Criterio Inferito {n}"
+    return result
+
+
+@dataclass
+class ChunkedExtraction:
+    criteria: List[Dict[str, str]]
+    chunks: int
+    elapsed: float
+    notes: List[Note] = field(default_factory=list)
+    errors: List[Tuple[int, str]] = field(default_factory=list)  # (indice blocco, messaggio)
+
+
+def extract_criteria_chunked(
+    create: Callable[..., Any],
+    text_content: str,
+    *,
+    model: str = DEFAULT_MODEL,
+    max_chunk_tokens: int = 6000,
+    overlap_tokens: int = 300,
+    workers: int = 4,
+) -> ChunkedExtraction:
+    """Estrae i criteri blocco per blocco in parallelo e unisce i risultati.
+
+    Un blocco che fallisce viene riportato in ``errors`` senza interrompere gli altri.
+    """
+    started = time.perf_counter()
+    chunks = split_into_chunks(text_content, max_chunk_tokens, overlap_tokens)
+
+    def run(chunk: Chunk):
+        try:
+            return request_criteria(create, build_user_prompt(chunk.text, chunk.index + 1, len(chunks)), model), None
+        except Exception as exc:
+            return ([], []), f"{type(exc).__name__}: {exc}"
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        outcomes = list(pool.map(run, chunks))
+
+    result = ChunkedExtraction([], len(chunks), 0.0)
+    per_chunk = []
+    for chunk, ((criteria, notes), error) in zip(chunks, outcomes):
+        per_chunk.append(criteria)
+        result.notes.extend(notes)
+        if error:
+            result.errors.append((chunk.index, error))
+    result.criteria = merge_criteria(per_chunk)
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+# --- Più file con il client asincrono ---
+
+@dataclass
+class FileExtraction:
+    index: int  # posizione del file nell'elenco ricevuto
+    name: str
+    chunks: int
+    criteria: List[Dict[str, str]] = field(default_factory=list)
+    done: int = 0  # blocchi conclusi (anche con errore)
+    elapsed: float = 0.0
+    notes: List[Note] = field(default_factory=list)
+    errors: List[Tuple[int, str]] = field(default_factory=list)  # (indice blocco, messaggio)
+
+
+@dataclass
+class MultiFileExtraction:
+    criteria: List[Dict[str, Any]]  # uniti tra i file, con "fonti"
+    files: List[FileExtraction]
+    elapsed: float
+
+
+async def extract_files(
+    acreate: Callable[..., Awaitable[Any]],
+    documents: Sequence[Tuple[str, str]],
+    *,
+    model: str = DEFAULT_MODEL,
+    max_chunk_tokens: int = 6000,
+    overlap_tokens: int = 300,
+    concurrency: int = 4,
+    on_progress: Optional[Callable[[FileExtraction], None]] = None,
+) -> MultiFileExtraction:
+    """Estrae i criteri da ``documents`` (nome, testo) con al più ``concurrency`` richieste in corso.
+
+    Un testo entro ``max_chunk_tokens`` è inviato con lo stesso prompt della
+    chiamata singola (e quindi con la stessa voce di cache); i più lunghi sono
+    divisi in blocchi come in ``extract_criteria_chunked``. ``on_progress`` è
+    chiamata nel thread del loop a ogni blocco concluso. Un blocco che fallisce
+    finisce negli ``errors`` del suo file senza fermare gli altri.
+    """
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_chunk(result: FileExtraction, position: int, prompt: str) -> List[Dict[str, str]]:
+        async with semaphore:
+            try:
+                criteria, notes = await arequest_criteria(acreate, prompt, model)
+            except Exception as exc:
+                criteria, notes = [], []
+                result.errors.append((position, f"{type(exc).__name__}: {exc}"))
+        result.notes.extend(notes)
+        result.done += 1
+        if on_progress is not None:
+            on_progress(result)
+        return criteria
+
+    async def run_file(index: int, name: str, text: str) -> FileExtraction:
+        t0 = time.perf_counter()
+        chunks = split_into_chunks(text, max_chunk_tokens, overlap_tokens)
+        if len(chunks) <= 1:
+            prompts = [build_user_prompt(text)] if text.strip() else []
+        else:
+            prompts = [build_user_prompt(chunk.text, chunk.index + 1, len(chunks)) for chunk in chunks]
+        result = FileExtraction(index, name, len(prompts))
+        per_chunk = await asyncio.gather(*(run_chunk(result, i, prompt) for i, prompt in enumerate(prompts)))
+        result.errors.sort()
+        result.criteria = merge_criteria(per_chunk)
+        result.elapsed = time.perf_counter() - t0
+        return result
+
+    files = list(await asyncio.gather(*(run_file(i, name, text) for i, (name, text) in enumerate(documents))))
+    criteria = merge_file_criteria((f.name, f.criteria) for f in files)
+    return MultiFileExtraction(criteria, files, time.perf_counter() - started)
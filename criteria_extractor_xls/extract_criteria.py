@@ -5,18 +5,12 @@ from __future__ import annotations
 import hashlib
 import io
 import json
-import re
-from typing import Dict, List, Optional
+from typing import List
 
 import streamlit as st
 from openpyxl import load_workbook
 
-
-# Regex pattern per criteri
-########################################################
-
-RE_SUB = re.compile(r"^\s*CRITERIO\s+([A-Z]\d(?:\.\d+)*)", re.IGNORECASE)
-RE_MAIN = re.compile(r"^\s*([A-Z]\d+)\s*[- ]\s*(.+)")
+from scanner import Hit, parse_columns, records_from_hits, scan_sheet, scan_workbook
 
 
 # Helper
@@ -26,36 +20,6 @@ def _workbook_from_upload(buf: io.BytesIO):
     return load_workbook(buf, data_only=True, read_only=True)
 
 
-def _parse_records(sheet, col_letter: str, row_start: int, row_end: int) -> List[Dict[str, str]]:
-    records: List[Dict[str, str]] = []
-    col_letter = col_letter.upper()
-    pending: Optional[str] = None
-
-    for row in range(row_start, row_end + 1):
-        value = sheet[f"{col_letter}{row}"].value
-        if value is None:
-            continue
-        text = str(value).strip()
-        if not text:
-            continue
-
-        if pending:
-            records.append({pending: text})
-            pending = None
-            continue
-
-        m_sub = RE_SUB.match(text)
-        if m_sub:
-            pending = m_sub.group(1)
-            continue
-
-        m_main = RE_MAIN.match(text)
-        if m_main:
-            code, desc = m_main.group(1), m_main.group(2).strip()
-            records.append({code: desc})
-    return records
-
-
 # Streamlit UI
 ########
 
@@ -88,8 +52,16 @@ if sheet_idx != 1:
 
 sheet = wb[sheet_name]
 
-col_letter = st.text_input("Lettera colonna dati", value="A", max_chars=3).strip()
-mode = st.radio("Intervallo di lettura", ["Tutta la colonna", "Intervallo di righe"], 0)
+col_letter = st.text_input("Lettera colonna dati (più colonne separate da virgola, es. A,C)", value="A", max_chars=40).strip()
+try:
+    columns = parse_columns(col_letter)
+except ValueError:
+    columns = []
+if not columns:
+    st.error(f"Colonna non valida: '{col_letter}'.")
+    st.stop()
+all_sheets = st.checkbox("Analizza tutti i fogli", value=False)
+mode = st.radio("Intervallo di lettura", ["Tutta la colonna", "Intervallo di righe"], 0, disabled=all_sheets)
 
 if mode == "Intervallo di righe":
     row_start = st.number_input("Riga inizio", 1, sheet.max_row, 1)
@@ -100,11 +72,12 @@ else:
 
 # Chiave di configurazione per capire se dobbiamo ricalcolare
 # ---------------------------------------------------------------------------
-config_str = f"{uploaded_file.name}|{sheet_name}|{col_letter}|{row_start}-{row_end}"
+config_str = f"{uploaded_file.name}|{'*' if all_sheets else sheet_name}|{','.join(columns)}|{row_start}-{row_end}"
 config_hash = hashlib.sha1(config_str.encode()).hexdigest()
 
 if st.session_state.get("config_hash") != config_hash:
     st.session_state.pop("records", None)
+    st.session_state.pop("hits", None)
     st.session_state.pop("codes", None)
     st.session_state.pop("selected_codes", None)
     st.session_state["config_hash"] = config_hash
@@ -113,9 +86,14 @@ if st.session_state.get("config_hash") != config_hash:
 # ---------------------------------------------------------------------------
 if st.button("Analizza / Aggiorna") or st.session_state.get("records") is None:
     with st.spinner("Analisi in corso…"):
-        records = _parse_records(sheet, col_letter, int(row_start), int(row_end))
+        if all_sheets:
+            hits = scan_workbook(wb, columns)
+        else:
+            hits = scan_sheet(sheet, columns, int(row_start), int(row_end), sheet_name)
+        records = records_from_hits(hits)
+        st.session_state["hits"] = hits
         st.session_state["records"] = records
-        st.session_state["codes"] = [next(iter(d)) for d in records]
+        st.session_state["codes"] = list(dict.fromkeys(next(iter(d)) for d in records))
         st.session_state["selected_codes"] = st.session_state["codes"]  # default all selected
 
 
@@ -123,7 +101,16 @@ if st.button("Analizza / Aggiorna") or st.session_state.get("records") is None:
 # ---------------------------------------------------------------------------
 records = st.session_state.get("records")
 if records:
-    st.success(f"Trovati {len(records)} codici nel foglio '{sheet_name}'.")
+    where = "in tutti i fogli" if all_sheets else f"nel foglio '{sheet_name}'"
+    st.success(f"Trovati {len(records)} codici {where}.")
+
+    hits: List[Hit] = st.session_state.get("hits") or []
+    with st.expander("📍 Posizioni dei codici trovati"):
+        st.dataframe(
+            [{"Foglio": h.sheet, "Riga": h.row, "Colonna": h.column, "Codice": h.code,
+              "Tipo": "CRITERIO" if h.kind == "sub" else "codice - descrizione"} for h in hits],
+            hide_index=True,
+        )
 
     selected = st.multiselect(
         "Seleziona i codici da esportare",
@@ -0,0 +1,99 @@
+"""Scansione in un solo passaggio delle colonne di un foglio Excel.
+
+Nei fogli aperti in sola lettura ``sheet["A5"]`` rilegge l'XML del foglio
+dall'inizio, quindi un ciclo di accessi per cella è quadratico nel numero di
+righe. Qui le righe vengono lette una volta sola con ``iter_rows`` (solo le
+colonne richieste) e ogni cella è confrontata con ``RE_SUB``/``RE_MAIN``.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+# Regex pattern per criteri
+RE_SUB = re.compile(r"^\s*CRITERIO\s+([A-Z]\d(?:\.\d+)*)", re.IGNORECASE)
+RE_MAIN = re.compile(r"^\s*([A-Z]\d+)\s*[- ]\s*(.+)")
+
+
+@dataclass
+class Hit:
+    sheet: str
+    row: int
+    column: str
+    code: str
+    description: Optional[str]  # None per un "CRITERIO X" senza cella successiva
+    kind: str  # "sub" (RE_SUB, descrizione nella cella sotto) o "main" (RE_MAIN, descrizione sulla stessa riga)
+
+
+def parse_columns(spec: str) -> List[str]:
+    """``"a, C"`` → ``["A", "C"]``; solleva ``ValueError`` per lettere non valide."""
+    letters = [part.strip().upper() for part in spec.split(",") if part.strip()]
+    for letter in letters:
+        column_index_from_string(letter)
+    return letters
+
+
+def iter_cells(sheet, columns: Sequence[str], row_start: int = 1,
+               row_end: Optional[int] = None) -> Iterator[Tuple[int, str, str]]:
+    """``(riga, colonna, testo)`` delle celle non vuote, riga per riga, in una sola lettura del foglio."""
+    indexes = sorted({column_index_from_string(c.upper()) for c in columns})
+    if not indexes:
+        return
+    first = indexes[0]
+    wanted = [(i - first, get_column_letter(i)) for i in indexes]
+    rows = sheet.iter_rows(min_row=row_start, max_row=row_end, min_col=first, max_col=indexes[-1], values_only=True)
+    for row, values in enumerate(rows, start=row_start):
+        for pos, letter in wanted:
+            value = values[pos] if pos < len(values) else None
+            if value is None:
+                continue
+            text = str(value).strip()
+            if text:
+                yield row, letter, text
+
+
+def scan_sheet(sheet, columns: Sequence[str], row_start: int = 1, row_end: Optional[int] = None,
+               sheet_name: Optional[str] = None) -> List[Hit]:
+    """Tutte le occorrenze di ``RE_SUB``/``RE_MAIN`` nelle colonne indicate.
+
+    Come ``_parse_records`` dell'app, dopo un ``CRITERIO X`` la cella non vuota
+    successiva della stessa colonna è la sua descrizione (anche se a sua volta
+    somiglia a un codice).
+    """
+    name = sheet_name if sheet_name is not None else getattr(sheet, "title", "")
+    hits: List[Hit] = []
+    pending: Dict[str, Hit] = {}  # colonna → CRITERIO in attesa di descrizione
+    for row, column, text in iter_cells(sheet, columns, row_start, row_end):
+        waiting = pending.pop(column, None)
+        if waiting is not None:
+            waiting.description = text
+            continue
+
+        m_sub = RE_SUB.match(text)
+        if m_sub:
+            hit = Hit(name, row, column, m_sub.group(1), None, "sub")
+            hits.append(hit)
+            pending[column] = hit
+            continue
+
+        m_main = RE_MAIN.match(text)
+        if m_main:
+            hits.append(Hit(name, row, column, m_main.group(1), m_main.group(2).strip(), "main"))
+    return hits
+
+
+def scan_workbook(workbook, columns: Sequence[str], sheet_names: Optional[Iterable[str]] = None) -> List[Hit]:
+    """Scansione di più fogli (tutti se ``sheet_names`` è None), nell'ordine del workbook."""
+    names = workbook.sheetnames if sheet_names is None else list(sheet_names)
+    hits: List[Hit] = []
+    for name in names:
+        hits.extend(scan_sheet(workbook[name], columns, sheet_name=name))
+    return hits
+
+
+def records_from_hits(hits: Iterable[Hit]) -> List[Dict[str, str]]:
+    """Record ``{codice: descrizione}`` come li produceva ``_parse_records`` (i CRITERIO senza descrizione sono scartati)."""
+    return [{hit.code: hit.description} for hit in hits if hit.description is not None]
@@ -6,89 +6,152 @@ import json
 import os
 import random
 import re
+import signal
 import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
 
-try:
-    import requests
-except ImportError as exc:  # pragma: no cover
-    sys.exit("[FATAL] Modulo 'requests' mancante – pip install requests")
+import manifest as mf
+import metrics as mx
+from ndjson_output import NdjsonWriter, is_ndjson, read_payloads
+from pipeline import Pipeline, Stage, format_snapshot
+from template_engine import CompiledTemplate, compile_template
+from submitter import SubmitResult, Submitter, log
+from watcher import DirectoryWatcher
 
 # ----------------------------------------------------
-
-def extract_soggetto(df: pd.DataFrame) -> str:
-    for idx, cell in enumerate(df.iloc[:, 0].astype(str)):
-        if "denominazione" in cell.lower():
-            for j in range(idx + 1, len(df)):
-                val = str(df.iat[j, 0]).strip()
-                if val and val.lower() != "nan":
-                    return val
-            break
+# Gli estrattori ricevono le righe di un foglio come coppie (colonna A, colonna B),
+# con i valori già normalizzati come li restituirebbe pd.read_excel(header=None):
+# celle vuote → NaN, interi salvati come float → int.
+
+Row = Tuple[Any, Any]
+
+# Pattern dei formulari: è l'unico punto da modificare se cambia il modello del formulario
+SOGGETTO_MARKER = "denominazione"  # etichetta che precede il nome del soggetto (foglio anagrafica)
+RE_CRITERIO = re.compile(r"(?i)^criterio\s+([A-Z]\d(?:\.\d)?)")  # intestazione di un criterio (foglio proposta)
+RE_GRUPPO = re.compile(r"[A-Z]\d{1,2}")  # codice di gruppo, cella intera (foglio criteri di valutazione)
+
+
+def extract_soggetto(rows: Iterable[Row]) -> str:
+    found = False
+    for cell, _ in rows:
+        if not found:
+            found = SOGGETTO_MARKER in str(cell).lower()
+            continue
+        val = str(cell).strip()
+        if val and val.lower() != "nan":
+            return val
     return "NON SPECIFICATO"
 
 
-def extract_testo(df: pd.DataFrame) -> Dict[str, str]:
-    testi: Dict[str, str] = {}
-    current: str | None = None
-    rx = re.compile(r"(?i)^criterio\s+([A-Z]\d(?:\.\d)?)")
-    for raw in df.iloc[:, 0].astype(str):
-        line = raw.strip()
-        m = rx.match(line)
+def extract_testo(rows: Iterable[Row]) -> Dict[str, str]:
+    """Testo di ogni criterio: le righe non vuote dopo la sua intestazione, unite da spazi.
+
+    Se un codice compare due volte vale la seconda sezione (nella posizione della prima).
+    """
+    sections: Dict[str, List[str]] = {}
+    current: Optional[List[str]] = None
+    match = RE_CRITERIO.match
+    for raw, _ in rows:
+        line = str(raw).strip()
+        m = match(line)
         if m:
-            current = m.group(1).upper()
-            testi[current] = ""
-        elif current:
-            testi[current] = (testi[current] + " " + line).strip()
-    return testi
+            current = sections[m.group(1).upper()] = []
+        elif current is not None and line:
+            current.append(line)
+    return {code: " ".join(lines) for code, lines in sections.items()}
 
 
-def extract_descr(df: pd.DataFrame) -> Dict[str, str]:
+def extract_descr(rows: Iterable[Row]) -> Dict[str, str]:
     descr: Dict[str, str] = {}
-    for _, row in df.iterrows():
-        k_raw = str(row.iloc[0]).strip()
-        if re.fullmatch(r"[A-Z]\d{1,2}", k_raw):
-            descr[k_raw.upper()] = str(row.iloc[1]).strip()
+    fullmatch = RE_GRUPPO.fullmatch
+    for key, value in rows:
+        k_raw = str(key).strip()
+        if fullmatch(k_raw):
+            descr[k_raw.upper()] = str(value).strip()
     return descr
 
+# ----------------------------------------------------
+# Lettura workbook in streaming (openpyxl read-only, un solo parsing del file)
+
+# Stringhe che pd.read_excel interpreta come NaN con i na_values di default
+_NA_STRINGS = frozenset({
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+}) | frozenset(ERROR_CODES)
+_NAN = float("nan")
+
+
+def _cell_value(value: Any) -> Any:
+    if value is None or (isinstance(value, str) and value in _NA_STRINGS):
+        return _NAN
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _stream_rows(ws) -> Iterator[Tuple[int, Row]]:
+    """Scorre il foglio una riga alla volta restituendo (larghezza, (A, B)).
+
+    La larghezza è la posizione dell'ultima cella non vuota, come nel reader
+    openpyxl di pandas.
+    """
+    if hasattr(ws, "reset_dimensions"):
+        ws.reset_dimensions()
+    for values in ws.iter_rows(values_only=True):
+        width = len(values)
+        while width and (values[width - 1] is None or values[width - 1] == ""):
+            width -= 1
+        yield width, (_cell_value(values[0]) if width else _NAN, _cell_value(values[1]) if width > 1 else _NAN)
+
+
+def _numeric_column(values: List[Any]) -> bool:
+    return all(v != v or (isinstance(v, (int, float)) and not isinstance(v, bool)) for v in values)
+
+
+def iter_sheet_rows(ws) -> Iterator[Row]:
+    """Righe (A, B) in modo lazy: adatto a chi può fermarsi prima della fine del foglio."""
+    for _, row in _stream_rows(ws):
+        yield row
+
+
+def read_sheet_rows(ws) -> List[Row]:
+    """Righe (A, B) dell'intero foglio con gli stessi valori del DataFrame di pd.read_excel."""
+    rows: List[Row] = []
+    last_with_data = -1
+    for idx, (width, row) in enumerate(_stream_rows(ws)):
+        rows.append(row)
+        if width:
+            last_with_data = idx
+    # pandas elimina le righe vuote in coda al foglio
+    del rows[last_with_data + 1:]
+    if not rows:
+        return rows
+
+    # Una colonna solo numerica diventa float64 se contiene decimali o celle vuote
+    columns = [list(col) for col in zip(*rows)]
+    for col in columns:
+        if _numeric_column(col) and any(isinstance(v, float) for v in col):
+            col[:] = [float(v) for v in col]
+    return list(zip(*columns))
+
 
 def rand_id() -> str:
     return f"{random.randint(0, 999_999_999):09d}"
 
 
-def update_json(template: Dict[str, Any], testi: Dict[str, str], descr: Dict[str, str], soggetto: str) -> Dict[str, Any]:
-    out = json.loads(json.dumps(template))  
-    out["soggetto"] = soggetto
-    out["idDomanda"] = rand_id()
-    for code, node in out["userCriteria"].items():
-        node["testo"] = testi.get(code.upper(), "NON FORNITO")
-        group = code.split(".")[0].upper()
-        if group in descr:
-            node["descrizione"] = descr[group]
-    return out
-
-# -----------------------------------------------------------
-
-def post_json(data: Dict[str, Any], endpoint: str, token: str, verbose: bool = False) -> None:
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {token.strip()}" if not token.lower().startswith("bearer ") else token,
-    }
-    try:
-        resp = requests.post(endpoint, json=data, headers=headers, timeout=30)
-    except requests.RequestException as exc:
-        print(f"[ERRORE] POST fallita: {exc}")
-        return
-
-    snippet = (resp.text or "")[:300]
-    if resp.ok:
-        print(f"  → POST OK {resp.status_code}: {snippet}")
-    else:
-        print(f"  → POST ERRORE {resp.status_code}: {snippet}")
-        if verbose:
-            print(f"    URL: {endpoint}\n    Headers: {headers}\n    Payload preview: {json.dumps(data)[:200]}…")
+def update_json(
+    template: Dict[str, Any] | CompiledTemplate, testi: Dict[str, str], descr: Dict[str, str], soggetto: str,
+    id_domanda: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Compila il template; per molti file conviene passare un ``CompiledTemplate`` creato una volta sola."""
+    return compile_template(template).build(testi, descr, soggetto, id_domanda or rand_id())
 
 # ------------------------------------------------------------
 # Main
@@ -99,24 +162,81 @@ def load_template(path: Path) -> Dict[str, Any]:
         return json.load(f)
 
 
-def find_sheet(xl: pd.ExcelFile, keys: List[str], fallback_index: int) -> str:
-    return next((n for n in xl.sheet_names if all(k in n.lower() for k in keys)), xl.sheet_names[fallback_index])
+def find_sheet(sheet_names: List[str], keys: List[str], fallback_index: int) -> str:
+    return next((n for n in sheet_names if all(k in n.lower() for k in keys)), sheet_names[fallback_index])
 
 
-def process_excel(xlsx: Path, template: Dict[str, Any], verbose: bool) -> Dict[str, Any]:
+def read_formulario(xlsx: Path, verbose: bool, timings: Optional[Dict[str, float]] = None) -> Tuple[str, Dict[str, str], Dict[str, str]]:
+    """Legge il formulario: (soggetto, testi dei criteri, descrizioni dei gruppi)."""
     if verbose:
         print(f"    Leggo {xlsx.name}…")
-    xl = pd.ExcelFile(xlsx, engine="openpyxl")
-
-    sh_anag = find_sheet(xl, ["anagraf"], 0)
-    sh_prop = find_sheet(xl, ["proposta", "criter"], 1)
-    sh_crit = find_sheet(xl, ["criter", "valut"], -1)
-
-    soggetto = extract_soggetto(pd.read_excel(xlsx, sheet_name=sh_anag, header=None, engine="openpyxl"))
-    testi = extract_testo(pd.read_excel(xlsx, sheet_name=sh_prop, header=None, engine="openpyxl"))
-    descr = extract_descr(pd.read_excel(xlsx, sheet_name=sh_crit, header=None, engine="openpyxl"))
+    with mx.timed(timings, "load"):
+        wb = load_workbook(xlsx, read_only=True, data_only=True, keep_links=False)
+    try:
+        sh_anag = find_sheet(wb.sheetnames, ["anagraf"], 0)
+        sh_prop = find_sheet(wb.sheetnames, ["proposta", "criter"], 1)
+        sh_crit = find_sheet(wb.sheetnames, ["criter", "valut"], -1)
+
+        with mx.timed(timings, "anagrafica"):
+            soggetto = extract_soggetto(iter_sheet_rows(wb[sh_anag]))
+        with mx.timed(timings, "proposta"):
+            testi = extract_testo(read_sheet_rows(wb[sh_prop]))
+        with mx.timed(timings, "criteri"):
+            descr = extract_descr(read_sheet_rows(wb[sh_crit]))
+    finally:
+        wb.close()
+    return soggetto, testi, descr
+
+
+def process_excel(xlsx: Path, template: Dict[str, Any] | CompiledTemplate, verbose: bool, id_domanda: Optional[str] = None,
+                  timings: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """Legge il formulario e compila il template; se passato, ``timings`` riceve la durata di ogni fase."""
+    soggetto, testi, descr = read_formulario(xlsx, verbose, timings)
+    with mx.timed(timings, "template"):
+        return update_json(template, testi, descr, soggetto, id_domanda)
+
+
+def _process_timed(xlsx: Path, template: CompiledTemplate, verbose: bool,
+                   id_domanda: Optional[str]) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    timings: Dict[str, float] = {}
+    return process_excel(xlsx, template, verbose, id_domanda, timings), timings
+
+
+def _read_timed(xlsx: Path, verbose: bool) -> Tuple[Tuple[str, Dict[str, str], Dict[str, str]], Dict[str, float]]:
+    timings: Dict[str, float] = {}
+    return read_formulario(xlsx, verbose, timings), timings
+
+
+def iter_processed(
+    files: List[Path], template: Dict[str, Any] | CompiledTemplate, workers: int, verbose: bool,
+    ids: Optional[Dict[str, str]] = None,
+) -> Iterator[Tuple[Path, Optional[Dict[str, Any]], Optional[BaseException], Dict[str, float]]]:
+    """Restituisce (file, json, errore, durate delle fasi) man mano che i file vengono elaborati.
+
+    Con ``workers > 1`` la lettura dei workbook avviene in un pool di processi e
+    i risultati arrivano in ordine di completamento. Un errore su un file viene
+    restituito insieme al file stesso e non interrompe il batch. ``ids`` associa
+    al nome del file l'``idDomanda`` da riusare.
+    """
+    ids = ids or {}
+    template = compile_template(template)
+    if workers <= 1:
+        for file in files:
+            timings: Dict[str, float] = {}
+            try:
+                yield file, process_excel(file, template, verbose, ids.get(file.name), timings), None, timings
+            except Exception as exc:
+                yield file, None, exc, timings
+        return
 
-    return update_json(template, testi, descr, soggetto)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_process_timed, file, template, verbose, ids.get(file.name)): file for file in files}
+        for fut in as_completed(futures):
+            try:
+                enriched, timings = fut.result()
+                yield futures[fut], enriched, None, timings
+            except Exception as exc:
+                yield futures[fut], None, exc, {}
 
 
 def main():
@@ -126,6 +246,27 @@ def main():
     p.add_argument("--out-dir", required=True)
     p.add_argument("--endpoint")
     p.add_argument("--token")
+    p.add_argument("--workers", type=int, default=1, help="Processi paralleli per la lettura degli Excel (default 1)")
+    p.add_argument("--concurrency", type=int, default=4, help="POST contemporanee verso --endpoint (default 4)")
+    p.add_argument("--retries", type=int, default=4, help="Tentativi aggiuntivi per POST fallite con 429/5xx o errori di rete")
+    p.add_argument("--timeout", type=float, default=30.0, help="Timeout per singola POST in secondi")
+    p.add_argument("--dead-letter", help="File NDJSON per i payload non inviati (default <out-dir>/dead_letter.ndjson)")
+    p.add_argument("--force", action="store_true", help="Rielabora e reinvia anche i file già presenti nel manifest")
+    p.add_argument("--compact", action="store_true", help="JSON su disco e corpo delle POST senza indentazione né spazi")
+    p.add_argument("--ndjson", help="Scrive tutti i payload in questo file NDJSON (con .gz compresso) invece di un JSON per file")
+    p.add_argument("--batch-size", type=int, default=1, help="Payload per POST all'endpoint batch (default 1 = una POST per file)")
+    p.add_argument("--batch-endpoint", help="Endpoint per le POST batch (default <endpoint>/batch)")
+    p.add_argument("--gzip", action="store_true", help="Comprime con gzip il corpo delle POST (Content-Encoding: gzip)")
+    p.add_argument("--metrics", help=f"File NDJSON con le durate per fase di ogni file (default <out-dir>/{mx.METRICS_NAME})")
+    p.add_argument("--profile", action="store_true", help="Salva cProfile e snapshot tracemalloc in <out-dir>/profile")
+    p.add_argument("--watch", action="store_true",
+                   help="Resta in ascolto su --excel-dir ed elabora i formulari man mano che arrivano (Ctrl-C o SIGTERM per terminare)")
+    p.add_argument("--watch-polling", action="store_true", help="Con --watch scandisce la cartella invece di usare inotify (condivisioni di rete)")
+    p.add_argument("--poll-interval", type=float, default=2.0, help="Secondi tra due scansioni della cartella in polling (default 2)")
+    p.add_argument("--queue-size", type=int, default=8, help="Con --watch, elementi massimi in coda davanti a ogni stadio (default 8)")
+    p.add_argument("--status-interval", type=float, default=30.0, help="Con --watch, secondi tra due righe di stato delle code (default 30)")
+    p.add_argument("--batch-max-age", type=float, default=2.0,
+                   help="Con --watch e --batch-size, secondi massimi di attesa di un batch incompleto prima dell'invio (default 2)")
     p.add_argument("--verbose", action="store_true", help="Log dettagliato")
     args = p.parse_args()
 
@@ -140,27 +281,276 @@ def main():
     if args.verbose:
         print(f"[DEBUG] Excel dir: {excel_dir}\n[DEBUG] Output dir: {out_dir}\n[DEBUG] Template: {args.template}")
     template_json = load_template(Path(args.template))
+    compiled = CompiledTemplate(template_json)
+
+    watcher: Optional[DirectoryWatcher] = None
+    if args.watch:
+        if not excel_dir.is_dir():
+            sys.exit(f"[FATAL] --watch: la cartella {excel_dir} non esiste")
+        # Creato prima dell'elenco iniziale: i file che arrivano nel frattempo non vanno persi
+        watcher = DirectoryWatcher(excel_dir, poll_interval=args.poll_interval, force_polling=args.watch_polling)
 
     excel_files = list(excel_dir.glob("*.xls*"))
-    if not excel_files:
+    if not excel_files and watcher is None:
         print(f"[WARN] Nessun file .xls* trovato in {excel_dir}")
         sys.exit(0)
 
+    manifest = mf.Manifest(out_dir)
+    template_hash = mf.template_sha256(template_json)
+
+    metrics = mx.MetricsLog(Path(args.metrics) if args.metrics else out_dir / mx.METRICS_NAME)
+    profiler = mx.Profiler(out_dir / "profile") if args.profile else None
+    if profiler is not None:
+        if args.workers > 1:
+            print("[WARN] --profile con --workers > 1: la lettura degli Excel nei processi figli non compare nel profilo")
+        profiler.start()
+
+    def record_post(result: SubmitResult) -> None:
+        manifest.update(result.name, post_status=mf.POST_OK if result.ok else mf.POST_FAILED, http_status=result.status)
+        metrics.flush(
+            result.name, http_status=result.status, post_ok=result.ok, post_latency=round(result.elapsed, 4),
+            post_attempts=result.attempts, post_bytes=result.payload_bytes,
+        )
+
+    submitter: Optional[Submitter] = None
+    if args.endpoint:
+        dead_letter = Path(args.dead_letter) if args.dead_letter else out_dir / "dead_letter.ndjson"
+        submitter = Submitter(
+            args.endpoint, token, concurrency=args.concurrency, timeout=args.timeout,
+            retries=args.retries, dead_letter=dead_letter, verbose=args.verbose, on_result=record_post,
+            compact=args.compact, batch_size=args.batch_size, batch_endpoint=args.batch_endpoint, gzip=args.gzip,
+        )
+    # In --watch ogni riga va subito su disco: chi legge il file non aspetta la chiusura del demone
+    ndjson = NdjsonWriter(Path(args.ndjson).expanduser().resolve(), flush_lines=args.watch) if args.ndjson else None
+
+    started = time.perf_counter()
+    hashes = {file.name: mf.file_sha256(file) for file in excel_files}
+    to_process: List[Path] = []
+    to_resend: List[Path] = []
+    skipped = 0
     for file in excel_files:
-        print(f"[INFO] {file.name}")
-        enriched = process_excel(file, template_json, args.verbose)
-
-        out_path = out_dir / f"{file.stem}.json"
-        with open(out_path, "w", encoding="utf-8") as fout:
-            json.dump(enriched, fout, ensure_ascii=False, indent=4)
-        print(f"  ↳ salvato {out_path.name} (idDomanda {enriched['idDomanda']})")
-
-        if args.endpoint:
+        entry = manifest.get(file.name)
+        if args.force or not entry:
+            to_process.append(file)
+        elif manifest.is_current(file.name, hashes[file.name], template_hash, need_post=submitter is not None):
+            skipped += 1
+        elif manifest.is_current(file.name, hashes[file.name], template_hash, need_post=False):
+            to_resend.append(file)
+        else:
+            to_process.append(file)
+    if skipped or to_resend:
+        print(f"[INFO] Manifest: {skipped} file invariati saltati, {len(to_resend)} da reinviare, {len(to_process)} da elaborare")
+
+    ndjson_payloads: Dict[str, Dict[str, Dict[str, Any]]] = {}  # file NDJSON → payload per Excel
+    for file in to_resend:
+        entry = manifest.get(file.name)
+        if is_ndjson(entry["output"]):
+            if entry["output"] not in ndjson_payloads:
+                ndjson_payloads[entry["output"]] = read_payloads(Path(entry["output"]), (f.name for f in to_resend))
+            payload = ndjson_payloads[entry["output"]].get(file.name)
+            if payload is None:
+                print(f"[WARN] {file.name}: payload non trovato in {entry['output']}, il file viene rielaborato")
+                to_process.append(file)
+                continue
+        else:
+            with open(entry["output"], "r", encoding="utf-8") as fin:
+                payload = json.load(fin)
+        log(f"[INFO] {file.name} (invariato, ripresa invio idDomanda {entry['idDomanda']})")
+        metrics.update(file.name, resend=True)
+        submitter.submit(file.name, payload)
+
+    saved: List[str] = []
+    failed: List[str] = []
+
+    def record_error(file: Path, exc: BaseException, timings: Dict[str, float]) -> None:
+        log(f"  ✗ ERRORE durante l'elaborazione ({file.name}): {exc!r}")
+        failed.append(file.name)
+        metrics.flush(file.name, stages=timings, error=repr(exc))
+
+    def save_output(file: Path, sha256: str, enriched: Dict[str, Any], timings: Dict[str, float]) -> None:
+        """Scrive il JSON (o la riga NDJSON) e aggiorna metriche e manifest; l'invio resta a chi chiama."""
+        if ndjson is not None:
+            out_path = ndjson.path
+            with mx.timed(timings, "write"):
+                json_bytes = ndjson.write(file.name, enriched["idDomanda"], compiled.dumps(enriched, compact=True))
+            log(f"  ↳ aggiunto a {out_path.name} (idDomanda {enriched['idDomanda']})")
+        else:
+            out_path = out_dir / f"{file.stem}.json"
+            with mx.timed(timings, "write"):
+                with open(out_path, "w", encoding="utf-8") as fout:
+                    fout.write(compiled.dumps(enriched, compact=args.compact))
+            json_bytes = out_path.stat().st_size
+            log(f"  ↳ salvato {out_path.name} (idDomanda {enriched['idDomanda']})")
+        metrics.update(file.name, stages=timings, json_bytes=json_bytes, idDomanda=enriched["idDomanda"])
+        manifest.update(
+            file.name, sha256=sha256, template_sha256=template_hash, idDomanda=enriched["idDomanda"],
+            output=str(out_path), post_status=mf.POST_PENDING if submitter is not None else mf.POST_NOT_SENT,
+        )
+        saved.append(file.name)
+
+    def watch_folder(initial: List[Path]) -> None:
+        """Elabora ``initial`` e poi i file che arrivano, in una pipeline lettura → template → scrittura → POST.
+
+        Tra uno stadio e l'altro ci sono code da ``--queue-size`` elementi: se
+        l'endpoint rallenta, ``Submitter.submit`` blocca, la coda delle POST si
+        riempie e il blocco risale fino al watcher, che smette di accodare file.
+        """
+        pool = ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+        stop = threading.Event()
+
+        def flush_batch() -> None:
+            """Un file finito con errore non deve lasciare fermi nel batch i payload già accodati."""
+            if submitter is not None and submitter.buffered:
+                submitter.flush()
+
+        def read(file: Path):
+            sha256 = mf.file_sha256(file)
+            entry = manifest.get(file.name)
+            if entry and not args.force and manifest.is_current(file.name, sha256, template_hash, need_post=submitter is not None):
+                return None  # riscritto con lo stesso contenuto
+            log(f"[INFO] {file.name}")
+            timings: Dict[str, float] = {}
+            try:
+                if pool is not None:
+                    read_result, timings = pool.submit(_read_timed, file, args.verbose).result()
+                else:
+                    read_result = read_formulario(file, args.verbose, timings)
+            except Exception as exc:
+                record_error(file, exc, timings)
+                flush_batch()
+                return None
+            return file, sha256, entry["idDomanda"] if entry else None, read_result, timings
+
+        def build(item):
+            file, sha256, id_domanda, (soggetto, testi, descr), timings = item
+            with mx.timed(timings, "template"):
+                enriched = update_json(compiled, testi, descr, soggetto, id_domanda)
+            return file, sha256, enriched, timings
+
+        def write(item):
+            file, sha256, enriched, timings = item
+            save_output(file, sha256, enriched, timings)
+            if submitter is None:
+                metrics.flush(file.name)
+                return None
+            return file, enriched
+
+        def post(item):
+            file, enriched = item
             if args.verbose:
-                print(f"  → POST a {args.endpoint}…")
-            post_json(enriched, args.endpoint, token, args.verbose)
-
-    print("\n[FINE] Elaborazione completata.")
+                log(f"  → POST a {args.endpoint}…")
+            submitter.submit(file.name, enriched)  # blocca con 2 * --concurrency invii in corso
+            if submitter.batch_size > 1 and pipeline.idle_upstream("post"):
+                submitter.flush()  # nessun altro file in arrivo: il batch parte senza aspettare di riempirsi
+
+        def post_idle() -> None:
+            # Coda delle POST vuota da un tick: il batch incompleto parte entro --batch-max-age
+            if submitter.batch_age >= args.batch_max_age:
+                submitter.flush()
+
+        def on_error(stage: Stage, item: Any, exc: BaseException) -> None:
+            if item is None:  # errore in on_idle, non legato a un file
+                log(f"[ERRORE] fase {stage.name}: {exc!r}")
+                return
+            file = item if isinstance(item, Path) else item[0]
+            log(f"[ERRORE] {file.name}: fase {stage.name} fallita: {exc!r}")
+            failed.append(file.name)
+            metrics.flush(file.name, error=repr(exc))
+            flush_batch()
+
+        def status() -> Dict[str, Any]:
+            snap = pipeline.snapshot()
+            if submitter is not None:
+                snap["post"] = {"in_flight": submitter.in_flight, "max_in_flight": 2 * submitter.concurrency,
+                                "buffered": submitter.buffered}
+            return snap
+
+        def report() -> None:
+            while not stop.wait(args.status_interval):
+                snap = status()
+                metrics.snapshot("queues", **snap)
+                busy = any(s["queue"] or s["busy"] for s in snap["stages"].values())
+                if busy or snap.get("post", {}).get("in_flight") or args.verbose:
+                    post_info = snap.get("post")
+                    log(f"[STATO] {format_snapshot(snap)}"
+                          + (f" · POST in volo {post_info['in_flight']}/{post_info['max_in_flight']}" if post_info else ""))
+
+        def request_stop(signum, frame) -> None:
+            print(f"\n[INFO] Arresto richiesto ({signal.Signals(signum).name}): completo i file già in coda, ripetere per uscire subito")
+            stop.set()
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+        size = max(1, args.queue_size)
+        stages = [Stage("read", read, workers=max(1, args.workers), maxsize=size),
+                  Stage("build", build, maxsize=size), Stage("write", write, maxsize=size)]
+        if submitter is not None:
+            batched = submitter.batch_size > 1
+            stages.append(Stage("post", post, maxsize=size, on_idle=post_idle if batched else None,
+                                tick=min(1.0, max(0.05, args.batch_max_age / 2))))
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+        pipeline = Pipeline(stages, on_error=on_error)
+        reporter = threading.Thread(target=report, name="status", daemon=True)
+        reporter.start()
+        print(f"[INFO] In ascolto su {excel_dir} ({watcher.mode}), {len(initial)} file già presenti da elaborare")
+        try:
+            for file in initial:
+                if stop.is_set():
+                    break
+                pipeline.put(file)
+            for file in watcher.watch(stop):
+                pipeline.put(file)  # blocca se la pipeline è piena
+        finally:
+            stop.set()
+            pipeline.close()
+            if pool is not None:
+                pool.shutdown()
+            metrics.snapshot("queues", **status())
+
+    if watcher is not None:
+        watch_folder(to_process)
+    else:
+        # Un file già visto mantiene il suo idDomanda anche se il contenuto è cambiato
+        ids = {f.name: manifest.get(f.name)["idDomanda"] for f in to_process if manifest.get(f.name)}
+        for file, enriched, exc, timings in iter_processed(to_process, compiled, args.workers, args.verbose, ids):
+            log(f"[INFO] {file.name}")
+            if exc is not None:
+                record_error(file, exc, timings)
+                continue
+            save_output(file, hashes[file.name], enriched, timings)
+            if submitter is not None:
+                if args.verbose:
+                    log(f"  → POST a {args.endpoint}…")
+                submitter.submit(file.name, enriched)
+            else:
+                metrics.flush(file.name)
+
+    if ndjson is not None and ndjson.lines:
+        ndjson.close()
+        print(f"\n[INFO] {ndjson.lines} payload aggiunti a {ndjson.path}")
+    post_failed: List[str] = []
+    if submitter is not None:
+        results = submitter.close()
+        post_failed = [r.name for r in results if not r.ok]
+        print(f"\n[POST] {len(results) - len(post_failed)}/{len(results)} inviati")
+        if post_failed:
+            print(f"[WARN] {len(post_failed)} payload non inviati, salvati in {submitter.dead_letter}")
+    manifest.close()
+
+    elapsed = time.perf_counter() - started
+    if profiler is not None:
+        profiler.stop()
+    summary = metrics.close(elapsed)
+    if summary["files"]:
+        print(f"\n[METRICHE] Durate per fase ({metrics.path}):\n{mx.format_summary(summary)}")
+    done = len(saved)
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f"\n[FINE] Elaborazione completata: {done}/{done + len(failed)} file in {elapsed:.2f}s ({rate:.2f} file/s, workers={args.workers}), {skipped} invariati")
+    if failed:
+        print(f"[WARN] {len(failed)} file con errori: {', '.join(failed)}")
+    if failed or post_failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,102 @@
+"""Manifest dei file elaborati, salvato nella cartella di output.
+
+Per ogni Excel registra hash del contenuto, hash del template, ``idDomanda``
+assegnato, percorso del JSON e stato della POST. Il file è un journal NDJSON
+in sola aggiunta (l'ultima riga per file vince), così un batch interrotto
+lascia comunque un manifest coerente da cui ripartire; alla chiusura viene
+compattato a una riga per file.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import IO, Any, Dict, Optional
+
+MANIFEST_NAME = "manifest.ndjson"
+
+# Valori di post_status
+POST_PENDING = "pending"
+POST_OK = "ok"
+POST_FAILED = "failed"
+POST_NOT_SENT = "not_sent"
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def template_sha256(template: Dict[str, Any]) -> str:
+    canonical = json.dumps(template, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def open_journal(path: Path) -> IO[str]:
+    """Apre il journal in aggiunta, chiudendo prima un'ultima riga lasciata a metà da un'interruzione.
+
+    Senza l'a capo il record successivo finirebbe attaccato alla riga troncata
+    e andrebbe perso alla lettura insieme a lei.
+    """
+    torn = False
+    if path.exists() and path.stat().st_size:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b"\n"
+    journal = open(path, "a", encoding="utf-8")
+    if torn:
+        journal.write("\n")
+        journal.flush()
+    return journal
+
+
+class Manifest:
+    def __init__(self, out_dir: Path) -> None:
+        self.path = out_dir / MANIFEST_NAME
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # riga troncata da un'interruzione
+                    if isinstance(record, dict) and record.get("file"):
+                        self.entries.setdefault(record["file"], {}).update(record)
+        self._journal = open_journal(self.path)
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(name)
+
+    def update(self, name: str, **fields: Any) -> None:
+        with self._lock:
+            entry = self.entries.setdefault(name, {"file": name})
+            entry.update(fields, updated_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+            self._journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._journal.flush()
+
+    def is_current(self, name: str, sha256: str, template_hash: str, need_post: bool) -> bool:
+        """True se il file è invariato, il JSON esiste e (se serve) la POST è già andata a buon fine."""
+        entry = self.entries.get(name)
+        if not entry or entry.get("sha256") != sha256 or entry.get("template_sha256") != template_hash:
+            return False
+        if not entry.get("output") or not Path(entry["output"]).exists():
+            return False
+        return not need_post or entry.get("post_status") == POST_OK
+
+    def close(self) -> None:
+        """Riscrive il journal con una sola riga per file."""
+        with self._lock:
+            self._journal.close()
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(tmp, self.path)
@@ -0,0 +1,182 @@
+"""Metriche per file del batch REST e profilazione opzionale.
+
+Per ogni Excel viene scritta una riga JSON in ``metrics.ndjson`` con la durata
+delle fasi (apertura del workbook, i tre estrattori, compilazione del
+template, scrittura del JSON), la dimensione del payload e, se inviato,
+stato HTTP, latenza e tentativi della POST. La riga è scritta quando il file
+è concluso: subito se non c'è invio, altrimenti alla risposta della POST.
+In chiusura si aggiunge una riga ``"type": "summary"`` con gli aggregati.
+In modalità ``--watch`` si aggiungono periodicamente righe ``"type": "queues"``
+con profondità delle code e contatori di ogni stadio della pipeline.
+
+``Profiler`` raccoglie cProfile e uno snapshot tracemalloc del processo
+principale (con ``--workers > 1`` la lettura degli Excel avviene nei processi
+figli e non compare nel profilo; le POST girano in thread non profilati).
+"""
+from __future__ import annotations
+
+import cProfile
+import json
+import math
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+METRICS_NAME = "metrics.ndjson"
+
+# Fasi nell'ordine in cui avvengono
+STAGES = ("load", "anagrafica", "proposta", "criteri", "template", "write")
+
+
+@contextmanager
+def timed(timings: Optional[Dict[str, float]], stage: str) -> Iterator[None]:
+    """Aggiunge a ``timings[stage]`` la durata del blocco (nessun effetto se ``timings`` è None)."""
+    if timings is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - t0
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def _distribution(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "total": round(sum(values), 4),
+        "mean": round(sum(values) / len(values), 4) if values else 0.0,
+        "p50": round(_percentile(values, 50), 4),
+        "p95": round(_percentile(values, 95), 4),
+        "max": round(max(values), 4) if values else 0.0,
+    }
+
+
+class MetricsLog:
+    """Record per file costruiti a pezzi (``update``) e scritti con ``flush``; thread-safe."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._written: List[Dict[str, Any]] = []
+        self._out = open(path, "w", encoding="utf-8")
+
+    def update(self, name: str, **fields: Any) -> None:
+        with self._lock:
+            self._pending.setdefault(name, {"type": "file", "file": name}).update(fields)
+
+    def flush(self, name: str, **fields: Any) -> None:
+        with self._lock:
+            record = self._pending.pop(name, {"type": "file", "file": name})
+            record.update(fields)
+            if "stages" in record:
+                record["stages"] = {k: round(v, 4) for k, v in record["stages"].items()}
+            self._written.append(record)
+            self._out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._out.flush()
+
+    def snapshot(self, kind: str, **fields: Any) -> None:
+        """Riga ``{"type": kind, "ts": ..., **fields}`` fuori dai record per file (esclusa dal riepilogo)."""
+        record = {"type": kind, "ts": round(time.time(), 3), **fields}
+        with self._lock:
+            self._out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._out.flush()
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        with self._lock:
+            records = list(self._written)
+        stages: Dict[str, List[float]] = {}
+        for record in records:
+            for stage, seconds in record.get("stages", {}).items():
+                stages.setdefault(stage, []).append(seconds)
+        order = [s for s in STAGES if s in stages] + sorted(set(stages) - set(STAGES))
+        posts = [r for r in records if "http_status" in r]
+        processed = [r for r in records if "stages" in r and "error" not in r]
+        return {
+            "type": "summary",
+            "files": len(records),
+            "processed": len(processed),
+            "errors": sum(1 for r in records if "error" in r),
+            "elapsed": round(elapsed, 4),
+            "files_per_second": round(len(processed) / elapsed, 3) if elapsed > 0 else 0.0,
+            "stages": {stage: _distribution(stages[stage]) for stage in order},
+            "json_bytes": sum(r.get("json_bytes", 0) for r in records),
+            "post": {
+                "sent": len(posts),
+                "ok": sum(1 for r in posts if r.get("post_ok")),
+                "retries": sum(max(0, r.get("post_attempts", 1) - 1) for r in posts),
+                "bytes": sum(r.get("post_bytes", 0) for r in posts),
+                "latency": _distribution([r["post_latency"] for r in posts if "post_latency" in r]),
+            },
+        }
+
+    def close(self, elapsed: float) -> Dict[str, Any]:
+        """Scrive i record ancora aperti e la riga di riepilogo; restituisce il riepilogo."""
+        with self._lock:
+            leftover = list(self._pending)
+        for name in leftover:
+            self.flush(name)
+        summary = self.summary(elapsed)
+        with self._lock:
+            self._out.write(json.dumps(summary, ensure_ascii=False) + "\n")
+            self._out.close()
+        return summary
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    lines = [f"{'fase':<12} {'totale':>9} {'media':>9} {'p50':>9} {'p95':>9} {'max':>9}"]
+    for stage, d in summary["stages"].items():
+        lines.append(f"{stage:<12} {d['total']:>8.2f}s {d['mean'] * 1000:>7.1f}ms {d['p50'] * 1000:>7.1f}ms "
+                     f"{d['p95'] * 1000:>7.1f}ms {d['max'] * 1000:>7.1f}ms")
+    post = summary["post"]
+    if post["sent"]:
+        d = post["latency"]
+        lines.append(f"{'post':<12} {d['total']:>8.2f}s {d['mean'] * 1000:>7.1f}ms {d['p50'] * 1000:>7.1f}ms "
+                     f"{d['p95'] * 1000:>7.1f}ms {d['max'] * 1000:>7.1f}ms")
+        lines.append(f"POST: {post['ok']}/{post['sent']} ok, {post['retries']} nuovi tentativi, "
+                     f"{post['bytes'] / 1e6:.2f} MB inviati")
+    lines.append(f"JSON scritti: {summary['json_bytes'] / 1e6:.2f} MB")
+    return "\n".join(lines)
+
+
+class Profiler:
+    """cProfile + tracemalloc del processo principale, salvati in ``directory`` allo ``stop``."""
+
+    def __init__(self, directory: Path, top: int = 30) -> None:
+        self.directory = directory
+        self.top = top
+        self._profile = cProfile.Profile()
+
+    def start(self) -> None:
+        tracemalloc.start()
+        self._profile.enable()
+
+    def stop(self) -> None:
+        self._profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._profile.dump_stats(str(self.directory / "cprofile.pstats"))
+        with open(self.directory / "cprofile.txt", "w", encoding="utf-8") as f:
+            pstats.Stats(self._profile, stream=f).sort_stats("cumulative").print_stats(self.top)
+        snapshot.dump(str(self.directory / "tracemalloc.snapshot"))
+        with open(self.directory / "tracemalloc.txt", "w", encoding="utf-8") as f:
+            f.write(f"Memoria Python: attuale {current / 1e6:.1f} MB, picco {peak / 1e6:.1f} MB\n\n")
+            for stat in snapshot.statistics("lineno")[:self.top]:
+                f.write(f"{stat}\n")
+        print(f"[INFO] Profilo salvato in {self.directory} (cprofile.txt, tracemalloc.txt; "
+              f"picco memoria Python {peak / 1e6:.1f} MB)")
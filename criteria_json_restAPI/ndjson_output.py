@@ -0,0 +1,209 @@
+"""Tutti i payload in un solo file NDJSON (facoltativamente gzip) invece di un JSON per workbook.
+
+Ogni riga è ``{"file": <nome dell'Excel>, "idDomanda": ..., "payload": {...}}``
+con il payload compatto. Il file è aperto in aggiunta, come il manifest:
+una riesecuzione aggiunge solo i file rielaborati e per ogni Excel vale
+l'ultima riga. Con estensione ``.gz`` ogni esecuzione aggiunge un membro gzip.
+
+Un'esecuzione interrotta può lasciare in fondo una riga a metà o un membro
+gzip troncato. Prima di aggiungere, il writer chiude la riga con un a capo
+(come ``manifest.open_journal``) oppure riporta il file alla fine dell'ultimo
+membro integro e ricomprime in un membro nuovo le righe intere di quello
+troncato. In lettura un membro danneggiato viene saltato e si riprende dal
+membro successivo.
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import shutil
+import tempfile
+import threading
+import zlib
+from pathlib import Path
+from typing import IO, Any, BinaryIO, Dict, Iterable, Iterator, Optional, Tuple
+
+from manifest import open_journal
+
+_GZIP_MAGIC = b"\x1f\x8b\x08"
+_CHUNK = 1 << 16
+
+
+def is_ndjson(path: str | Path) -> bool:
+    name = str(path).lower()
+    return name.endswith((".ndjson", ".jsonl", ".ndjson.gz", ".jsonl.gz"))
+
+
+def _next_member(f: BinaryIO, offset: int) -> Optional[int]:
+    """Offset della prossima intestazione gzip da ``offset`` in poi (None se non ce ne sono)."""
+    f.seek(offset)
+    carry = b""
+    while True:
+        chunk = f.read(_CHUNK)
+        if not chunk:
+            return None
+        found = (carry + chunk).find(_GZIP_MAGIC)
+        if found >= 0:
+            return offset - len(carry) + found
+        offset += len(chunk)
+        carry = chunk[-(len(_GZIP_MAGIC) - 1):]
+
+
+def _gzip_members(f: BinaryIO) -> Iterator[Tuple[int, Optional[bytes]]]:
+    """Decomprime di seguito i membri gzip di ``f``: ``(inizio del membro, dati)`` e, a membro integro, ``(fine, None)``.
+
+    Un membro troncato o danneggiato finisce senza ``None`` e la lettura
+    riprende dalla prima intestazione gzip successiva al suo inizio.
+    """
+    start = 0
+    while True:
+        f.seek(start)
+        decompressor = zlib.decompressobj(wbits=31)
+        position = start
+        try:
+            while not decompressor.eof:
+                chunk = f.read(_CHUNK)
+                if not chunk:
+                    break
+                position += len(chunk)
+                data = decompressor.decompress(chunk)
+                if data:
+                    yield start, data
+        except zlib.error:
+            pass
+        if decompressor.eof:
+            start = position - len(decompressor.unused_data)
+            yield start, None
+            continue
+        following = _next_member(f, start + 1)
+        if following is None:
+            return
+        start = following
+
+
+def _repair_gzip(path: Path) -> None:
+    """Tronca ``path`` alla fine dell'ultimo membro integro; le righe intere del membro troncato vanno in un membro nuovo."""
+    good_end = 0
+    with open(path, "rb") as f:
+        for offset, data in _gzip_members(f):
+            if data is None:
+                good_end = offset
+    if good_end == path.stat().st_size:
+        return
+    with open(path, "r+b") as f, tempfile.TemporaryFile() as salvage:
+        f.seek(good_end)
+        decompressor = zlib.decompressobj(wbits=31)
+        pending = b""
+        try:
+            for chunk in iter(lambda: f.read(_CHUNK), b""):
+                pending += decompressor.decompress(chunk)
+                cut = pending.rfind(b"\n") + 1
+                salvage.write(pending[:cut])
+                pending = pending[cut:]
+        except zlib.error:
+            pass
+        f.truncate(good_end)
+        if salvage.tell():
+            salvage.seek(0)
+            f.seek(good_end)
+            with gzip.GzipFile(fileobj=f, mode="wb", compresslevel=6) as member:
+                shutil.copyfileobj(salvage, member)
+
+
+def _open_append(path: Path) -> IO[str]:
+    """Apre in aggiunta dopo aver riparato la coda lasciata da un'esecuzione interrotta."""
+    if path.suffix != ".gz":
+        return open_journal(path)
+    if path.exists() and path.stat().st_size:
+        _repair_gzip(path)
+    return gzip.open(path, "at", encoding="utf-8", compresslevel=6)
+
+
+def _lines(path: Path) -> Iterator[bytes]:
+    """Righe intere del file; di un membro gzip troncato restano solo quelle complete."""
+    with open(path, "rb") as f:
+        if path.suffix != ".gz":
+            yield from f
+            return
+        member, buffer = None, b""
+        for offset, data in _gzip_members(f):
+            if data is None:
+                if buffer:
+                    yield buffer
+                member, buffer = None, b""
+                continue
+            if offset != member:
+                member, buffer = offset, b""  # il membro precedente si è interrotto a metà riga
+            *lines, buffer = (buffer + data).split(b"\n")
+            yield from lines
+
+
+def format_line(name: str, id_domanda: Any, payload_json: str) -> str:
+    """Riga NDJSON dal payload già serializzato in forma compatta (senza ricodificarlo)."""
+    return f'{{"file":{json.dumps(name, ensure_ascii=False)},"idDomanda":{json.dumps(id_domanda)},"payload":{payload_json}}}\n'
+
+
+class NdjsonWriter:
+    """Il file viene aperto alla prima riga: un'esecuzione senza file da elaborare non lo tocca.
+
+    Con ``flush_lines`` ogni riga è scritta subito su disco (per il gzip un
+    flush di sincronizzazione: chi legge vede le righe fino a lì), come serve
+    in modalità ``--watch`` dove il file resta aperto per ore.
+    """
+
+    def __init__(self, path: Path, flush_lines: bool = False) -> None:
+        self.path = Path(path)
+        self.flush_lines = flush_lines
+        self._file: Optional[IO[str]] = None
+        self._lock = threading.Lock()
+        self.lines = 0
+
+    def write(self, name: str, id_domanda: Any, payload_json: str) -> int:
+        """Aggiunge il payload di ``name`` e restituisce i byte (non compressi) della riga."""
+        line = format_line(name, id_domanda, payload_json)
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = _open_append(self.path)
+            self._file.write(line)
+            if self.flush_lines:
+                self._file.flush()
+            self.lines += 1
+        return len(line.encode("utf-8"))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self) -> "NdjsonWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def iter_records(path: Path) -> Iterator[Dict[str, Any]]:
+    """Righe del file NDJSON; righe troncate o illeggibili (anche in un membro gzip danneggiato) sono saltate."""
+    try:
+        for line in _lines(Path(path)):
+            try:
+                record = json.loads(line.decode("utf-8"))
+            except ValueError:  # anche UnicodeDecodeError
+                continue
+            if isinstance(record, dict):
+                yield record
+    except OSError:
+        return
+
+
+def read_payloads(path: Path, names: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Ultimo payload scritto per ognuno dei file richiesti (per reinviarli senza rielaborare l'Excel)."""
+    wanted = set(names)
+    found: Dict[str, Dict[str, Any]] = {}
+    for record in iter_records(path):
+        if record.get("file") in wanted and "payload" in record:
+            found[record["file"]] = record["payload"]
+    return found
+
@@ -0,0 +1,142 @@
+"""Pipeline a stadi con code limitate tra uno stadio e il successivo.
+
+Ogni stadio ha i suoi thread e legge da una ``queue.Queue`` di capienza
+fissa: quando uno stadio rallenta (per esempio le POST verso un endpoint
+lento) la sua coda si riempie, gli stadi a monte restano fermi su ``put`` e
+il blocco risale fino a chi alimenta la pipeline, invece di accumulare
+payload in memoria. ``close`` fa finire prima gli elementi già in coda e
+poi ferma gli stadi uno alla volta, nell'ordine. ``snapshot`` restituisce
+profondità delle code e contatori di ogni stadio. Uno stadio con ``on_idle``
+lo chiama ogni ``tick`` secondi in cui la sua coda resta vuota (per esempio
+per inviare un batch rimasto a metà).
+"""
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+_STOP = object()
+
+
+@dataclass
+class Stage:
+    """``fn`` riceve un elemento e restituisce quello per lo stadio successivo (``None`` = scartato)."""
+
+    name: str
+    fn: Callable[[Any], Any]
+    workers: int = 1
+    maxsize: int = 8
+    on_idle: Optional[Callable[[], None]] = None
+    tick: float = 1.0
+    processed: int = 0
+    errors: int = 0
+    busy: int = 0
+    seconds: float = 0.0
+    queue: "queue.Queue[Any]" = field(init=False, repr=False)
+    threads: List[threading.Thread] = field(default_factory=list, repr=False)
+
+    def __post_init__(self) -> None:
+        self.queue = queue.Queue(maxsize=max(1, self.maxsize))
+
+
+class Pipeline:
+    def __init__(self, stages: Sequence[Stage],
+                 on_error: Optional[Callable[[Stage, Any, BaseException], None]] = None) -> None:
+        if not stages:
+            raise ValueError("La pipeline richiede almeno uno stadio")
+        self.stages = list(stages)
+        self.on_error = on_error
+        self._lock = threading.Lock()
+        self._started = time.time()
+        for index, stage in enumerate(self.stages):
+            following = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            for n in range(max(1, stage.workers)):
+                thread = threading.Thread(target=self._run, args=(stage, following), name=f"{stage.name}-{n}", daemon=True)
+                stage.threads.append(thread)
+                thread.start()
+
+    def put(self, item: Any) -> None:
+        """Accoda un elemento al primo stadio; blocca se la coda è piena."""
+        self.stages[0].queue.put(item)
+
+    def _run(self, stage: Stage, following: Optional[Stage]) -> None:
+        while True:
+            if stage.on_idle is None:
+                item = stage.queue.get()
+            else:
+                try:
+                    item = stage.queue.get(timeout=stage.tick)
+                except queue.Empty:
+                    self._idle(stage)
+                    continue
+            if item is _STOP:
+                return
+            with self._lock:
+                stage.busy += 1
+            t0 = time.perf_counter()
+            try:
+                result = stage.fn(item)
+            except Exception as exc:
+                result = None
+                with self._lock:
+                    stage.errors += 1
+                if self.on_error is not None:
+                    self.on_error(stage, item, exc)
+            with self._lock:
+                stage.busy -= 1
+                stage.processed += 1
+                stage.seconds += time.perf_counter() - t0
+            if result is not None and following is not None:
+                following.queue.put(result)  # blocca se lo stadio successivo è indietro
+
+    def _idle(self, stage: Stage) -> None:
+        try:
+            stage.on_idle()
+        except Exception as exc:
+            with self._lock:
+                stage.errors += 1
+            if self.on_error is not None:
+                self.on_error(stage, None, exc)
+
+    def close(self) -> None:
+        """Elabora tutto ciò che è già in coda, poi ferma gli stadi nell'ordine."""
+        for stage in self.stages:
+            for _ in stage.threads:
+                stage.queue.put(_STOP)
+            for thread in stage.threads:
+                thread.join()
+
+    def idle_upstream(self, name: str) -> bool:
+        """Vero se la coda di ``name`` e gli stadi precedenti sono vuoti (nessun elemento in arrivo)."""
+        with self._lock:
+            for stage in self.stages:
+                if stage.name == name:
+                    return stage.queue.empty()
+                if stage.busy or not stage.queue.empty():
+                    return False
+        raise KeyError(name)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "uptime": round(time.time() - self._started, 1),
+                "stages": {
+                    stage.name: {
+                        "queue": stage.queue.qsize(), "maxsize": stage.queue.maxsize, "busy": stage.busy,
+                        "processed": stage.processed, "errors": stage.errors, "seconds": round(stage.seconds, 3),
+                    }
+                    for stage in self.stages
+                },
+            }
+
+
+def format_snapshot(snapshot: Dict[str, Any]) -> str:
+    """Una riga: ``read 3/8 (1 in corso, 12 fatti) · write 0/8 ...``"""
+    return " · ".join(
+        f"{name} {s['queue']}/{s['maxsize']} ({s['busy']} in corso, {s['processed']} fatti"
+        + (f", {s['errors']} errori" if s["errors"] else "") + ")"
+        for name, s in snapshot["stages"].items()
+    )
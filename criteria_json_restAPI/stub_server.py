@@ -0,0 +1,165 @@
+"""Server locale che simula /v1/core/evaluate per provare latenza ed errori.
+
+    python3 stub_server.py --port 8800 --latency 0.2 --fail-rate 0.1 --throttle-rate 0.05
+
+Ogni POST riceve 200 con un idValutazione, oppure (con le probabilità indicate)
+un 502 o un 429 con ``Retry-After``. ``GET /stats`` restituisce i contatori.
+
+Le POST a un percorso che finisce con ``/batch`` portano un payload per riga
+(NDJSON) e ricevono ``{"results": [{"index": i, "status": ...}, ...]}``, con
+un 503 per elemento con probabilità ``--item-fail-rate`` e un 400 per le
+righe non valide. I corpi con ``Content-Encoding: gzip`` vengono decompressi.
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+
+class StubConfig:
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, fail_rate: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: float = 1.0, seed: int | None = None,
+                 item_fail_rate: float = 0.0) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.item_fail_rate = item_fail_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats: Dict[str, int] = {"requests": 0, "ok": 0, "502": 0, "429": 0, "400": 0, "bytes": 0,
+                                      "batches": 0, "items": 0, "item_503": 0}
+
+    def count(self, key: str, n: int = 1) -> None:
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + n
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: StubConfig
+
+    def log_message(self, fmt: str, *args: Any) -> None:  # silenzioso di default
+        pass
+
+    def _reply(self, status: int, body: Dict[str, Any], headers: Dict[str, str] | None = None) -> None:
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") == "/stats":
+            with self.config.lock:
+                self._reply(200, dict(self.config.stats))
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        cfg = self.config
+        raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        cfg.count("requests")
+        cfg.count("bytes", len(raw))
+
+        with cfg.lock:
+            delay = max(0.0, cfg.latency + cfg.rng.uniform(-cfg.jitter, cfg.jitter))
+            roll = cfg.rng.random()
+        time.sleep(delay)
+
+        if roll < cfg.throttle_rate:
+            cfg.count("429")
+            self._reply(429, {"error": "too many requests"}, {"Retry-After": f"{cfg.retry_after:g}"})
+            return
+        if roll < cfg.throttle_rate + cfg.fail_rate:
+            cfg.count("502")
+            self._reply(502, {"error": "bad gateway"})
+            return
+        try:
+            if self.headers.get("Content-Encoding", "").lower() == "gzip":
+                raw = gzip.decompress(raw)
+            if self.path.rstrip("/").endswith("/batch"):
+                self._batch(raw)
+                return
+            data = json.loads(raw or b"null")
+        except (ValueError, OSError, EOFError):
+            cfg.count("400")
+            self._reply(400, {"error": "invalid json"})
+            return
+        cfg.count("ok")
+        id_domanda = data.get("idDomanda") if isinstance(data, dict) else None
+        self._reply(200, {"idDomanda": id_domanda, "idValutazione": f"{cfg.rng.randint(0, 999_999):06d}"})
+
+
+    def _batch(self, raw: bytes) -> None:
+        cfg = self.config
+        results = []
+        for index, line in enumerate(raw.splitlines()):
+            with cfg.lock:
+                roll = cfg.rng.random()
+                id_valutazione = f"{cfg.rng.randint(0, 999_999):06d}"
+            try:
+                data = json.loads(line)
+            except ValueError:
+                results.append({"index": index, "status": 400, "error": "invalid json"})
+                continue
+            if roll < cfg.item_fail_rate:
+                cfg.count("item_503")
+                results.append({"index": index, "status": 503, "error": "temporarily unavailable"})
+                continue
+            id_domanda = data.get("idDomanda") if isinstance(data, dict) else None
+            results.append({"index": index, "status": 200, "idDomanda": id_domanda, "idValutazione": id_valutazione})
+        cfg.count("batches")
+        cfg.count("items", len(results))
+        cfg.count("ok")
+        self._reply(200, {"results": results})
+
+
+def serve(host: str = "127.0.0.1", port: int = 0, config: StubConfig | None = None) -> ThreadingHTTPServer:
+    """Avvia il server in un thread daemon e lo restituisce (``server.server_port`` per la porta)."""
+    handler = type("BoundStubHandler", (StubHandler,), {"config": config or StubConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Stub locale dell'endpoint /v1/core/evaluate")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8800)
+    p.add_argument("--latency", type=float, default=0.05, help="Latenza media in secondi")
+    p.add_argument("--jitter", type=float, default=0.0, help="Variazione ± della latenza in secondi")
+    p.add_argument("--fail-rate", type=float, default=0.0, help="Probabilità di risposta 502")
+    p.add_argument("--throttle-rate", type=float, default=0.0, help="Probabilità di risposta 429")
+    p.add_argument("--retry-after", type=float, default=1.0, help="Valore di Retry-After per i 429")
+    p.add_argument("--item-fail-rate", type=float, default=0.0, help="Probabilità di 503 per elemento nelle POST batch")
+    p.add_argument("--seed", type=int)
+    args = p.parse_args()
+
+    config = StubConfig(args.latency, args.jitter, args.fail_rate, args.throttle_rate, args.retry_after, args.seed,
+                        args.item_fail_rate)
+    server = serve(args.host, args.port, config)
+    print(f"[INFO] Stub in ascolto su http://{args.host}:{server.server_port}/v1/core/evaluate "
+          f"(batch: /v1/core/evaluate/batch, Ctrl+C per uscire)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        print(f"[FINE] Statistiche: {json.dumps(config.stats)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""Invio dei JSON all'endpoint REST (/v1/core/evaluate).
+
+Le POST passano da un pool di thread con una ``requests.Session`` per thread
+(keep-alive, niente handshake TLS a ogni file), con un numero massimo di
+richieste in volo, retry con backoff esponenziale e jitter che rispetta
+``Retry-After``, e un file dead-letter NDJSON per i payload che falliscono
+anche dopo l'ultimo tentativo.
+
+Con ``batch_size > 1`` i payload vengono raggruppati: una POST all'endpoint
+batch porta fino a ``batch_size`` payload, una riga NDJSON ciascuno, e la
+risposta ``{"results": [{"index": i, "status": ...}, ...]}`` riporta lo
+stato di ogni payload, che torna al suo file. Gli elementi con uno stato da
+ritentare vengono rinviati insieme al tentativo successivo. Con ``gzip`` i
+corpi delle richieste sono compressi (``Content-Encoding: gzip``).
+"""
+from __future__ import annotations
+
+import gzip as gzip_module
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Risposte per cui ha senso ritentare
+RETRY_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+# Attesa massima accettata da un Retry-After (oltre è quasi certamente un errore del server)
+RETRY_AFTER_MAX = 600.0
+
+_print_lock = threading.Lock()
+
+
+def log(message: str) -> None:
+    """Stampa una riga intera anche da più thread (``print`` scrive testo e a capo separatamente)."""
+    with _print_lock:
+        sys.stdout.write(message + "\n")
+        sys.stdout.flush()
+
+
+@dataclass
+class SubmitResult:
+    name: str
+    ok: bool
+    status: Optional[int]
+    attempts: int
+    elapsed: float
+    detail: str
+    payload_bytes: int = 0
+
+
+def build_headers(token: str) -> Dict[str, str]:
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {token.strip()}" if not token.lower().startswith("bearer ") else token,
+    }
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Secondi di attesa indicati da ``Retry-After`` (numero di secondi o data HTTP)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[float] = None,
+                  retry_after_max: float = RETRY_AFTER_MAX) -> float:
+    """Backoff esponenziale con full jitter, limitato a ``cap``.
+
+    ``Retry-After`` fa da limite inferiore ed è rispettato così com'è (non
+    tagliato a ``cap``), fino a ``retry_after_max`` secondi.
+    """
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, retry_after_max))
+    return delay
+
+
+def batch_endpoint_for(endpoint: str) -> str:
+    """Endpoint batch di default: quello singolo con ``/batch`` in fondo."""
+    return endpoint.rstrip("/") + "/batch"
+
+
+class Submitter:
+    """Coda di invio con al massimo ``concurrency`` POST in volo.
+
+    ``submit`` blocca quando ci sono già ``2 * concurrency`` payload (o batch)
+    in attesa, così un endpoint lento rallenta il produttore invece di
+    riempire la memoria.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        token: str,
+        *,
+        concurrency: int = 4,
+        timeout: float = 30.0,
+        retries: int = 4,
+        backoff: float = 0.5,
+        backoff_cap: float = 30.0,
+        dead_letter: Optional[Path] = None,
+        verbose: bool = False,
+        on_result: Optional[Callable[[SubmitResult], None]] = None,
+        compact: bool = False,
+        batch_size: int = 1,
+        batch_endpoint: Optional[str] = None,
+        gzip: bool = False,
+    ) -> None:
+        self.endpoint = endpoint
+        self.batch_size = max(1, batch_size)
+        self.batch_endpoint = batch_endpoint or batch_endpoint_for(endpoint)
+        self.gzip = gzip
+        self.headers = build_headers(token)
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.backoff_cap = backoff_cap
+        self.dead_letter = dead_letter
+        self.verbose = verbose
+        self.on_result = on_result
+        # Corpo senza spazi e con i caratteri non ASCII in UTF-8 invece di \uXXXX
+        self._dumps_options: Dict[str, Any] = {"separators": (",", ":"), "ensure_ascii": False} if compact else {}
+
+        self.results: List[SubmitResult] = []
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="post")
+        self._slots = threading.BoundedSemaphore(self.concurrency * 2)
+        self._local = threading.local()
+        self._sessions: List[requests.Session] = []
+        self._lock = threading.Lock()
+        self._batch: List[Tuple[str, Dict[str, Any]]] = []
+        self._batch_lock = threading.Lock()  # separato da _lock: _finish lo prende dai thread di invio
+        self._batch_started = 0.0  # time.monotonic() del payload più vecchio nel batch in costruzione
+        self._in_flight = 0
+
+    # -- API ---------------------------------------------------------------
+
+    def submit(self, name: str, data: Dict[str, Any]) -> Optional[Future]:
+        """Invia il payload; con i batch lo accoda e restituisce ``None`` finché il batch non è pieno."""
+        if self.batch_size == 1:
+            return self._dispatch(self._send, name, data)
+        with self._batch_lock:
+            if not self._batch:
+                self._batch_started = time.monotonic()
+            self._batch.append((name, data))
+            if len(self._batch) < self.batch_size:
+                return None
+            batch, self._batch = self._batch, []
+        return self._dispatch(self._send_batch, batch)  # fuori dal lock: può bloccare per la backpressure
+
+    def flush(self) -> Optional[Future]:
+        """Invia subito il batch in corso, anche se incompleto; sicuro da chiamare da più thread."""
+        with self._batch_lock:
+            batch, self._batch = self._batch, []
+        return self._dispatch(self._send_batch, batch) if batch else None
+
+    @property
+    def in_flight(self) -> int:
+        """Invii (payload o batch) accodati o in corso, escluso il batch ancora in costruzione."""
+        with self._lock:
+            return self._in_flight
+
+    @property
+    def batch_age(self) -> float:
+        """Secondi da cui il payload più vecchio aspetta nel batch in costruzione (0 se vuoto)."""
+        with self._batch_lock:
+            return time.monotonic() - self._batch_started if self._batch else 0.0
+
+    @property
+    def buffered(self) -> int:
+        """Payload nel batch in costruzione, non ancora inviati."""
+        with self._batch_lock:
+            return len(self._batch)
+
+    def close(self) -> List[SubmitResult]:
+        self.flush()
+        self._pool.shutdown(wait=True)
+        for session in self._sessions:
+            session.close()
+        return self.results
+
+    def __enter__(self) -> "Submitter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # -- interni -----------------------------------------------------------
+
+    def _dispatch(self, fn: Callable[..., Any], *args: Any) -> Future:
+        self._slots.acquire()
+        with self._lock:
+            self._in_flight += 1
+        try:
+            fut = self._pool.submit(fn, *args)
+        except BaseException:
+            self._done()
+            raise
+        fut.add_done_callback(lambda _: self._done())
+        return fut
+
+    def _done(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _post(self, session: requests.Session, url: str, body: bytes, content_type: str) -> requests.Response:
+        headers = {"Content-Type": content_type}
+        if self.gzip:
+            body = gzip_module.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        return session.post(url, data=body, headers=headers, timeout=self.timeout)
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update(self.headers)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def _serialize_error(self, name: str, data: Dict[str, Any], exc: Exception) -> SubmitResult:
+        """Payload non serializzabile (per esempio NaN da una cella): esito di errore senza inviare nulla."""
+        return self._finish(SubmitResult(name, False, None, 0, 0.0, f"payload non serializzabile: {type(exc).__name__}: {exc}"), data)
+
+    def _send(self, name: str, data: Dict[str, Any]) -> SubmitResult:
+        try:
+            body = json.dumps(data, allow_nan=False, **self._dumps_options).encode("utf-8")
+        except (ValueError, TypeError) as exc:
+            return self._serialize_error(name, data, exc)
+        session = self._session()
+        started = time.perf_counter()
+        status: Optional[int] = None
+        detail = ""
+        attempt = 0
+        while True:
+            attempt += 1
+            retry_after: Optional[float] = None
+            try:
+                resp = self._post(session, self.endpoint, body, "application/json")
+            except requests.RequestException as exc:
+                status, detail = None, f"{type(exc).__name__}: {exc}"
+            else:
+                status, detail = resp.status_code, (resp.text or "")[:300]
+                if resp.ok:
+                    return self._finish(SubmitResult(name, True, status, attempt, time.perf_counter() - started, detail, len(body)), data)
+                if status not in RETRY_STATUS:
+                    break
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+
+            if attempt > self.retries:
+                break
+            delay = backoff_delay(attempt - 1, self.backoff, self.backoff_cap, retry_after)
+            if self.verbose:
+                log(f"    [{name}] tentativo {attempt} fallito ({status or detail}), nuovo tentativo tra {delay:.2f}s")
+            time.sleep(delay)
+
+        return self._finish(SubmitResult(name, False, status, attempt, time.perf_counter() - started, detail, len(body)), data)
+
+    def _send_batch(self, batch: List[Tuple[str, Dict[str, Any]]]) -> List[SubmitResult]:
+        results: List[SubmitResult] = []
+        lines: List[bytes] = []
+        serializable: List[Tuple[str, Dict[str, Any]]] = []
+        for name, data in batch:
+            try:
+                lines.append(json.dumps(data, allow_nan=False, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+            except (ValueError, TypeError) as exc:
+                results.append(self._serialize_error(name, data, exc))
+                continue
+            serializable.append((name, data))
+        batch = serializable
+        if not batch:
+            return results
+        session = self._session()
+        started = time.perf_counter()
+        pending = list(range(len(batch)))  # indici nel batch ancora da inviare
+        status: Optional[int] = None
+        detail = ""
+        attempt = 0
+        while pending:
+            attempt += 1
+            retry_after: Optional[float] = None
+            try:
+                resp = self._post(session, self.batch_endpoint, b"\n".join(lines[i] for i in pending) + b"\n",
+                                  "application/x-ndjson")
+            except requests.RequestException as exc:
+                status, detail = None, f"{type(exc).__name__}: {exc}"
+            else:
+                status, detail = resp.status_code, (resp.text or "")[:300]
+                if resp.ok:
+                    try:
+                        items = {int(item["index"]): item for item in resp.json()["results"]}
+                    except (ValueError, KeyError, TypeError) as exc:
+                        status, detail = None, f"risposta batch non valida ({type(exc).__name__}: {exc}): {detail}"
+                        break
+                    retry: List[int] = []
+                    for position, i in enumerate(pending):
+                        item = items.get(position)
+                        item_status = item.get("status") if item else None
+                        item_detail = json.dumps(item, ensure_ascii=False)[:300] if item else "elemento assente dalla risposta"
+                        if item_status is not None and 200 <= item_status < 300:
+                            results.append(self._finish(SubmitResult(batch[i][0], True, item_status, attempt,
+                                                                     time.perf_counter() - started, item_detail, len(lines[i])), batch[i][1]))
+                        elif item_status in RETRY_STATUS and attempt <= self.retries:
+                            retry.append(i)
+                        else:
+                            results.append(self._finish(SubmitResult(batch[i][0], False, item_status, attempt,
+                                                                     time.perf_counter() - started, item_detail, len(lines[i])), batch[i][1]))
+                    pending = retry
+                    if not pending:
+                        break
+                elif status not in RETRY_STATUS:
+                    break
+                else:
+                    retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+
+            if attempt > self.retries:
+                break
+            delay = backoff_delay(attempt - 1, self.backoff, self.backoff_cap, retry_after)
+            if self.verbose:
+                log(f"    [batch di {len(batch)}] tentativo {attempt}: {len(pending)} payload da rinviare "
+                      f"({status or detail}), nuovo tentativo tra {delay:.2f}s")
+            time.sleep(delay)
+
+        for i in pending:  # batch rifiutato per intero o tentativi esauriti
+            results.append(self._finish(SubmitResult(batch[i][0], False, status, attempt, time.perf_counter() - started,
+                                                     detail, len(lines[i])), batch[i][1]))
+        return results
+
+    def _finish(self, result: SubmitResult, data: Dict[str, Any]) -> SubmitResult:
+        with self._lock:
+            self.results.append(result)
+            if not result.ok and self.dead_letter is not None:
+                record = {
+                    "file": result.name,
+                    "status": result.status,
+                    "attempts": result.attempts,
+                    "error": result.detail,
+                    "payload": data,
+                }
+                with open(self.dead_letter, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        if result.ok:
+            log(f"  → [{result.name}] POST OK {result.status} ({result.attempts} tentativi, {result.elapsed:.2f}s): {result.detail}")
+        else:
+            log(f"  → [{result.name}] POST ERRORE {result.status or '-'} dopo {result.attempts} tentativi: {result.detail}")
+            if self.verbose:
+                log(f"    URL: {self.endpoint}\n    Payload preview: {json.dumps(data)[:200]}…")
+        if self.on_result is not None:
+            self.on_result(result)
+        return result
@@ -0,0 +1,143 @@
+"""Template JSON compilato una volta e riusato per ogni formulario.
+
+``update_json`` copiava l'intero template con ``json.loads(json.dumps(...))``
+e ricalcolava maiuscole e gruppo di ogni codice a ogni file; il JSON veniva
+poi serializzato da zero con ``indent=4``. ``CompiledTemplate`` precalcola:
+
+- la mappa codice → (chiave in ``testi``, gruppo in ``descr``);
+- i valori predefiniti, copiati una sola volta e condivisi (sola lettura)
+  tra tutti i payload: ``build`` copia solo il livello superiore e i nodi
+  dei criteri, cioè i dizionari in cui scrive;
+- per ogni formato di output (``indent=4`` o compatto) il testo JSON del
+  template già serializzato e spezzato attorno ai campi da compilare, così
+  ``dumps`` serializza solo ``soggetto``, ``idDomanda``, ``testo`` e
+  ``descrizione``.
+
+Per un payload prodotto da ``build`` l'output di ``dumps`` è identico byte
+per byte a ``json.dumps(payload, ensure_ascii=False, indent=4)``. Il testo
+precompilato contiene i valori del template per tutti gli altri campi, quindi
+``dumps`` lo usa solo se il payload differisce dal template esclusivamente nei
+campi da compilare (stesse chiavi nello stesso ordine, stessi valori); in
+ogni altro caso, per esempio un ``maxPunti`` modificato dal chiamante, il
+payload viene serializzato con ``json.dumps``.
+"""
+from __future__ import annotations
+
+import json
+import re
+from json.encoder import encode_basestring
+from typing import Any, Dict, List, Tuple
+
+MISSING_TEXT = "NON FORNITO"
+
+_SLOT = re.compile(r'"\\u0000(\d+)\\u0000"')
+_SOGGETTO, _ID_DOMANDA = 0, 1
+_TOP_SLOTS = ("soggetto", "idDomanda", "userCriteria")
+_NODE_SLOTS = ("testo", "descrizione")
+
+
+def dumps(payload: Dict[str, Any], compact: bool = False) -> str:
+    """Serializzazione generica, con lo stesso formato di ``CompiledTemplate.dumps``."""
+    if compact:
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(payload, ensure_ascii=False, indent=4)
+
+
+def _encode(value: Any) -> str:
+    return encode_basestring(value) if type(value) is str else json.dumps(value, ensure_ascii=False)
+
+
+def _same(value: Any, expected: Any) -> bool:
+    """Stesso valore serializzato (``1``, ``1.0`` e ``True`` sono uguali per ``==`` ma non in JSON)."""
+    return value is expected or json.dumps(value) == json.dumps(expected)
+
+
+class CompiledTemplate:
+    def __init__(self, template: Dict[str, Any]) -> None:
+        self._base: Dict[str, Any] = json.loads(json.dumps(template))  # copia privata, mai modificata
+        self._nodes: Dict[str, Dict[str, Any]] = self._base["userCriteria"]
+        self._criteria: List[Tuple[str, str, str]] = [
+            (code, code.upper(), code.split(".")[0].upper()) for code in self._nodes
+        ]
+        # Il testo precompilato richiede che i campi da compilare esistano già nel template
+        # (altrimenti la loro posizione dipenderebbe dal payload)
+        self._fast = {"soggetto", "idDomanda"} <= self._base.keys() and all(
+            {"testo", "descrizione"} <= node.keys() for node in self._nodes.values()
+        )
+        self._fragments: Dict[bool, Tuple[List[str], List[int]]] = {}
+        # Campi fissi: nel testo precompilato compare il valore del template
+        self._static_top = [key for key in self._base if key not in _TOP_SLOTS]
+        self._static_node = {code: [key for key in node if key not in _NODE_SLOTS] for code, node in self._nodes.items()}
+
+    @property
+    def codes(self) -> List[str]:
+        return [code for code, _, _ in self._criteria]
+
+    def build(self, testi: Dict[str, str], descr: Dict[str, str], soggetto: str, id_domanda: str) -> Dict[str, Any]:
+        """Il payload di ``update_json`` senza copiare i valori che non cambiano."""
+        out = dict(self._base)
+        out["soggetto"] = soggetto
+        out["idDomanda"] = id_domanda
+        criteria: Dict[str, Dict[str, Any]] = {}
+        for code, key, group in self._criteria:
+            node = dict(self._nodes[code])
+            node["testo"] = testi.get(key, MISSING_TEXT)
+            if group in descr:
+                node["descrizione"] = descr[group]
+            criteria[code] = node
+        out["userCriteria"] = criteria
+        return out
+
+    def dumps(self, payload: Dict[str, Any], compact: bool = False) -> str:
+        """JSON del payload (``indent=4`` o compatto) riusando il testo precompilato del template."""
+        if not self._fast or not self._matches_template(payload):
+            return dumps(payload, compact)
+        criteria = payload["userCriteria"]
+        fragments, order = self._fragments.get(compact) or self._compile(compact)
+        values: List[Any] = [payload["soggetto"], payload["idDomanda"]]
+        for code, _, _ in self._criteria:
+            node = criteria[code]
+            values.append(node["testo"])
+            values.append(node["descrizione"])
+        parts = [fragments[0]]
+        for slot, fragment in zip(order, fragments[1:]):
+            parts.append(_encode(values[slot]))
+            parts.append(fragment)
+        return "".join(parts)
+
+    def _matches_template(self, payload: Dict[str, Any]) -> bool:
+        """Vero se il payload differisce dal template solo nei campi da compilare."""
+        base = self._base
+        if list(payload) != list(base) or not all(_same(payload[key], base[key]) for key in self._static_top):
+            return False
+        criteria = payload["userCriteria"]
+        if not isinstance(criteria, dict) or list(criteria) != list(self._nodes):
+            return False
+        for code, node in criteria.items():
+            expected = self._nodes[code]
+            if not isinstance(node, dict) or list(node) != list(expected):
+                return False
+            if not all(_same(node[key], expected[key]) for key in self._static_node[code]):
+                return False
+        return True
+
+    def _compile(self, compact: bool) -> Tuple[List[str], List[int]]:
+        probe = dict(self._base)
+        probe["soggetto"] = f"\x00{_SOGGETTO}\x00"
+        probe["idDomanda"] = f"\x00{_ID_DOMANDA}\x00"
+        criteria: Dict[str, Dict[str, Any]] = {}
+        for i, (code, _, _) in enumerate(self._criteria):
+            node = dict(self._nodes[code])
+            node["testo"] = f"\x00{2 + 2 * i}\x00"
+            node["descrizione"] = f"\x00{3 + 2 * i}\x00"
+            criteria[code] = node
+        probe["userCriteria"] = criteria
+        pieces = _SLOT.split(dumps(probe, compact))
+        # split con un gruppo: testo, slot, testo, slot, ..., testo
+        compiled = (pieces[0::2], [int(slot) for slot in pieces[1::2]])
+        self._fragments[compact] = compiled
+        return compiled
+
+
+def compile_template(template: "Dict[str, Any] | CompiledTemplate") -> CompiledTemplate:
+    return template if isinstance(template, CompiledTemplate) else CompiledTemplate(template)
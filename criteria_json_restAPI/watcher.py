@@ -0,0 +1,156 @@
+"""Sorveglianza di una cartella: restituisce i file completati man mano che arrivano.
+
+Su Linux usa inotify (tramite ``ctypes``, nessuna dipendenza): un file è
+pronto quando chi lo scrive lo chiude (``IN_CLOSE_WRITE``) o quando viene
+spostato nella cartella (``IN_MOVED_TO``, il caso dei portali che scrivono un
+file temporaneo e poi lo rinominano). Dove inotify non c'è, o non vede le
+scritture (condivisioni di rete montate via CIFS/NFS, dove gli eventi
+arrivano solo per le modifiche locali), si scandisce la cartella ogni
+``poll_interval`` secondi e un file è pronto quando dimensione e data di
+modifica restano uguali per due scansioni consecutive.
+"""
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import select
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len (poi il nome, len byte)
+
+DEFAULT_PATTERNS = ("*.xls", "*.xlsx", "*.xlsm")
+
+
+def _load_libc() -> Optional[ctypes.CDLL]:
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    return libc if hasattr(libc, "inotify_init1") else None
+
+
+class DirectoryWatcher:
+    """Iteratore dei percorsi pronti nella cartella, finché ``stop`` non viene impostato.
+
+    Un file già pronto non viene restituito di nuovo finché dimensione o data di
+    modifica non cambiano (un formulario riscritto viene quindi riproposto).
+    I file già presenti all'avvio vanno elaborati da chi usa il watcher:
+    qui arrivano solo quelli scritti dopo.
+    """
+
+    def __init__(self, directory: Path, patterns: Sequence[str] = DEFAULT_PATTERNS, poll_interval: float = 2.0,
+                 force_polling: bool = False) -> None:
+        self.directory = Path(directory)
+        self.patterns = tuple(patterns)
+        self.poll_interval = poll_interval
+        self._seen: Dict[str, Tuple[int, int]] = {}  # nome → (dimensione, mtime) già restituito
+        self._fd: Optional[int] = None
+        self.mode = "polling"
+        if not force_polling:
+            self._fd = self._inotify()
+            if self._fd is not None:
+                self.mode = "inotify"
+        for path in self._scan():  # lo stato iniziale non genera eventi
+            self._seen[path.name] = self._signature(path) or (0, 0)
+
+    def _inotify(self) -> Optional[int]:
+        libc = _load_libc()
+        if libc is None:
+            return None
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(self.directory), IN_CLOSE_WRITE | IN_MOVED_TO | IN_Q_OVERFLOW) < 0:
+            os.close(fd)
+            return None
+        return fd
+
+    def _wanted(self, name: str) -> bool:
+        if name.startswith(("~$", ".")):  # file di blocco di Excel e temporanei nascosti
+            return False
+        return any(fnmatch.fnmatch(name.lower(), pattern) for pattern in self.patterns)
+
+    def _scan(self) -> Iterator[Path]:
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and self._wanted(entry.name):
+                        yield Path(entry.path)
+        except FileNotFoundError:
+            return
+
+    @staticmethod
+    def _signature(path: Path) -> Optional[Tuple[int, int]]:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def _emit(self, path: Path, signature: Optional[Tuple[int, int]]) -> bool:
+        if signature is None or self._seen.get(path.name) == signature:
+            return False
+        self._seen[path.name] = signature
+        return True
+
+    def watch(self, stop: threading.Event) -> Iterator[Path]:
+        if self._fd is not None:
+            yield from self._watch_inotify(stop)
+        else:
+            yield from self._watch_polling(stop)
+
+    def _watch_inotify(self, stop: threading.Event) -> Iterator[Path]:
+        try:
+            while not stop.is_set():
+                ready, _, _ = select.select([self._fd], [], [], min(self.poll_interval, 1.0))
+                if not ready:
+                    continue
+                try:
+                    data = os.read(self._fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                names = []
+                overflow = False
+                offset = 0
+                while offset < len(data):
+                    _, mask, _, length = _EVENT.unpack_from(data, offset)
+                    name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+                    offset += _EVENT.size + length
+                    overflow = overflow or bool(mask & IN_Q_OVERFLOW)
+                    if name:
+                        names.append(os.fsdecode(name))
+                if overflow:  # eventi persi dal kernel: si riparte da una scansione
+                    names = [p.name for p in self._scan()]
+                for name in dict.fromkeys(names):
+                    path = self.directory / name
+                    if self._wanted(name) and self._emit(path, self._signature(path)):
+                        yield path
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def _watch_polling(self, stop: threading.Event) -> Iterator[Path]:
+        pending: Dict[str, Tuple[int, int]] = {}  # firma vista alla scansione precedente
+        while not stop.wait(self.poll_interval):
+            current = {path.name: self._signature(path) for path in self._scan()}
+            for name, signature in current.items():
+                if signature is None or self._seen.get(name) == signature:
+                    continue
+                if pending.get(name) == signature:  # invariato da una scansione: scrittura conclusa
+                    pending.pop(name)
+                    if self._emit(self.directory / name, signature):
+                        yield self.directory / name
+                else:
+                    pending[name] = signature
+            for name in set(pending) - set(current):
+                pending.pop(name)
@@ -0,0 +1,310 @@
+"""Risposte ai criteri per una cartella di documenti, senza interfaccia Streamlit.
+
+    python3 batch_match.py --criteria ./criteri.json --docs-dir ./domande --out-dir ./risposte --workers 4
+
+Per ogni documento (PDF, DOCX, XLSX/XLS, anche nelle sottocartelle) scrive
+``<out-dir>/<percorso relativo>.json`` con le risposte e aggiunge una riga a
+``<out-dir>/results.ndjson``. Il file è un journal in sola aggiunta (l'ultima
+riga per documento vince): alla riesecuzione i documenti già elaborati con
+successo, invariati e con gli stessi criteri e parametri vengono saltati,
+quindi un batch interrotto riparte da dove si era fermato. Se cambiano solo
+alcuni criteri, per ogni documento vengono inviati al modello solo quelli:
+le altre risposte sono riprese da ``result_cache``.
+
+Con ``--embeddings`` (implica ``--retrieval``) i passaggi sono cercati per
+similarità semantica e i loro vettori restano in ``EmbeddingStore``: un nuovo
+file di criteri sugli stessi documenti incorpora solo i criteri.
+
+Prova in locale con il mock OpenAI:
+
+    python -m besidetech_common.mock_openai --port 8900
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=test \\
+        python3 criteria_matching_ai/batch_match.py --criteria criteri.json --docs-dir ./domande --out-dir ./risposte
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import IO, Any, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # besidetech_common
+
+import openai  # noqa: E402
+
+from besidetech_common.embedding_store import DEFAULT_EMBEDDING_MODEL, EmbeddingStore  # noqa: E402
+from besidetech_common.ingestion import IngestionCache, file_kind, ingest  # noqa: E402
+from besidetech_common.llm_cache import CachedCompletions, ResponseCache  # noqa: E402
+from matcher_core import DEFAULT_MODEL, build_user_prompt, parse_criteria_json, request_matches  # noqa: E402
+from result_cache import match_incremental, match_variant, open_result_cache  # noqa: E402
+from retrieval import build_embedding_index, match_with_retrieval  # noqa: E402
+
+ROLLUP_NAME = "results.ndjson"
+
+# Valori di status nel riepilogo
+STATUS_OK = "ok"
+STATUS_PARTIAL = "partial"  # alcuni gruppi di criteri (modalità retrieval) non elaborati
+STATUS_ERROR = "error"
+
+
+def find_documents(docs_dir: Path) -> List[Path]:
+    return sorted(p for p in docs_dir.rglob("*") if p.is_file() and file_kind(p.name) and not p.name.startswith("~$"))
+
+
+def output_path(out_dir: Path, docs_dir: Path, document: Path) -> Path:
+    return out_dir / f"{document.relative_to(docs_dir).as_posix()}.json"
+
+
+def run_key(criteria: List[Dict[str, str]], args: argparse.Namespace) -> str:
+    """Hash di criteri e parametri: se cambia, i documenti vanno rielaborati."""
+    params = {"criteria": criteria, "model": args.model, "retrieval": args.retrieval}
+    if args.retrieval:
+        params.update(top_k=args.top_k, group_size=args.group_size)
+    if args.embeddings:
+        params.update(embedding_model=args.embedding_model)
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class Rollup:
+    """Journal NDJSON dei documenti elaborati; alla chiusura resta una riga per documento."""
+
+    def __init__(self, out_dir: Path) -> None:
+        self.path = out_dir / ROLLUP_NAME
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # riga troncata da un'interruzione
+                    if isinstance(record, dict) and record.get("file"):
+                        self.entries[record["file"]] = record
+        self._journal = self._open_journal()
+
+    def _open_journal(self) -> IO[str]:
+        """In aggiunta; una riga lasciata a metà da un'interruzione viene chiusa prima del record successivo."""
+        torn = False
+        if self.path.exists() and self.path.stat().st_size:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        journal = open(self.path, "a", encoding="utf-8")
+        if torn:
+            journal.write("\n")
+            journal.flush()
+        return journal
+
+    def is_done(self, name: str, sha256: str, key: str) -> bool:
+        entry = self.entries.get(name)
+        return bool(
+            entry and entry.get("status") == STATUS_OK and entry.get("sha256") == sha256
+            and entry.get("run_key") == key and entry.get("output") and Path(entry["output"]).exists()
+        )
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        entry = dict(entry, updated_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        with self._lock:
+            self.entries[entry["file"]] = entry
+            self._journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._journal.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._journal.close()
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(tmp, self.path)
+
+
+def write_json(path: Path, data: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def match_document(create, criteria: List[Dict[str, str]], data: bytes, name: str,
+                   args: argparse.Namespace, cache: Optional[IngestionCache],
+                   create_embeddings=None, store: Optional[EmbeddingStore] = None,
+                   results_cache: Optional[ResponseCache] = None) -> Dict[str, Any]:
+    """Risultati, note ed errori per un documento; solleva le eccezioni di lettura e della chiamata singola.
+
+    Con ``results_cache`` vengono inviati al modello solo i criteri senza una
+    risposta salvata per lo stesso testo e gli stessi parametri.
+    """
+    document, _ = ingest(data, name, cache, pdf_workers=1)  # i documenti sono già in parallelo tra loro
+    if not document.text.strip():
+        raise ValueError("nessun testo estratto dal documento")
+    notes = [("warning", w) for w in document.warnings]
+    errors: List[str] = []
+
+    def run(missing: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        if args.retrieval:
+            index = None
+            if args.embeddings:
+                index, _ = build_embedding_index(
+                    create_embeddings, document.text, document.page_offsets, store=store,
+                    model=args.embedding_model, workers=args.request_workers,
+                )
+            result = match_with_retrieval(
+                create, missing, document.text, index=index, page_offsets=document.page_offsets,
+                top_k=args.top_k, group_size=args.group_size, workers=args.request_workers, model=args.model,
+            )
+            notes.extend(result.notes)
+            errors.extend(f"criteri {', '.join(ids)}: {error}" for ids, error in result.errors)
+            return result.results
+        results, match_notes = request_matches(create, build_user_prompt(missing, document.text), args.model)
+        notes.extend(match_notes)
+        return results
+
+    variant = match_variant(args.model, args.retrieval, args.top_k, args.group_size,
+                            args.embedding_model if args.embeddings else None)
+    outcome = match_incremental(criteria, document.text, run, results_cache, variant)
+    return {"results": outcome.results, "notes": notes, "errors": errors, "characters": len(document.text),
+            "reused": outcome.reused_count}
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Risposte ai criteri per tutti i documenti di una cartella")
+    p.add_argument("--criteria", required=True, help="File JSON dei criteri (come per l'app)")
+    p.add_argument("--docs-dir", required=True, help="Cartella dei documenti (PDF, DOCX, XLSX/XLS), sottocartelle incluse")
+    p.add_argument("--out-dir", required=True)
+    p.add_argument("--workers", type=int, default=4, help="Documenti elaborati in parallelo (default 4)")
+    p.add_argument("--model", default=DEFAULT_MODEL)
+    p.add_argument("--retrieval", action="store_true", help="Invia solo i passaggi pertinenti per ogni gruppo di criteri")
+    p.add_argument("--top-k", type=int, default=4, help="Passaggi per criterio in modalità retrieval")
+    p.add_argument("--group-size", type=int, default=5, help="Criteri per richiesta in modalità retrieval")
+    p.add_argument("--request-workers", type=int, default=2, help="Richieste parallele per documento in modalità retrieval")
+    p.add_argument("--embeddings", action="store_true",
+                   help="Retrieval per similarità semantica con i vettori dei passaggi salvati su disco (implica --retrieval)")
+    p.add_argument("--embedding-model", default=DEFAULT_EMBEDDING_MODEL)
+    p.add_argument("--retries", type=int, default=3, help="Tentativi aggiuntivi del client OpenAI su 429/5xx")
+    p.add_argument("--timeout", type=float, default=600.0, help="Timeout per chiamata OpenAI in secondi")
+    p.add_argument("--no-cache", action="store_true", help="Non usare la cache su disco di testi e risposte")
+    p.add_argument("--force", action="store_true", help="Rielabora anche i documenti già presenti nel riepilogo")
+    args = p.parse_args()
+    args.retrieval = args.retrieval or args.embeddings
+
+    try:
+        criteria = parse_criteria_json(Path(args.criteria).read_bytes())
+    except (OSError, ValueError) as exc:
+        sys.exit(f"[FATAL] Criteri non leggibili da {args.criteria}: {exc}")
+    if not criteria:
+        sys.exit(f"[FATAL] Nessun criterio in {args.criteria}")
+
+    docs_dir = Path(args.docs_dir).expanduser().resolve()
+    out_dir = Path(args.out_dir).expanduser().resolve()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    documents = find_documents(docs_dir)
+    if not documents:
+        print(f"[WARN] Nessun documento PDF/DOCX/XLSX trovato in {docs_dir}")
+        sys.exit(0)
+
+    try:
+        client = openai.OpenAI(max_retries=args.retries, timeout=args.timeout)
+    except openai.OpenAIError as exc:
+        sys.exit(f"[FATAL] Client OpenAI non configurato (env OPENAI_API_KEY / OPENAI_BASE_URL): {exc}")
+    completions = CachedCompletions(client, None if args.no_cache else ResponseCache())
+    ingestion_cache = None if args.no_cache else IngestionCache()
+    embedding_store = None if args.no_cache or not args.embeddings else EmbeddingStore()
+    results_cache = None if args.no_cache else open_result_cache()
+
+    rollup = Rollup(out_dir)
+    key = run_key(criteria, args)
+    started = time.perf_counter()
+
+    pending: List[Path] = []
+    skipped = 0
+    for document in documents:
+        name = document.relative_to(docs_dir).as_posix()
+        if not args.force and rollup.is_done(name, hashlib.sha256(document.read_bytes()).hexdigest(), key):
+            skipped += 1
+        else:
+            pending.append(document)
+    print(f"[INFO] {len(criteria)} criteri, {len(documents)} documenti: {skipped} già elaborati, {len(pending)} da elaborare "
+          f"(workers={args.workers}{', embeddings' if args.embeddings else ', retrieval' if args.retrieval else ''})")
+
+    def process(document: Path) -> Dict[str, Any]:
+        name = document.relative_to(docs_dir).as_posix()
+        entry: Dict[str, Any] = {"file": name, "run_key": key, "criteri": len(criteria)}
+        t0 = time.perf_counter()
+        try:
+            data = document.read_bytes()
+            entry["sha256"] = hashlib.sha256(data).hexdigest()
+            outcome = match_document(completions.create, criteria, data, document.name, args, ingestion_cache,
+                                     client.embeddings.create, embedding_store, results_cache)
+        except Exception as exc:
+            outcome = {"results": [], "errors": [f"{type(exc).__name__}: {exc}"]}
+        if not outcome["results"] and outcome["errors"]:
+            entry.update(status=STATUS_ERROR, error="; ".join(outcome["errors"]), elapsed=round(time.perf_counter() - t0, 3))
+            rollup.record(entry)
+            return entry
+
+        out_path = output_path(out_dir, docs_dir, document)
+        elapsed = round(time.perf_counter() - t0, 3)
+        write_json(out_path, {
+            "documento": name,
+            "sha256": entry["sha256"],
+            "modello": args.model,
+            "modalita": "embeddings" if args.embeddings else "retrieval" if args.retrieval else "documento intero",
+            "risultati": outcome["results"],
+            "note": [message for _, message in outcome["notes"]],
+            "errori": outcome["errors"],
+        })
+        entry.update(
+            status=STATUS_PARTIAL if outcome["errors"] else STATUS_OK, output=str(out_path),
+            risposte=len(outcome["results"]), riutilizzate=outcome["reused"], caratteri=outcome["characters"], elapsed=elapsed,
+            error="; ".join(outcome["errors"]) or None,
+        )
+        rollup.record(entry)
+        return entry
+
+    failed: List[str] = []
+    done = 0
+    pool = ThreadPoolExecutor(max_workers=max(1, args.workers))
+    try:
+        futures = [pool.submit(process, document) for document in pending]
+        for future in as_completed(futures):
+            entry = future.result()
+            done += 1
+            if entry["status"] == STATUS_ERROR:
+                failed.append(entry["file"])
+                print(f"→ [{entry['file']}] ERRORE {entry['error']}")
+            else:
+                mark = "OK" if entry["status"] == STATUS_OK else "PARZIALE"
+                print(f"→ [{entry['file']}] {mark} {entry['risposte']}/{entry['criteri']} risposte in {entry['elapsed']:.1f}s"
+                      + (f", {entry['riutilizzate']} riutilizzate" if entry["riutilizzate"] else "")
+                      + (f" ({entry['error']})" if entry["error"] else ""))
+                if entry["status"] == STATUS_PARTIAL:
+                    failed.append(entry["file"])
+    except KeyboardInterrupt:
+        print("\n[WARN] Interrotto: i documenti completati restano nel riepilogo, rilancia per riprendere")
+        pool.shutdown(wait=True, cancel_futures=True)
+        rollup.close()
+        sys.exit(130)
+    pool.shutdown()
+    rollup.close()
+
+    elapsed = time.perf_counter() - started
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f"\n[FINE] {done}/{len(pending)} documenti in {elapsed:.2f}s ({rate:.2f} documenti/s), {skipped} già elaborati"
+          + (f", {completions.hits} risposte dalla cache" if completions.hits else ""))
+    print(f"[INFO] Riepilogo: {rollup.path}")
+    if failed:
+        print(f"[WARN] {len(failed)} documenti con errori (verranno ripresi alla prossima esecuzione): {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
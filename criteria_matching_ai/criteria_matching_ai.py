@@ -1,153 +1,115 @@
 import streamlit as st
 import openai
-import PyPDF2
-import pandas as pd
-import docx
-import io
 import json
+import sys
+import time
+from pathlib import Path
 
-# --- System Prompt per OpenAI ---
-SYSTEM_PROMPT_MATCHER = """Sei un assistente AI esperto nella compilazione di risposte a criteri specifici basandoti sul contenuto di un documento fornito. Il tuo obiettivo è analizzare un documento per rispondere a una serie di criteri, come se stessi compilando una domanda o una valutazione dettagliata.
-
-Riceverai:
-1.  Una lista di criteri, ognuno con un "criterio_id" e una "descrizione_guida" che ne chiarisce il significato e il tipo di informazione richiesta.
-2.  Il testo completo di un documento.
-
-Per OGNI criterio fornito:
-1.  Interpreta attentamente il "criterio_id" e la sua "descrizione_guida" per comprendere appieno cosa viene chiesto.
-2.  Analizza l'intero testo del documento per trovare tutte le informazioni pertinenti, i dati, gli esempi, le descrizioni di processi o le affermazioni che dimostrano come il contenuto del documento (o il progetto/soggetto descritto nel documento) soddisfa, affronta o si riferisce a quel criterio.
-3.  Sulla base delle informazioni trovate, formula una risposta completa, coerente e argomentata per quel criterio. Questa risposta dovrebbe spiegare in dettaglio come il documento/progetto risponde al criterio, utilizzando, citando (se utile, ad esempio "come menzionato nella sezione X" o "i dati a pagina Y indicano che...") e sintetizzando le informazioni estratte dal testo. Non limitarti a copiare porzioni di testo, ma elabora una risposta che sembri scritta da un esperto che sta compilando una domanda ufficiale e vuole essere esaustivo.
-4.  Se il documento fornisce informazioni quantitative (numeri, percentuali, budget) o qualitative specifiche (descrizioni di qualità, metodologie, standard) relative al criterio, assicurati di includerle nella tua risposta per renderla più forte e basata su evidenze.
-5.  Se il documento non contiene informazioni sufficienti o dirette per rispondere in modo esauriente a un criterio, indicalo chiaramente e onestamente nella risposta per quel criterio (es. "Il documento fornisce informazioni limitate riguardo a [aspetto specifico del criterio], menzionando solo che..." oppure "Non sono state trovate nel documento informazioni specifiche relative a [aspetto specifico del criterio], sebbene vengano trattati temi correlati come..."). Evita di inventare informazioni.
-
-Restituisci i risultati come un elenco JSON di oggetti. Ogni oggetto nell'elenco deve corrispondere a uno dei criteri di input e contenere:
-- "criterio_id": l'ID del criterio originale fornito.
-- "descrizione_guida": la descrizione guida originale del criterio.
-- "risposta_al_criterio_dal_documento": la risposta dettagliata, argomentata e formulata da te, basata sull'analisi approfondita del testo del documento in relazione al criterio.
-
-Esempio di input dei criteri (parte del messaggio utente):
-CRITERI A CUI RISPONDERE:
-[
-  {"criterio_id": "SOSTENIBILITA-AMBIENTALE", "descrizione_guida": "Descrivere in dettaglio le misure specifiche adottate e pianificate per garantire la sostenibilità ambientale del progetto, inclusi impatti, mitigazioni e monitoraggio."},
-  {"criterio_id": "INNOVAZIONE-TECNOLOGICA", "descrizione_guida": "Illustrare il grado di innovazione tecnologica introdotto dal progetto, specificando le tecnologie utilizzate e il loro carattere innovativo rispetto allo stato dell'arte."},
-  {"criterio_id": "IMPATTO-OCCUPAZIONALE", "descrizione_guida": "Valutare l'impatto occupazionale diretto e indiretto del progetto, fornendo stime numeriche se disponibili."}
-]
-
-Esempio di output JSON desiderato:
-[
-  {
-    "criterio_id": "SOSTENIBILITA-AMBIENTALE",
-    "descrizione_guida": "Descrivere in dettaglio le misure specifiche adottate e pianificate per garantire la sostenibilità ambientale del progetto, inclusi impatti, mitigazioni e monitoraggio.",
-    "risposta_al_criterio_dal_documento": "Il progetto affronta la sostenibilità ambientale attraverso diverse misure chiave, come dettagliato nel documento. In primo luogo, si prevede l'installazione di un impianto fotovoltaico di 49,50 kW, che si aggiunge a quelli esistenti, con l'obiettivo di raggiungere una produzione di 200kW per ridurre significativamente l'impronta ambientale (come menzionato in relazione al criterio A1.1). Viene inoltre specificato che la riorganizzazione della sala ristorante, pur ampliandola, non comporta ulteriore consumo di suolo, in quanto si utilizzano spazi esistenti. La climatizzazione sarà ad alta efficienza energetica e la divisione della sala permetterà un consumo energetico mirato e ridotto. Il documento evidenzia anche l'uso di attrezzature CAM per il parco giochi, suggerendo un'attenzione ai Criteri Ambientali Minimi. Non vengono, tuttavia, fornite informazioni esplicite su piani di monitoraggio continuo degli impatti ambientali post-intervento o su specifiche strategie di mitigazione per altri potenziali impatti al di là del consumo energetico e di suolo."
-  },
-  {
-    "criterio_id": "INNOVAZIONE-TECNOLOGICA",
-    "descrizione_guida": "Illustrare il grado di innovazione tecnologica introdotto dal progetto, specificando le tecnologie utilizzate e il loro carattere innovativo rispetto allo stato dell'arte.",
-    "risposta_al_criterio_dal_documento": "L'innovazione tecnologica del progetto si manifesta principalmente nell'adozione di soluzioni per l'efficienza energetica e l'accessibilità. L'impianto fotovoltaico da 49,50 kW rappresenta un potenziamento tecnologico per l'autonomia energetica. L'impianto di climatizzazione per la sala ristorante è descritto come 'ad alta efficienza e prestazione energetica con gestione digitale delle temperature' (D2.1), suggerendo l'uso di tecnologie moderne per il controllo ambientale. Un elemento innovativo significativo per l'accessibilità è l'installazione di un percorso tattile plantare integrato tipo Los-Vet-EVolution (LVE) per non vedenti, che migliora l'inclusività della struttura. La digitalizzazione è presente anche nella gestione delle temperature e nella programmazione delle sale polifunzionali. Il documento non confronta esplicitamente queste tecnologie con lo stato dell'arte del settore turistico, ma l'integrazione di queste soluzioni contribuisce a un innalzamento del livello tecnologico dell'offerta."
-  },
-  {
-    "criterio_id": "IMPATTO-OCCUPAZIONALE",
-    "descrizione_guida": "Valutare l'impatto occupazionale diretto e indiretto del progetto, fornendo stime numeriche se disponibili.",
-    "risposta_al_criterio_dal_documento": "Il documento fornito non contiene informazioni esplicite o stime numeriche relative all'impatto occupazionale diretto o indiretto che deriverà dalla realizzazione degli interventi proposti. L'enfasi è posta sulla riqualificazione delle infrastrutture, l'incremento dei flussi turistici e la destagionalizzazione, che potrebbero implicitamente suggerire un mantenimento o un potenziale aumento dell'occupazione, ma non vengono forniti dati specifici a riguardo."
-  }
-]
-
-Assicurati che l'output sia ESATTAMENTE una lista JSON valida di oggetti come specificato. La "risposta_al_criterio_dal_documento" deve essere una tua elaborazione analitica e argomentata basata sul testo, non una semplice estrazione di frasi.
-"""
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # besidetech_common
+
+from besidetech_common.llm_cache import CachedCompletions, ResponseCache
+from besidetech_common.embedding_store import DEFAULT_EMBEDDING_MODEL, EmbeddingStore
+from besidetech_common.ingestion import IngestionCache, file_kind, ingest
+from besidetech_common.json_stream import StreamOutcome
+
+from matcher_core import DEFAULT_MODEL, build_user_prompt, parse_criteria_json, request_matches, stream_matches
+from planner import match_planned
+from result_cache import match_incremental, match_variant, open_result_cache
+from retrieval import build_embedding_index, match_with_retrieval
 
 # --- Funzioni di Estrazione Testo ---
-def extract_text_from_pdf(file_bytes):
-    try:
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
-        text = ""
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            text += page.extract_text() or ""
-        return text
-    except Exception as e:
-        st.error(f"Errore durante la lettura del PDF: {e}")
-        return None
+_READ_ERRORS = {"pdf": "del PDF", "excel": "del file Excel", "docx": "del file DOCX"}
 
-def extract_text_from_excel(file_bytes):
-    try:
-        xls = pd.ExcelFile(io.BytesIO(file_bytes))
-        text = ""
-        for sheet_name in xls.sheet_names:
-            df = xls.parse(sheet_name, header=None)
-            for col in df.columns:
-                text += df[col].astype(str).str.cat(sep=' ') + " "
-            text += "\n"
-        return text.strip()
-    except Exception as e:
-        st.error(f"Errore durante la lettura del file Excel: {e}")
-        return None
 
-def extract_text_from_docx(file_bytes):
+@st.cache_resource
+def get_ingestion_cache():
+    return IngestionCache()
+
+
+def extract_document(file_bytes, file_name):
+    """Testo del file caricato (Document), riletto solo se i byte non sono già in cache."""
+    kind = file_kind(file_name)
+    if kind is None:
+        st.error("Formato file non supportato.")
+        return None
     try:
-        doc = docx.Document(io.BytesIO(file_bytes))
-        text = ""
-        for para in doc.paragraphs:
-            text += para.text + "\n"
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    text += cell.text + "\t"
-                text += "\n"
-        return text
+        document, _ = ingest(file_bytes, file_name, get_ingestion_cache())
     except Exception as e:
-        st.error(f"Errore durante la lettura del file DOCX: {e}")
+        st.error(f"Errore durante la lettura {_READ_ERRORS[kind]}: {e}")
         return None
+    for warning in document.warnings:
+        st.warning(warning)
+    return document
 
 # --- Funzione per caricare i criteri da JSON  ---
 def load_criteria_from_json(json_file_bytes):
     try:
-        data = json.load(io.BytesIO(json_file_bytes))
-        transformed_criteria = []
-        source_list = None
-        if isinstance(data, list):
-            source_list = data
-        elif isinstance(data, dict) and len(data) == 1:
-            key = next(iter(data))
-            if isinstance(data[key], list):
-                source_list = data[key]
-            else:
-                st.error(f"Il file JSON dei criteri ha una chiave radice '{key}', ma il suo valore non è una lista.")
-                return None
-        
-        if source_list:
-            for item in source_list:
-                if isinstance(item, dict) and len(item) == 1:
-                    criterio_id = next(iter(item))
-                    descrizione = item[criterio_id]
-                    transformed_criteria.append({
-                        "criterio_id": str(criterio_id),
-                        "descrizione_guida": str(descrizione)
-                    })
-                elif isinstance(item, dict) and "criterio_id" in item:
-                    desc_guida = item.get("descrizione_guida", item.get("descrizione", ""))
-                    transformed_criteria.append({
-                        "criterio_id": str(item["criterio_id"]),
-                        "descrizione_guida": str(desc_guida)
-                    })
-                else:
-                    st.error(f"Formato dell'elemento non riconosciuto nella lista dei criteri: {item}.")
-                    return None
-            if not transformed_criteria and source_list:
-                 st.warning("La lista dei criteri nel JSON sembra essere vuota o in un formato non gestito.")
-                 return []
-            return transformed_criteria
-        else:
-            st.error("Formato JSON dei criteri non supportato.")
-            return None
+        return parse_criteria_json(json_file_bytes)
     except json.JSONDecodeError:
         st.error("Errore nel decodificare il file JSON dei criteri.")
         return None
+    except ValueError as e:
+        st.error(str(e))
+        return None
     except Exception as e:
         st.error(f"Errore imprevisto durante il caricamento dei criteri: {e}")
         return None
 
 # --- Funzione per chiamare OpenAI ---
-def get_matched_text_from_openai(criteria_list, document_text, api_key):
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache()
+
+
+@st.cache_resource
+def get_embedding_store():
+    return EmbeddingStore()
+
+
+@st.cache_resource
+def get_result_cache():
+    return open_result_cache()
+
+
+def _show_notes(notes):
+    for level, message in notes:
+        (st.info if level == "info" else st.warning)(message)
+
+
+def _show_cache_usage(completions):
+    if completions.hits:
+        st.caption(f"♻️ {completions.hits} risposte riutilizzate dalla cache, {completions.misses} nuove chiamate")
+
+
+def _stream_matches_table(completions, user_prompt):
+    """Chiamata singola in streaming: la tabella cresce a ogni risposta completata."""
+    started = time.perf_counter()
+    outcome = StreamOutcome()
+    table = st.empty()
+    results = []
+    first_at = None
+    try:
+        for item in stream_matches(completions.create, user_prompt, outcome):
+            if first_at is None:
+                first_at = time.perf_counter() - started
+            results.append(item)
+            table.dataframe(results, use_container_width=True, hide_index=True)
+    except json.JSONDecodeError:
+        st.error(f"Errore nel decodificare la risposta JSON da OpenAI: {outcome.content}")
+    except ValueError as e_format:
+        st.warning(str(e_format))
+    table.empty()
+    _show_notes(outcome.notes)
+    if not outcome.complete:
+        st.warning(f"Risposta interrotta ({outcome.error or outcome.finish_reason or 'stream chiuso'}): mantenute le {len(results)} risposte già ricevute.")
+    first = f"prima risposta dopo {first_at:.1f}s, " if first_at is not None else ""
+    st.caption(f"⏱️ Streaming: {first}risposta completa in {time.perf_counter() - started:.1f}s")
+    _show_cache_usage(completions)
+    return results
+
+
+def get_matched_text_from_openai(criteria_list, document_text, api_key, retrieval=False, top_k=4, group_size=5, workers=4, bypass_cache=False, page_offsets=None, stream=False,
+                                 planned=False, context_tokens=128_000, output_tokens=4_096, plan_workers=4, embeddings=False):
     if not document_text:
         st.warning("Il contenuto del documento sorgente è vuoto.")
         return []
@@ -155,66 +117,69 @@ def get_matched_text_from_openai(criteria_list, document_text, api_key):
         st.warning("La lista dei criteri è vuota o non caricata.")
         return []
 
-    criteria_input_str = json.dumps(criteria_list, indent=2, ensure_ascii=False)
-    user_prompt = f"""CRITERI A CUI RISPONDERE:
-{criteria_input_str}
-
-TESTO DEL DOCUMENTO DA ANALIZZARE:
-{document_text}
-
-Per favore, analizza il testo del documento e, per ciascun criterio fornito, formula una risposta dettagliata come specificato nelle istruzioni di sistema.
-"""
-
     try:
         client = openai.OpenAI(api_key=api_key)
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT_MATCHER},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.1,
-            response_format={"type": "json_object"}
-        )
-        
-        json_string_response = response.choices[0].message.content
-        
-        try:
-            data = json.loads(json_string_response)
-            parsed_results = []
-
-            if isinstance(data, list):
-                parsed_results = data
-            elif isinstance(data, dict):
-                found_list = None
-                for key in data:
-                    if isinstance(data[key], list):
-                        found_list = data[key]
-                        st.info(f"Risultati trovati sotto la chiave '{key}' nel JSON di risposta.")
-                        break
-                if found_list is not None:
-                    parsed_results = found_list
-                else:
-                    st.warning(f"La risposta JSON era un dizionario, ma non conteneva una lista riconoscibile: {json_string_response}")
-                    return []
-            else:
-                st.warning(f"Formato JSON inatteso: {json_string_response}")
+        completions = CachedCompletions(client, get_response_cache(), bypass=bypass_cache)
+        if retrieval:
+            index = None
+            if embeddings:
+                index, reused = build_embedding_index(
+                    client.embeddings.create, document_text, page_offsets, store=get_embedding_store(), workers=workers,
+                )
+                st.caption(f"🧭 {len(index.passages)} passaggi: vettori "
+                           + ("riutilizzati dal disco" if reused else "calcolati e salvati per le prossime analisi"))
+            result = match_with_retrieval(
+                completions.create, criteria_list, document_text, index=index,
+                page_offsets=page_offsets, top_k=top_k, group_size=group_size, workers=workers,
+            )
+            _show_notes(result.notes)
+            for group_ids, error in result.errors:
+                st.warning(f"Gruppo di criteri {', '.join(group_ids)} non elaborato: {error}")
+            st.caption(
+                f"⏱️ {result.groups} gruppi in {result.elapsed:.1f}s · token di prompt stimati "
+                f"{result.prompt_tokens_sent:,} invece di {result.prompt_tokens_full:,} con il documento intero"
+            )
+            _show_cache_usage(completions)
+            return result.results
+
+        if planned:
+            try:
+                result = match_planned(
+                    completions.create, criteria_list, document_text,
+                    context_tokens=context_tokens, output_tokens=output_tokens, workers=plan_workers,
+                )
+            except ValueError as e_plan:
+                st.warning(str(e_plan))
                 return []
+            _show_notes(result.notes)
+            for group_ids, error in result.errors:
+                st.warning(f"Gruppo di criteri {', '.join(group_ids)} non elaborato: {error}")
+            st.caption(
+                f"⏱️ {result.groups} gruppi, {result.requests} richieste ({result.splits} divisi per risposta troncata) "
+                f"in {result.elapsed:.1f}s · token di prompt stimati {result.prompt_tokens:,}"
+            )
+            _show_cache_usage(completions)
+            return result.results
+
+        user_prompt = build_user_prompt(criteria_list, document_text)
+        if stream:
+            return _stream_matches_table(completions, user_prompt)
 
-            validated_results = []
-            # Il prompt ora chiede "risposta_al_criterio_dal_documento"
-            for item in parsed_results:
-                if isinstance(item, dict) and "criterio_id" in item and "risposta_al_criterio_dal_documento" in item:
-                    validated_results.append(item)
-                else:
-                    st.warning(f"Elemento risultato ignorato: formato imprevisto o chiavi mancanti ('criterio_id', 'risposta_al_criterio_dal_documento'). Elemento: {item}")
+        # Stessa richiesta (prompt, modello, temperatura) del servizio HTTP e di batch_match.py
+        try:
+            validated_results, notes = request_matches(completions.create, user_prompt, DEFAULT_MODEL)
+            _show_cache_usage(completions)
+            _show_notes(notes)
             return validated_results
 
-        except json.JSONDecodeError:
-            st.error(f"Errore nel decodificare la risposta JSON da OpenAI: {json_string_response}")
+        except json.JSONDecodeError as e_json:
+            st.error(f"Errore nel decodificare la risposta JSON da OpenAI: {e_json.doc}")
+            return []
+        except ValueError as e_format:
+            st.warning(str(e_format))
             return []
-        except Exception as e_parse:
-            st.error(f"Errore durante il parsing della risposta: {e_parse}. Risposta: {json_string_response}")
+        except (KeyError, TypeError, AttributeError) as e_parse:
+            st.error(f"Errore durante il parsing della risposta: {e_parse}")
             return []
 
     except openai.APIConnectionError as e:
@@ -226,7 +191,7 @@ Per favore, analizza il testo del documento e, per ciascun criterio fornito, for
     except openai.APIError as e:
         st.error(f"Errore generico API OpenAI: {e}")
         if "context_length_exceeded" in str(e).lower():
-            st.warning("Il testo del documento e/o la lista dei criteri potrebbero essere troppo lunghi.")
+            st.warning("Il testo del documento e/o la lista dei criteri potrebbero essere troppo lunghi. Prova la modalità retrieval nella barra laterale.")
     except Exception as e:
         st.error(f"Errore imprevisto durante la chiamata a OpenAI: {e}")
     return []
@@ -236,9 +201,9 @@ Per favore, analizza il testo del documento e, per ciascun criterio fornito, for
 st.set_page_config(layout="wide", page_title="Besidetech AI")
 
 st.title("Besidetech AI")
-st.markdown("""
+st.markdown(f"""
 Carica un file JSON con i criteri (e le loro descrizioni guida) e un documento sorgente (PDF, Word, Excel). 
-L'applicazione utilizzerà `gpt-4o-mini` di OpenAI per analizzare il documento e generare risposte argomentate per ciascun criterio, 
+L'applicazione utilizzerà `{DEFAULT_MODEL}` di OpenAI per analizzare il documento e generare risposte argomentate per ciascun criterio, 
 come se stesse compilando una domanda.
 """)
 
@@ -255,8 +220,41 @@ with col2:
     st.subheader("3. Configurazione API")
     api_key = st.text_input("🔑 Inserisci la tua API Key di OpenAI", type="password")
 
+st.sidebar.subheader("Retrieval")
+retrieval_mode = st.sidebar.checkbox("Invia solo i passaggi pertinenti", value=False, help="Indicizza il documento in passaggi (BM25 locale) e invia a ogni gruppo di criteri solo i suoi top-k passaggi, con i gruppi in parallelo.")
+retrieval_top_k = st.sidebar.number_input("Passaggi per criterio (top-k)", min_value=1, max_value=50, value=4, disabled=not retrieval_mode)
+retrieval_group_size = st.sidebar.number_input("Criteri per richiesta", min_value=1, max_value=50, value=5, disabled=not retrieval_mode)
+retrieval_workers = st.sidebar.number_input("Richieste in parallelo", min_value=1, max_value=16, value=4, disabled=not retrieval_mode)
+retrieval_embeddings = st.sidebar.checkbox("Cerca con embeddings salvati su disco", value=False, disabled=not retrieval_mode, help="Invece di BM25 confronta criteri e passaggi per similarità semantica. I vettori dei passaggi vengono calcolati una sola volta per documento e riusati con altri insiemi di criteri.")
+if retrieval_embeddings and retrieval_mode:
+    embedding_stats = get_embedding_store().stats()
+    st.sidebar.caption(f"{embedding_stats['entries']} documenti incorporati · {embedding_stats['bytes'] / 1_000_000:.1f} MB")
+
+st.sidebar.subheader("Molti criteri")
+planned_mode = st.sidebar.checkbox("Dividi i criteri in richieste parallele", value=False, disabled=retrieval_mode, help="Stima i token di documento e criteri e divide i criteri in gruppi che stanno nel contesto e nei token di risposta del modello; i gruppi partono in parallelo e quelli con risposta troncata vengono divisi a metà e rinviati.")
+plan_context_tokens = st.sidebar.number_input("Token di contesto del modello", min_value=4_096, max_value=2_000_000, value=128_000, step=1_000, disabled=not planned_mode or retrieval_mode)
+plan_output_tokens = st.sidebar.number_input("Token massimi di risposta", min_value=256, max_value=100_000, value=4_096, step=256, disabled=not planned_mode or retrieval_mode)
+plan_workers = st.sidebar.number_input("Richieste in parallelo", key="plan_workers", min_value=1, max_value=16, value=4, disabled=not planned_mode or retrieval_mode)
+planned_mode = planned_mode and not retrieval_mode
+
+st.sidebar.subheader("Risposta")
+stream_mode = st.sidebar.checkbox("Mostra le risposte man mano che arrivano", value=True, disabled=retrieval_mode or planned_mode, help="Riceve la risposta in streaming e aggiunge ogni criterio alla tabella appena la sua risposta è completa. Se la risposta si interrompe, le risposte già ricevute vengono mantenute.")
+
+st.sidebar.subheader("Cache risposte OpenAI")
+bypass_cache = st.sidebar.checkbox("Ignora cache (forza nuova chiamata)", value=False, help="Le risposte sono memorizzate su disco per modello, prompt e parametri: la stessa analisi ripetuta torna subito dalla cache.")
+cache_stats = get_response_cache().stats()
+st.sidebar.caption(f"{cache_stats['entries']} risposte in cache · {cache_stats['bytes'] / 1_000_000:.1f} MB · {cache_stats['tokens']:,} token")
+if st.sidebar.button("Svuota cache"):
+    get_response_cache().clear()
+    get_result_cache().clear()
+reuse_results = st.sidebar.checkbox("Riusa le risposte per criterio", value=True, help="Ogni risposta è salvata per criterio, testo del documento, modello e modalità: se cambiano solo alcuni criteri, al modello vengono inviati solo quelli. Con \"Ignora cache\" tutti i criteri vengono rinviati.")
+if reuse_results:
+    result_stats = get_result_cache().stats()
+    st.sidebar.caption(f"{result_stats['entries']} risposte per criterio salvate · {result_stats['bytes'] / 1_000_000:.1f} MB")
+
 criteria_list = None
 document_text = None
+document_page_offsets = None  # solo per i PDF
 document_file_name = None
 
 if uploaded_criteria_file:
@@ -277,12 +275,9 @@ if uploaded_document_file:
     document_file_name = uploaded_document_file.name
     
     with st.spinner(f"Estrazione del testo da `{document_file_name}`..."):
-        if document_file_name.lower().endswith(".pdf"):
-            document_text = extract_text_from_pdf(doc_bytes)
-        elif document_file_name.lower().endswith((".xlsx", ".xls")):
-            document_text = extract_text_from_excel(doc_bytes)
-        elif document_file_name.lower().endswith(".docx"):
-            document_text = extract_text_from_docx(doc_bytes)
+        document = extract_document(doc_bytes, document_file_name)
+    if document is not None:
+        document_text, document_page_offsets = document.text, document.page_offsets
     
     if document_text:
         st.success(f"Testo estratto da '{document_file_name}'. Lunghezza: {len(document_text)} caratteri.")
@@ -301,20 +296,44 @@ if st.button("✨ Analizza e Genera Risposte con OpenAI", disabled=(criteria_lis
         st.warning("Per favore, carica un documento sorgente valido.")
     else:
         with st.spinner("Analisi del documento e generazione delle risposte con OpenAI in corso... Attendere prego."):
-            generated_responses = get_matched_text_from_openai(criteria_list, document_text, api_key)
+            # Solo i criteri senza risposta salvata per questo documento e questa modalità vanno al modello
+            incremental = match_incremental(
+                criteria_list, document_text,
+                lambda missing_criteria: get_matched_text_from_openai(
+                    missing_criteria, document_text, api_key, retrieval_mode,
+                    int(retrieval_top_k), int(retrieval_group_size), int(retrieval_workers), bypass_cache,
+                    document_page_offsets, stream_mode,
+                    planned_mode, int(plan_context_tokens), int(plan_output_tokens), int(plan_workers),
+                    retrieval_embeddings,
+                ),
+                get_result_cache() if reuse_results else None,
+                match_variant(DEFAULT_MODEL, retrieval_mode, int(retrieval_top_k), int(retrieval_group_size),
+                              DEFAULT_EMBEDDING_MODEL if retrieval_embeddings and retrieval_mode else None),
+                bypass=bypass_cache,
+            )
+            generated_responses = incremental.results
+        if incremental.reused_count:
+            st.caption(f"♻️ {incremental.reused_count} risposte riutilizzate per criterio, "
+                       f"{incremental.sent} criteri inviati al modello")
         
         st.subheader("Risposte Generate ai Criteri")
         if generated_responses:
             st.success(f"Generazione risposte completata. Elaborati {len(generated_responses)} criteri.")
             
+            import pandas as pd  # caricato solo quando c'è una tabella da mostrare
+
             results_df = pd.DataFrame(generated_responses)
+            if incremental.reused_count:
+                results_df["riutilizzata"] = incremental.reused
             
             # Configurazione colonne per st.data_editor
             # Il nome della colonna chiave è ora "risposta_al_criterio_dal_documento"
             column_config = {
                 "criterio_id": st.column_config.TextColumn("ID Criterio", width="medium", help="L'ID del criterio fornito."),
                 "descrizione_guida": st.column_config.TextColumn("Descrizione Guida (Input)", width="large", help="La descrizione guida originale del criterio."),
-                "risposta_al_criterio_dal_documento": st.column_config.TextColumn("Risposta Generata dal Documento", width="extra_large", help="La risposta formulata dall'AI basata sull'analisi del documento.")
+                "risposta_al_criterio_dal_documento": st.column_config.TextColumn("Risposta Generata dal Documento", width="extra_large", help="La risposta formulata dall'AI basata sull'analisi del documento."),
+                "pagine_consultate": st.column_config.ListColumn("Pagine consultate", help="Pagine dei passaggi inviati al modello per questo criterio (modalità retrieval)."),
+                "riutilizzata": st.column_config.CheckboxColumn("♻️ Riutilizzata", help="Risposta salvata in un'analisi precedente dello stesso documento con lo stesso criterio, non richiesta di nuovo al modello.")
             }
             
             cols_to_display = {}
@@ -324,6 +343,10 @@ if st.button("✨ Analizza e Genera Risposte con OpenAI", disabled=(criteria_lis
                  cols_to_display['descrizione_guida'] = column_config['descrizione_guida']
             if 'risposta_al_criterio_dal_documento' in results_df.columns:
                  cols_to_display['risposta_al_criterio_dal_documento'] = column_config['risposta_al_criterio_dal_documento']
+            if 'pagine_consultate' in results_df.columns:
+                 cols_to_display['pagine_consultate'] = column_config['pagine_consultate']
+            if 'riutilizzata' in results_df.columns:
+                 cols_to_display['riutilizzata'] = column_config['riutilizzata']
 
 
             st.data_editor(
@@ -0,0 +1,209 @@
+"""Matching criteri↔documento con OpenAI, separato dall'interfaccia Streamlit.
+
+Le funzioni ricevono ``create``, cioè ``client.chat.completions.create`` o un
+oggetto con la stessa firma.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from besidetech_common.json_stream import StreamOutcome, stream_array_items
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+# --- System Prompt per OpenAI ---
+SYSTEM_PROMPT_MATCHER = """Sei un assistente AI esperto nella compilazione di risposte a criteri specifici basandoti sul contenuto di un documento fornito. Il tuo obiettivo è analizzare un documento per rispondere a una serie di criteri, come se stessi compilando una domanda o una valutazione dettagliata.
+
+Riceverai:
+1.  Una lista di criteri, ognuno con un "criterio_id" e una "descrizione_guida" che ne chiarisce il significato e il tipo di informazione richiesta.
+2.  Il testo completo di un documento.
+
+Per OGNI criterio fornito:
+1.  Interpreta attentamente il "criterio_id" e la sua "descrizione_guida" per comprendere appieno cosa viene chiesto.
+2.  Analizza l'intero testo del documento per trovare tutte le informazioni pertinenti, i dati, gli esempi, le descrizioni di processi o le affermazioni che dimostrano come il contenuto del documento (o il progetto/soggetto descritto nel documento) soddisfa, affronta o si riferisce a quel criterio.
+3.  Sulla base delle informazioni trovate, formula una risposta completa, coerente e argomentata per quel criterio. Questa risposta dovrebbe spiegare in dettaglio come il documento/progetto risponde al criterio, utilizzando, citando (se utile, ad esempio "come menzionato nella sezione X" o "i dati a pagina Y indicano che...") e sintetizzando le informazioni estratte dal testo. Non limitarti a copiare porzioni di testo, ma elabora una risposta che sembri scritta da un esperto che sta compilando una domanda ufficiale e vuole essere esaustivo.
+4.  Se il documento fornisce informazioni quantitative (numeri, percentuali, budget) o qualitative specifiche (descrizioni di qualità, metodologie, standard) relative al criterio, assicurati di includerle nella tua risposta per renderla più forte e basata su evidenze.
+5.  Se il documento non contiene informazioni sufficienti o dirette per rispondere in modo esauriente a un criterio, indicalo chiaramente e onestamente nella risposta per quel criterio (es. "Il documento fornisce informazioni limitate riguardo a [aspetto specifico del criterio], menzionando solo che..." oppure "Non sono state trovate nel documento informazioni specifiche relative a [aspetto specifico del criterio], sebbene vengano trattati temi correlati come..."). Evita di inventare informazioni.
+
+Restituisci i risultati come un elenco JSON di oggetti. Ogni oggetto nell'elenco deve corrispondere a uno dei criteri di input e contenere:
+- "criterio_id": l'ID del criterio originale fornito.
+- "descrizione_guida": la descrizione guida originale del criterio.
+- "risposta_al_criterio_dal_documento": la risposta dettagliata, argomentata e formulata da te, basata sull'analisi approfondita del testo del documento in relazione al criterio.
+
+Esempio di input dei criteri (parte del messaggio utente):
+CRITERI A CUI RISPONDERE:
+[
+  {"criterio_id": "SOSTENIBILITA-AMBIENTALE", "descrizione_guida": "Descrivere in dettaglio le misure specifiche adottate e pianificate per garantire la sostenibilità ambientale del progetto, inclusi impatti, mitigazioni e monitoraggio."},
+  {"criterio_id": "INNOVAZIONE-TECNOLOGICA", "descrizione_guida": "Illustrare il grado di innovazione tecnologica introdotto dal progetto, specificando le tecnologie utilizzate e il loro carattere innovativo rispetto allo stato dell'arte."},
+  {"criterio_id": "IMPATTO-OCCUPAZIONALE", "descrizione_guida": "Valutare l'impatto occupazionale diretto e indiretto del progetto, fornendo stime numeriche se disponibili."}
+]
+
+Esempio di output JSON desiderato:
+[
+  {
+    "criterio_id": "SOSTENIBILITA-AMBIENTALE",
+    "descrizione_guida": "Descrivere in dettaglio le misure specifiche adottate e pianificate per garantire la sostenibilità ambientale del progetto, inclusi impatti, mitigazioni e monitoraggio.",
+    "risposta_al_criterio_dal_documento": "Il progetto affronta la sostenibilità ambientale attraverso diverse misure chiave, come dettagliato nel documento. In primo luogo, si prevede l'installazione di un impianto fotovoltaico di 49,50 kW, che si aggiunge a quelli esistenti, con l'obiettivo di raggiungere una produzione di 200kW per ridurre significativamente l'impronta ambientale (come menzionato in relazione al criterio A1.1). Viene inoltre specificato che la riorganizzazione della sala ristorante, pur ampliandola, non comporta ulteriore consumo di suolo, in quanto si utilizzano spazi esistenti. La climatizzazione sarà ad alta efficienza energetica e la divisione della sala permetterà un consumo energetico mirato e ridotto. Il documento evidenzia anche l'uso di attrezzature CAM per il parco giochi, suggerendo un'attenzione ai Criteri Ambientali Minimi. Non vengono, tuttavia, fornite informazioni esplicite su piani di monitoraggio continuo degli impatti ambientali post-intervento o su specifiche strategie di mitigazione per altri potenziali impatti al di là del consumo energetico e di suolo."
+  },
+  {
+    "criterio_id": "INNOVAZIONE-TECNOLOGICA",
+    "descrizione_guida": "Illustrare il grado di innovazione tecnologica introdotto dal progetto, specificando le tecnologie utilizzate e il loro carattere innovativo rispetto allo stato dell'arte.",
+    "risposta_al_criterio_dal_documento": "L'innovazione tecnologica del progetto si manifesta principalmente nell'adozione di soluzioni per l'efficienza energetica e l'accessibilità. L'impianto fotovoltaico da 49,50 kW rappresenta un potenziamento tecnologico per l'autonomia energetica. L'impianto di climatizzazione per la sala ristorante è descritto come 'ad alta efficienza e prestazione energetica con gestione digitale delle temperature' (D2.1), suggerendo l'uso di tecnologie moderne per il controllo ambientale. Un elemento innovativo significativo per l'accessibilità è l'installazione di un percorso tattile plantare integrato tipo Los-Vet-EVolution (LVE) per non vedenti, che migliora l'inclusività della struttura. La digitalizzazione è presente anche nella gestione delle temperature e nella programmazione delle sale polifunzionali. Il documento non confronta esplicitamente queste tecnologie con lo stato dell'arte del settore turistico, ma l'integrazione di queste soluzioni contribuisce a un innalzamento del livello tecnologico dell'offerta."
+  },
+  {
+    "criterio_id": "IMPATTO-OCCUPAZIONALE",
+    "descrizione_guida": "Valutare l'impatto occupazionale diretto e indiretto del progetto, fornendo stime numeriche se disponibili.",
+    "risposta_al_criterio_dal_documento": "Il documento fornito non contiene informazioni esplicite o stime numeriche relative all'impatto occupazionale diretto o indiretto che deriverà dalla realizzazione degli interventi proposti. L'enfasi è posta sulla riqualificazione delle infrastrutture, l'incremento dei flussi turistici e la destagionalizzazione, che potrebbero implicitamente suggerire un mantenimento o un potenziale aumento dell'occupazione, ma non vengono forniti dati specifici a riguardo."
+  }
+]
+
+Assicurati che l'output sia ESATTAMENTE una lista JSON valida di oggetti come specificato. La "risposta_al_criterio_dal_documento" deve essere una tua elaborazione analitica e argomentata basata sul testo, non una semplice estrazione di frasi.
+"""
+
+Note = Tuple[str, str]  # (livello "info"/"warning", messaggio)
+
+
+def parse_criteria_json(json_file_bytes: bytes) -> List[Dict[str, str]]:
+    """Criteri dal file JSON (come prodotto dagli estrattori) nel formato usato nei prompt.
+
+    Accetta una lista, oppure un oggetto con una sola chiave che contiene la
+    lista; ogni elemento è ``{codice: descrizione}`` oppure un oggetto con
+    ``criterio_id`` e ``descrizione_guida``/``descrizione``. Solleva
+    ``json.JSONDecodeError`` se il file non è JSON e ``ValueError`` se il
+    formato non è riconosciuto.
+    """
+    data = json.loads(json_file_bytes)
+    source_list = None
+    if isinstance(data, list):
+        source_list = data
+    elif isinstance(data, dict) and len(data) == 1:
+        key = next(iter(data))
+        if isinstance(data[key], list):
+            source_list = data[key]
+        else:
+            raise ValueError(f"Il file JSON dei criteri ha una chiave radice '{key}', ma il suo valore non è una lista.")
+    if not source_list:
+        raise ValueError("Formato JSON dei criteri non supportato.")
+
+    transformed_criteria = []
+    for item in source_list:
+        if isinstance(item, dict) and len(item) == 1:
+            criterio_id = next(iter(item))
+            descrizione = item[criterio_id]
+            transformed_criteria.append({
+                "criterio_id": str(criterio_id),
+                "descrizione_guida": str(descrizione)
+            })
+        elif isinstance(item, dict) and "criterio_id" in item:
+            desc_guida = item.get("descrizione_guida", item.get("descrizione", ""))
+            transformed_criteria.append({
+                "criterio_id": str(item["criterio_id"]),
+                "descrizione_guida": str(desc_guida)
+            })
+        else:
+            raise ValueError(f"Formato dell'elemento non riconosciuto nella lista dei criteri: {item}.")
+    return transformed_criteria
+
+
+def build_user_prompt(criteria_list: List[Dict[str, str]], document_text: str, excerpts: bool = False) -> str:
+    """Prompt utente; con ``excerpts`` il testo contiene solo i passaggi pertinenti del documento."""
+    criteria_input_str = json.dumps(criteria_list, indent=2, ensure_ascii=False)
+    if excerpts:
+        return f"""CRITERI A CUI RISPONDERE:
+{criteria_input_str}
+
+ESTRATTI PERTINENTI DEL DOCUMENTO DA ANALIZZARE (ogni estratto riporta la pagina di provenienza):
+{document_text}
+
+Per favore, analizza gli estratti del documento e, per ciascun criterio fornito, formula una risposta dettagliata come specificato nelle istruzioni di sistema. Ti vengono forniti solo i passaggi più pertinenti: quando citi un'informazione indica la pagina dell'estratto.
+"""
+    return f"""CRITERI A CUI RISPONDERE:
+{criteria_input_str}
+
+TESTO DEL DOCUMENTO DA ANALIZZARE:
+{document_text}
+
+Per favore, analizza il testo del documento e, per ciascun criterio fornito, formula una risposta dettagliata come specificato nelle istruzioni di sistema.
+"""
+
+
+def parse_matcher_response(json_string_response: str) -> Tuple[List[Dict[str, Any]], List[Note]]:
+    """Valida la risposta del modello e restituisce (risultati, note).
+
+    Solleva ``json.JSONDecodeError`` se la risposta non è JSON e ``ValueError``
+    se non contiene una lista di risultati.
+    """
+    data = json.loads(json_string_response)
+    notes: List[Note] = []
+
+    if isinstance(data, list):
+        parsed_results = data
+    elif isinstance(data, dict):
+        found_list = None
+        for key in data:
+            if isinstance(data[key], list):
+                found_list = data[key]
+                notes.append(("info", f"Risultati trovati sotto la chiave '{key}' nel JSON di risposta."))
+                break
+        if found_list is None:
+            raise ValueError(f"La risposta JSON era un dizionario, ma non conteneva una lista riconoscibile: {json_string_response}")
+        parsed_results = found_list
+    else:
+        raise ValueError(f"Formato JSON inatteso: {json_string_response}")
+
+    validated_results = []
+    for item in parsed_results:
+        result, note = validate_result(item)
+        if result is not None:
+            validated_results.append(result)
+        else:
+            notes.append(note)
+    return validated_results, notes
+
+
+def validate_result(item: Any) -> Tuple[Optional[Dict[str, Any]], Optional[Note]]:
+    if isinstance(item, dict) and "criterio_id" in item and "risposta_al_criterio_dal_documento" in item:
+        return item, None
+    return None, ("warning", f"Elemento risultato ignorato: formato imprevisto o chiavi mancanti ('criterio_id', 'risposta_al_criterio_dal_documento'). Elemento: {item}")
+
+
+def request_matches(
+    create: Callable[..., Any], user_prompt: str, model: str = DEFAULT_MODEL
+) -> Tuple[List[Dict[str, Any]], List[Note]]:
+    response = create(
+        model=model,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT_MATCHER},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=0.1,
+        response_format={"type": "json_object"},
+    )
+    return parse_matcher_response(response.choices[0].message.content)
+
+
+def stream_matches(create: Callable[..., Any], user_prompt: str, outcome: StreamOutcome,
+                   model: str = DEFAULT_MODEL) -> Iterator[Dict[str, Any]]:
+    """Come ``request_matches`` ma restituisce ogni risposta appena il suo oggetto JSON è completo."""
+    seen = 0
+    for item in stream_array_items(
+        create, outcome,
+        model=model,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT_MATCHER},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=0.1,
+        response_format={"type": "json_object"},
+    ):
+        seen += 1
+        result, note = validate_result(item)
+        if result is not None:
+            yield result
+        else:
+            outcome.notes.append(note)
+    if not seen and outcome.complete and outcome.content.strip():
+        results, notes = parse_matcher_response(outcome.content)
+        outcome.notes.extend(notes)
+        yield from results
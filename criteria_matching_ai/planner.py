@@ -0,0 +1,184 @@
+"""Suddivisione dei criteri in richieste parallele entro un budget di token.
+
+Con molti criteri il prompt unico supera la finestra di contesto, oppure la
+risposta supera i token di output e arriva troncata (JSON non valido). Qui si
+stimano i token di system prompt, documento e criteri, si raggruppano i
+criteri in modo che ogni richiesta stia nel contesto e nel budget di
+risposta, i gruppi vengono inviati in parallelo e i risultati riordinati come
+i criteri in ingresso. Un gruppo la cui risposta torna troncata
+(``finish_reason == "length"``) viene diviso a metà e rinviato.
+"""
+from __future__ import annotations
+
+import json
+import math
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from besidetech_common.tokens import estimate_tokens
+from matcher_core import DEFAULT_MODEL, SYSTEM_PROMPT_MATCHER, Note, build_user_prompt, parse_matcher_response
+
+DEFAULT_CONTEXT_TOKENS = 128_000
+DEFAULT_OUTPUT_TOKENS = 4_096
+TOKENS_PER_ANSWER = 350  # stima prudente di una risposta argomentata per un criterio
+
+
+@dataclass
+class Plan:
+    groups: List[List[int]]  # indici dei criteri per richiesta
+    base_tokens: int  # system prompt + documento, ripetuti in ogni richiesta
+    prompt_tokens: List[int]  # stima per richiesta
+    criterion_tokens: List[int]  # stima per criterio
+
+
+def plan_groups(
+    criteria_list: List[Dict[str, str]],
+    document_text: str,
+    *,
+    context_tokens: int = DEFAULT_CONTEXT_TOKENS,
+    output_tokens: int = DEFAULT_OUTPUT_TOKENS,
+    tokens_per_answer: int = TOKENS_PER_ANSWER,
+    model: str = DEFAULT_MODEL,
+) -> Plan:
+    """Il minor numero di gruppi che rispetta i budget, con gruppi di dimensione simile.
+
+    Solleva ``ValueError`` se già il documento (più un criterio) non entra nel
+    contesto: in quel caso serve la modalità retrieval.
+    """
+    base = estimate_tokens(SYSTEM_PROMPT_MATCHER, model) + estimate_tokens(build_user_prompt([], document_text), model)
+    input_budget = context_tokens - output_tokens
+    costs = [estimate_tokens(json.dumps(c, indent=2, ensure_ascii=False), model) + 1 for c in criteria_list]
+    if criteria_list and base + max(costs) > input_budget:
+        raise ValueError(
+            f"Il documento richiede circa {base:,} token di prompt: con {output_tokens:,} token di risposta "
+            f"non entra in un contesto di {context_tokens:,}. Usa la modalità retrieval."
+        )
+    max_answers = max(1, output_tokens // max(1, tokens_per_answer))
+
+    def pack(cap: int) -> List[List[int]]:
+        groups: List[List[int]] = []
+        current: List[int] = []
+        used = 0
+        for index, cost in enumerate(costs):
+            if current and (base + used + cost > input_budget or len(current) >= cap):
+                groups.append(current)
+                current, used = [], 0
+            current.append(index)
+            used += cost
+        if current:
+            groups.append(current)
+        return groups
+
+    groups = pack(max_answers)
+    # Stesso numero di gruppi ma di dimensione simile, così nessuna richiesta rallenta le altre
+    if len(groups) > 1:
+        balanced = pack(math.ceil(len(criteria_list) / len(groups)))
+        if len(balanced) == len(groups):
+            groups = balanced
+    return Plan(groups, base, [base + sum(costs[i] for i in g) for g in groups], costs)
+
+
+@dataclass
+class PlannedMatch:
+    results: List[Dict[str, Any]]
+    groups: int  # gruppi del piano iniziale
+    requests: int  # richieste inviate, divisioni comprese
+    splits: int  # gruppi divisi perché la risposta era troncata
+    elapsed: float
+    prompt_tokens: int  # stima della somma dei prompt inviati
+    notes: List[Note] = field(default_factory=list)
+    errors: List[Tuple[List[str], str]] = field(default_factory=list)  # (criteri del gruppo, messaggio)
+
+
+def _request_group(create: Callable[..., Any], group: List[Dict[str, str]], document_text: str,
+                   output_tokens: int, model: str) -> Tuple[Optional[List[Dict[str, Any]]], List[Note]]:
+    """Risultati del gruppo, oppure ``None`` se la risposta è stata troncata."""
+    response = create(
+        model=model,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT_MATCHER},
+            {"role": "user", "content": build_user_prompt(group, document_text)},
+        ],
+        temperature=0.1,
+        response_format={"type": "json_object"},
+        max_tokens=output_tokens,
+    )
+    choice = response.choices[0]
+    if choice.finish_reason == "length":
+        return None, []
+    return parse_matcher_response(choice.message.content)
+
+
+def match_planned(
+    create: Callable[..., Any],
+    criteria_list: List[Dict[str, str]],
+    document_text: str,
+    *,
+    context_tokens: int = DEFAULT_CONTEXT_TOKENS,
+    output_tokens: int = DEFAULT_OUTPUT_TOKENS,
+    tokens_per_answer: int = TOKENS_PER_ANSWER,
+    workers: int = 4,
+    model: str = DEFAULT_MODEL,
+) -> PlannedMatch:
+    """Risponde ai criteri con richieste parallele pianificate da ``plan_groups``.
+
+    Solleva ``ValueError`` (da ``plan_groups``) se il documento non entra nel
+    contesto; gli errori delle singole richieste finiscono in ``errors``.
+    """
+    started = time.perf_counter()
+    plan = plan_groups(criteria_list, document_text, context_tokens=context_tokens, output_tokens=output_tokens,
+                       tokens_per_answer=tokens_per_answer, model=model)
+    result = PlannedMatch([], len(plan.groups), 0, 0, 0.0, 0)
+    answers: Dict[int, Dict[str, Any]] = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        def submit(indices: List[int]) -> None:
+            result.requests += 1
+            result.prompt_tokens += plan.base_tokens + sum(plan.criterion_tokens[i] for i in indices)
+            group = [criteria_list[i] for i in indices]
+            pending[pool.submit(_request_group, create, group, document_text, output_tokens, model)] = indices
+
+        pending: Dict[Any, List[int]] = {}
+        for indices in plan.groups:
+            submit(indices)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                indices = pending.pop(future)
+                ids = [criteria_list[i]["criterio_id"] for i in indices]
+                try:
+                    items, notes = future.result()
+                except Exception as exc:
+                    result.errors.append((ids, f"{type(exc).__name__}: {exc}"))
+                    continue
+                if items is None:
+                    if len(indices) == 1:
+                        result.errors.append((ids, f"risposta troncata anche per un solo criterio (max {output_tokens} token)"))
+                        continue
+                    half = len(indices) // 2
+                    result.splits += 1
+                    submit(indices[:half])
+                    submit(indices[half:])
+                    continue
+                result.notes.extend(n for n in notes if n not in result.notes)
+                by_id: Dict[str, List[Dict[str, Any]]] = {}
+                for item in items:
+                    by_id.setdefault(str(item["criterio_id"]), []).append(item)
+                for i in indices:
+                    matches = by_id.get(criteria_list[i]["criterio_id"])
+                    if matches:
+                        answers[i] = matches.pop(0)
+
+    for i, criterion in enumerate(criteria_list):
+        item = answers.get(i)
+        if item is not None:
+            item.setdefault("descrizione_guida", criterion.get("descrizione_guida", ""))
+            result.results.append(item)
+    missing = len(criteria_list) - len(result.results)
+    failed = sum(len(ids) for ids, _ in result.errors)
+    if missing > failed:
+        result.notes.append(("warning", f"{missing - failed} criteri senza risposta nella risposta del modello."))
+    result.elapsed = time.perf_counter() - started
+    return result
@@ -0,0 +1,130 @@
+"""Risposte per criterio riusate tra un'analisi e l'altra.
+
+La cache delle risposte OpenAI (``llm_cache``) è indirizzata per richiesta:
+se cambia la ``descrizione_guida`` di un solo criterio cambia il prompt e
+tutti i criteri vengono rinviati e ripagati. Qui ogni risposta è salvata
+con la chiave (criterio, testo del documento, variante), dove la variante
+raccoglie modello, versione del system prompt e modalità di analisi con i
+suoi parametri. ``match_incremental`` invia al modello solo i criteri senza
+risposta salvata e rimette insieme le risposte nell'ordine dei criteri.
+
+Le voci stanno in un ``ResponseCache`` separato, con le stesse regole di
+scadenza ed eliminazione delle risposte OpenAI.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from besidetech_common.llm_cache import DEFAULT_PATH as LLM_CACHE_PATH
+from besidetech_common.llm_cache import ResponseCache, request_key
+from matcher_core import DEFAULT_MODEL, SYSTEM_PROMPT_MATCHER
+
+DEFAULT_PATH = LLM_CACHE_PATH.with_name("match_results.sqlite3")
+
+# Da incrementare quando cambia il formato delle risposte salvate
+RESULT_VERSION = 1
+
+PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT_MATCHER.encode("utf-8")).hexdigest()[:16]
+
+
+def open_result_cache(path=DEFAULT_PATH) -> ResponseCache:
+    """Una risposta per criterio è piccola: più voci e meno byte della cache delle richieste."""
+    return ResponseCache(path, max_entries=100_000, max_bytes=256 * 1024 * 1024)
+
+
+def document_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def match_variant(model: str = DEFAULT_MODEL, retrieval: bool = False, top_k: int = 4, group_size: int = 5,
+                  embedding_model: Optional[str] = None) -> str:
+    """Modello, system prompt e modalità di analisi: risposte di varianti diverse non si mescolano.
+
+    Documento intero, in streaming o diviso in gruppi (``planner``) sono la
+    stessa variante: ogni criterio riceve comunque tutto il testo.
+    """
+    params: Dict[str, Any] = {"version": RESULT_VERSION, "model": model, "prompt": PROMPT_VERSION, "retrieval": retrieval}
+    if retrieval:
+        params.update(top_k=top_k, group_size=group_size, embedding_model=embedding_model)
+    return request_key(params)
+
+
+def result_key(criterion: Dict[str, str], document: str, variant: str) -> str:
+    """``document`` è ``document_key`` del testo."""
+    return request_key({"criterio_id": criterion.get("criterio_id", ""),
+                        "descrizione_guida": criterion.get("descrizione_guida", ""),
+                        "document": document, "variant": variant})
+
+
+@dataclass
+class IncrementalMatch:
+    results: List[Dict[str, Any]]
+    reused: List[bool] = field(default_factory=list)  # per risultato: True se dalla cache
+    sent: int = 0  # criteri inviati al modello
+    elapsed: float = 0.0
+
+    @property
+    def reused_count(self) -> int:
+        return sum(self.reused)
+
+
+def match_incremental(
+    criteria_list: List[Dict[str, str]],
+    document_text: str,
+    match: Callable[[List[Dict[str, str]]], List[Dict[str, Any]]],
+    cache: Optional[ResponseCache],
+    variant: str,
+    bypass: bool = False,
+) -> IncrementalMatch:
+    """Risposte per tutti i criteri, chiedendo a ``match`` solo quelli senza risposta salvata.
+
+    ``match`` riceve la lista dei criteri mancanti (nell'ordine di ingresso) e
+    restituisce i risultati ottenuti; note ed errori restano a chi la passa.
+    Le risposte nuove vengono salvate; con ``bypass`` la cache non viene letta
+    ma viene comunque aggiornata. Se ``match`` non è chiamata (tutto in cache)
+    ``sent`` resta 0.
+    """
+    started = time.perf_counter()
+    if cache is None:
+        results = match(criteria_list)
+        return IncrementalMatch(results, [False] * len(results), len(criteria_list), time.perf_counter() - started)
+
+    document = document_key(document_text)
+    keys = [result_key(c, document, variant) for c in criteria_list]
+    cached: Dict[int, Dict[str, Any]] = {}
+    if not bypass:
+        for i, key in enumerate(keys):
+            raw = cache.get(key)
+            if raw is not None:
+                cached[i] = json.loads(raw)
+    missing = [i for i in range(len(criteria_list)) if i not in cached]
+
+    fresh: Dict[str, List[Dict[str, Any]]] = {}
+    if missing:
+        for item in match([criteria_list[i] for i in missing]):
+            fresh.setdefault(str(item.get("criterio_id", "")), []).append(item)
+
+    result = IncrementalMatch([], sent=len(missing))
+    for i, criterion in enumerate(criteria_list):
+        if i in cached:
+            result.results.append(cached[i])
+            result.reused.append(True)
+            continue
+        answers = fresh.get(criterion["criterio_id"])
+        if not answers:
+            continue  # nessuna risposta: resta mancante e verrà richiesto la prossima volta
+        item = answers.pop(0)
+        item.setdefault("descrizione_guida", criterion.get("descrizione_guida", ""))
+        cache.put(keys[i], json.dumps(item, ensure_ascii=False))
+        result.results.append(item)
+        result.reused.append(False)
+    # Risposte con un criterio_id che non era stato chiesto: restituite come prima, ma non salvate
+    for answers in fresh.values():
+        result.results.extend(answers)
+        result.reused.extend([False] * len(answers))
+    result.elapsed = time.perf_counter() - started
+    return result
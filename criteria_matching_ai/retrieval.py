@@ -0,0 +1,320 @@
+"""Retrieval locale dei passaggi pertinenti per ogni criterio.
+
+Il documento viene diviso in passaggi con offset e pagina di provenienza,
+indicizzato con BM25 (NumPy, in memoria, nessun servizio esterno) e ogni
+gruppo di criteri viene inviato al modello solo con i propri top-k passaggi.
+I gruppi sono elaborati in parallelo e i risultati riordinati come i criteri
+in ingresso.
+
+In alternativa a BM25, ``build_embedding_index`` incorpora i passaggi con
+l'API embeddings e li salva in un ``EmbeddingStore``: lo stesso documento
+confrontato con un altro insieme di criteri riusa i vettori da disco e paga
+solo l'incorporamento dei criteri.
+"""
+from __future__ import annotations
+
+import re
+import time
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from besidetech_common.embedding_store import DEFAULT_EMBEDDING_MODEL, EmbeddingStore, embed_texts, text_key
+from besidetech_common.tokens import estimate_tokens
+from matcher_core import DEFAULT_MODEL, SYSTEM_PROMPT_MATCHER, Note, build_user_prompt, request_matches
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_PARAGRAPH = re.compile(r"\f|\n[ \t]*\n")
+_SENTENCE = re.compile(r"(?<=[.!?;:])\s+")
+
+# Parole troppo frequenti per discriminare i passaggi
+STOPWORDS = frozenset("""
+a ad al alla alle allo ai agli all anche che chi ci con da dal dalla dalle dei del della delle dello degli di e ed
+gli i il in la le lo ma ne nei nel nella nelle non o per più può se si sono su sua sue suo sul sulla tra un una uno
+è essere come questo questa quello quella loro deve devono dove the of and to
+""".split())
+
+
+@dataclass
+class Passage:
+    index: int
+    start: int
+    end: int
+    page: Optional[int]  # 1-based, None se il testo non ha informazioni di pagina
+    text: str
+
+    def label(self) -> str:
+        where = f"pagina {self.page}" if self.page is not None else f"caratteri {self.start}-{self.end}"
+        return f"[Estratto {self.index + 1} – {where}]"
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def page_offsets_from_text(text: str) -> List[int]:
+    """Offset di inizio pagina ricavati dai form feed, se il testo ne contiene."""
+    return [0] + [m.end() for m in re.finditer(r"\f", text)] if "\f" in text else []
+
+
+def split_passages(text: str, page_offsets: Optional[Sequence[int]] = None, max_chars: int = 1000) -> List[Passage]:
+    """Passaggi di circa ``max_chars`` caratteri tagliati su paragrafi (o frasi per i paragrafi lunghi)."""
+    if page_offsets is None:
+        page_offsets = page_offsets_from_text(text)
+    pieces: List[Tuple[int, int]] = []
+    pos = 0
+    bounds = [m.end() for m in _PARAGRAPH.finditer(text)] + [len(text)]
+    for end in bounds:
+        if end <= pos:
+            continue
+        if end - pos <= max_chars:
+            pieces.append((pos, end))
+        else:
+            cut = pos
+            for m in _SENTENCE.finditer(text, pos, end):
+                if m.end() - cut > max_chars and m.start() > cut:
+                    pieces.append((cut, m.start()))
+                    cut = m.end()
+            while end - cut > max_chars:
+                pieces.append((cut, cut + max_chars))
+                cut += max_chars
+            pieces.append((cut, end))
+        pos = end
+
+    passages: List[Passage] = []
+    start = end = None
+    for p_start, p_end in pieces:
+        # Una pagina nuova chiude sempre il passaggio corrente, così ogni passaggio ha una sola pagina
+        new_page = bool(page_offsets) and start is not None and bisect_right(page_offsets, p_start) != bisect_right(page_offsets, start)
+        if start is not None and (p_end - start > max_chars or new_page):
+            _add_passage(passages, text, start, end, page_offsets)
+            start = None
+        if start is None:
+            start = p_start
+        end = p_end
+    if start is not None:
+        _add_passage(passages, text, start, end, page_offsets)
+    return passages
+
+
+def _add_passage(passages: List[Passage], text: str, start: int, end: int, page_offsets: Sequence[int]) -> None:
+    body = text[start:end].strip()
+    if body:
+        page = bisect_right(page_offsets, start) if page_offsets else None
+        passages.append(Passage(len(passages), start, end, page, body))
+
+
+class BM25Index:
+    """Indice BM25 con liste di posting in array NumPy (termine → passaggi, frequenze)."""
+
+    def __init__(self, passages: Sequence[Passage], k1: float = 1.5, b: float = 0.75) -> None:
+        self.passages = list(passages)
+        self.k1, self.b = k1, b
+        vocab: Dict[str, int] = {}
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        lengths = np.zeros(len(self.passages), dtype=np.float32)
+        for doc, passage in enumerate(self.passages):
+            tokens = tokenize(passage.text)
+            lengths[doc] = len(tokens)
+            for tok in tokens:
+                term_ids.append(vocab.setdefault(tok, len(vocab)))
+            doc_ids.extend([doc] * len(tokens))
+        self.vocab = vocab
+
+        n_docs = max(1, len(self.passages))
+        keys, tf = np.unique(np.asarray(term_ids, dtype=np.int64) * n_docs + np.asarray(doc_ids, dtype=np.int64), return_counts=True)
+        terms = keys // n_docs
+        self._docs = (keys % n_docs).astype(np.int32)
+        self._tf = tf.astype(np.float32)
+        self._ptr = np.searchsorted(terms, np.arange(len(vocab) + 1))
+        df = np.diff(self._ptr).astype(np.float32)
+        self._idf = np.log1p((len(self.passages) - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = float(lengths.mean()) if len(lengths) else 0.0
+        self._norm = (k1 * (1 - b + b * lengths / avgdl)).astype(np.float32) if avgdl else np.full_like(lengths, k1)
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.passages), dtype=np.float32)
+        for term in set(tokenize(query)):
+            tid = self.vocab.get(term)
+            if tid is None:
+                continue
+            lo, hi = self._ptr[tid], self._ptr[tid + 1]
+            docs, tf = self._docs[lo:hi], self._tf[lo:hi]
+            scores[docs] += self._idf[tid] * tf * (self.k1 + 1) / (tf + self._norm[docs])
+        return scores
+
+    def top_k(self, query: str, k: int) -> List[Tuple[Passage, float]]:
+        scores = self.scores(query)
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(self.passages[i], float(scores[i])) for i in best if scores[i] > 0]
+
+
+class EmbeddingIndex:
+    """Passaggi con vettori normalizzati: il punteggio è il coseno tra criterio e passaggio.
+
+    ``prepare`` incorpora tutte le query in una richiesta e calcola i punteggi
+    con un solo prodotto matrice; ``top_k`` su una query non preparata la
+    incorpora da sola.
+    """
+
+    def __init__(self, passages: Sequence[Passage], vectors: np.ndarray,
+                 embed: Callable[[List[str]], np.ndarray]) -> None:
+        self.passages = list(passages)
+        self.vectors = vectors
+        self._embed = embed
+        self._scores: Dict[str, np.ndarray] = {}
+
+    def prepare(self, queries: Sequence[str]) -> None:
+        missing = list(dict.fromkeys(q for q in queries if q not in self._scores))
+        if not missing or not self.passages:
+            return
+        scores = self._embed(missing) @ np.asarray(self.vectors).T
+        for query, row in zip(missing, scores):
+            self._scores[query] = row
+
+    def scores(self, query: str) -> np.ndarray:
+        if query not in self._scores:
+            self.prepare([query])
+        return self._scores.get(query, np.zeros(len(self.passages), dtype=np.float32))
+
+    def top_k(self, query: str, k: int) -> List[Tuple[Passage, float]]:
+        scores = self.scores(query)
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(self.passages[i], float(scores[i])) for i in best]
+
+
+def build_embedding_index(
+    create_embeddings: Callable[..., Any],
+    document_text: str,
+    page_offsets: Optional[Sequence[int]] = None,
+    *,
+    store: Optional[EmbeddingStore] = None,
+    model: str = DEFAULT_EMBEDDING_MODEL,
+    max_chars: int = 1000,
+    workers: int = 4,
+) -> Tuple[EmbeddingIndex, bool]:
+    """Indice sui passaggi del documento e ``True`` se i vettori vengono dallo store.
+
+    ``create_embeddings`` è ``client.embeddings.create``. La voce dello store è
+    indirizzata dal testo, dal modello e dalla suddivisione in passaggi, che
+    viene ricalcolata (è deterministica) e confrontata con quella salvata.
+    """
+    passages = split_passages(document_text, page_offsets, max_chars)
+    spans = [[p.start, p.end, p.page] for p in passages]
+
+    def embed(texts: List[str]) -> np.ndarray:
+        return embed_texts(create_embeddings, texts, model, workers=workers)
+
+    key = text_key(document_text, model=model, max_chars=max_chars, page_offsets=list(page_offsets or []))
+    if store is not None:
+        stored = store.get(key)
+        if stored is not None and stored.meta.get("spans") == spans:
+            return EmbeddingIndex(passages, stored.vectors, embed), True
+    vectors = embed([p.text for p in passages])
+    if store is not None:
+        vectors = store.put(key, vectors, model=model, spans=spans).vectors
+    return EmbeddingIndex(passages, vectors, embed), False
+
+
+def criterion_query(criterion: Dict[str, str]) -> str:
+    return f"{criterion.get('criterio_id', '')} {criterion.get('descrizione_guida', '')}"
+
+
+@dataclass
+class RetrievalMatch:
+    results: List[Dict[str, Any]]
+    groups: int
+    elapsed: float
+    prompt_tokens_full: int  # stima del prompt unico con l'intero documento
+    prompt_tokens_sent: int  # stima della somma dei prompt effettivamente inviati
+    notes: List[Note] = field(default_factory=list)
+    errors: List[Tuple[List[str], str]] = field(default_factory=list)  # (criteri del gruppo, messaggio)
+
+
+def match_with_retrieval(
+    create: Callable[..., Any],
+    criteria_list: List[Dict[str, str]],
+    document_text: str,
+    *,
+    index: Optional[Any] = None,
+    page_offsets: Optional[Sequence[int]] = None,
+    top_k: int = 4,
+    group_size: int = 5,
+    workers: int = 4,
+    model: str = DEFAULT_MODEL,
+) -> RetrievalMatch:
+    """Risponde ai criteri inviando per ogni gruppo solo i passaggi più pertinenti.
+
+    ``index`` può essere un qualunque oggetto con ``top_k(query, k)`` (di default
+    un ``BM25Index`` costruito sul documento); se ha anche ``prepare(queries)``
+    viene chiamato una volta con le query di tutti i criteri. Ai risultati viene
+    aggiunto ``pagine_consultate`` con le pagine degli estratti usati per il criterio.
+    """
+    started = time.perf_counter()
+    if index is None:
+        index = BM25Index(split_passages(document_text, page_offsets))
+    if hasattr(index, "prepare"):
+        index.prepare([criterion_query(c) for c in criteria_list])
+
+    groups = [criteria_list[i:i + group_size] for i in range(0, len(criteria_list), max(1, group_size))]
+    hits_by_id: Dict[str, List[Passage]] = {}
+    prompts: List[str] = []
+    for group in groups:
+        selected: Dict[int, Passage] = {}
+        for criterion in group:
+            hits = [p for p, _ in index.top_k(criterion_query(criterion), top_k)]
+            hits_by_id[criterion["criterio_id"]] = hits
+            for passage in hits:
+                selected[passage.index] = passage
+        context = "\n\n".join(f"{p.label()}\n{p.text}" for _, p in sorted(selected.items()))
+        prompts.append(build_user_prompt(group, context or "(nessun estratto pertinente trovato)", excerpts=True))
+
+    def run(prompt: str):
+        try:
+            return request_matches(create, prompt, model), None
+        except Exception as exc:
+            return ([], []), f"{type(exc).__name__}: {exc}"
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        outcomes = list(pool.map(run, prompts))
+
+    system_tokens = estimate_tokens(SYSTEM_PROMPT_MATCHER)
+    result = RetrievalMatch(
+        [], len(groups), 0.0,
+        prompt_tokens_full=system_tokens + estimate_tokens(build_user_prompt(criteria_list, document_text)),
+        prompt_tokens_sent=sum(system_tokens + estimate_tokens(p) for p in prompts),
+    )
+    by_id: Dict[str, Dict[str, Any]] = {}
+    for group, ((answers, notes), error) in zip(groups, outcomes):
+        result.notes.extend(notes)
+        if error:
+            result.errors.append(([c["criterio_id"] for c in group], error))
+        for item in answers:
+            by_id.setdefault(str(item["criterio_id"]), item)
+
+    for criterion in criteria_list:
+        item = by_id.get(criterion["criterio_id"])
+        if item is None:
+            continue
+        pages = sorted({p.page for p in hits_by_id.get(criterion["criterio_id"], []) if p.page is not None})
+        item.setdefault("descrizione_guida", criterion.get("descrizione_guida", ""))
+        item["pagine_consultate"] = pages
+        result.results.append(item)
+    missing = len(criteria_list) - len(result.results)
+    if missing and not result.errors:
+        result.notes.append(("warning", f"{missing} criteri senza risposta nella risposta del modello."))
+    result.elapsed = time.perf_counter() - started
+    return result
+
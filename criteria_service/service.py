@@ -0,0 +1,483 @@
+"""Servizio HTTP locale con import, template e client già caldi.
+
+    python3 criteria_service/service.py --template criteria_json_restAPI/template.json --port 8700
+
+Il portale invia i file e riceve il JSON senza pagare a ogni batch l'avvio
+dell'interprete e l'import di openpyxl/pandas/PyPDF2. Le letture dei file
+(CPU) girano in un pool di processi avviato e scaldato all'avvio, le chiamate
+al modello (I/O) in un pool di thread; oltre ``workers + --queue`` richieste
+in attesa il servizio risponde 503 con ``Retry-After`` invece di accodarle.
+
+Endpoint (risposte JSON, errori come ``{"errore": "..."}``):
+
+    GET  /health                                  stato, uptime, richieste in corso
+    GET  /metrics                                 per endpoint: richieste, errori, rifiuti, p50/p95
+    POST /v1/formulario?id_domanda=..&compact=1   corpo: .xlsx del formulario → JSON del template
+    POST /v1/text?name=domanda.pdf                corpo: PDF/DOCX/XLSX → testo, offset di pagina, avvisi
+    POST /v1/extract                              {"text": ..., "mode": "single"|"chunked"} → criteri
+    POST /v1/match                                {"criteria": [...], "text": ..., "mode": "single"|"planned"|"retrieval"}
+
+``/v1/extract`` e ``/v1/match`` accettano anche il documento come corpo
+binario con ``?name=``; per il match, se il servizio è avviato con
+``--criteria-dir``, ``?criteria=`` indica un file di criteri in quella
+cartella (percorsi che ne escono vengono rifiutati). ``request_workers``
+(richieste parallele per la modalità a blocchi, planned e retrieval) è
+limitato a ``--llm-workers``. Il client OpenAI legge ``OPENAI_API_KEY`` e
+``OPENAI_BASE_URL``; con il mock locale:
+
+    python -m besidetech_common.mock_openai --port 8900
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=test python3 criteria_service/service.py ...
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))  # besidetech_common
+for tool in ("criteria_json_restAPI", "criteria_extractor_ai", "criteria_matching_ai"):
+    sys.path.insert(0, str(ROOT / tool))
+
+import openai  # noqa: E402
+
+import extractor_core  # noqa: E402
+import matcher_core  # noqa: E402
+from besidetech_common.ingestion import DEFAULT_DIR, IngestionCache, file_kind, ingest  # noqa: E402
+from besidetech_common.llm_cache import CachedCompletions, ResponseCache  # noqa: E402
+from planner import match_planned  # noqa: E402
+from retrieval import match_with_retrieval  # noqa: E402
+
+DEFAULT_PORT = 8700
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def positive_int(options: Dict[str, Any], key: str, default: int, maximum: Optional[int] = None) -> int:
+    """Intero positivo da JSON o query string (``"4"`` o ``4``), limitato a ``maximum``; altrimenti 400."""
+    value = options.get(key, default)
+    if isinstance(value, int) and not isinstance(value, bool):
+        number = value
+    elif isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        number = int(value)
+    else:
+        raise HTTPError(400, f"'{key}' deve essere un intero positivo, ricevuto {value!r}")
+    if number < 1:
+        raise HTTPError(400, f"'{key}' deve essere un intero positivo, ricevuto {number}")
+    return min(number, maximum) if maximum is not None else number
+
+
+# ---------------------------------------------------------------------------
+# Lavoro nei processi: stato caricato una volta per processo dall'initializer
+
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(template_path: Optional[str], cache_dir: Optional[str]) -> None:
+    import crieteria_json_rest as rest
+    from template_engine import CompiledTemplate
+
+    for module in ("PyPDF2", "docx", "pandas"):  # solo per scaldare gli import dei parser
+        try:
+            __import__(module)
+        except ImportError:
+            pass  # il formato corrispondente risponderà con l'errore del parser
+
+    _worker["rest"] = rest
+    _worker["template"] = CompiledTemplate(rest.load_template(Path(template_path))) if template_path else None
+    _worker["cache"] = IngestionCache(Path(cache_dir)) if cache_dir else IngestionCache(None)
+
+
+def _warm(_: int) -> int:
+    return os.getpid()
+
+
+def _formulario(data: bytes, id_domanda: Optional[str], compact: bool) -> str:
+    import io
+
+    template = _worker["template"]
+    payload = _worker["rest"].process_excel(io.BytesIO(data), template, False, id_domanda)
+    return template.dumps(payload, compact=compact)
+
+
+def _text(data: bytes, name: str) -> Dict[str, Any]:
+    document, hit = ingest(data, name, _worker["cache"], pdf_workers=1)
+    return {"testo": document.text, "pagine": document.page_offsets, "avvisi": document.warnings, "cache": hit}
+
+
+# ---------------------------------------------------------------------------
+# Metriche
+
+class RouteStats:
+    def __init__(self, window: int = 1000) -> None:
+        self.requests = 0
+        self.errors = 0  # risposte >= 400 escluse le 503 per coda piena
+        self.rejected = 0
+        self.latencies: Deque[float] = deque(maxlen=window)
+
+    def snapshot(self) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+
+        def pct(q: float) -> float:
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4) if ordered else 0.0
+
+        return {"requests": self.requests, "errors": self.errors, "rejected": self.rejected,
+                "p50": pct(0.50), "p95": pct(0.95), "max": round(ordered[-1], 4) if ordered else 0.0}
+
+
+class Service:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.started = time.time()
+        self.template = str(Path(args.template).resolve()) if args.template else None
+        self.criteria_dir = Path(args.criteria_dir).resolve() if args.criteria_dir else None
+        cache_dir = None if args.no_cache else str(Path(args.cache_dir).expanduser() if args.cache_dir else DEFAULT_DIR)
+        self.processes = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                             initargs=(self.template, cache_dir))
+        # Avvia e scalda subito tutti i processi, così la prima richiesta non paga gli import
+        list(self.processes.map(_warm, range(args.workers)))
+        self.threads = ThreadPoolExecutor(max_workers=args.llm_workers, thread_name_prefix="llm")
+        self._slots = threading.BoundedSemaphore(args.workers + args.llm_workers + args.queue)
+        # Le modalità chunked/planned/retrieval fanno chiamate in parallelo dentro ogni richiesta:
+        # il limite vale per le singole chiamate al modello, non per le richieste
+        self._llm_calls = threading.BoundedSemaphore(args.llm_workers)
+
+        self.completions: Optional[CachedCompletions] = None
+        self.openai_error: Optional[str] = None
+        try:
+            client = openai.OpenAI(max_retries=args.retries, timeout=args.timeout)
+            self.completions = CachedCompletions(client, None if args.no_cache else ResponseCache())
+        except openai.OpenAIError as exc:
+            self.openai_error = str(exc)
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.stats: Dict[str, RouteStats] = {}
+
+    def close(self) -> None:
+        self.threads.shutdown(wait=False, cancel_futures=True)
+        self.processes.shutdown(wait=False, cancel_futures=True)
+
+    # -- esecuzione limitata ----------------------------------------------
+
+    def run(self, pool: Any, fn: Callable[..., Any], *args: Any) -> Any:
+        if not self._slots.acquire(blocking=False):
+            raise HTTPError(503, "Servizio occupato, riprovare", {"Retry-After": "1"})
+        with self._lock:
+            self.in_flight += 1
+        try:
+            return pool.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def record(self, route: str, status: int, elapsed: float) -> None:
+        with self._lock:
+            stats = self.stats.setdefault(route, RouteStats())
+            stats.requests += 1
+            if status == 503:
+                stats.rejected += 1
+            elif status >= 400:
+                stats.errors += 1
+            stats.latencies.append(elapsed)
+
+    def create(self) -> Callable[..., Any]:
+        if self.completions is None:
+            raise HTTPError(503, f"Client OpenAI non configurato (env OPENAI_API_KEY / OPENAI_BASE_URL): {self.openai_error}")
+        completions = self.completions
+
+        def create(**params: Any) -> Any:
+            with self._llm_calls:
+                return completions.create(**params)
+
+        return create
+
+    # -- endpoint ---------------------------------------------------------
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight = self.in_flight
+        return {
+            "status": "ok",
+            "uptime": round(time.time() - self.started, 1),
+            "workers": self.args.workers,
+            "llm_workers": self.args.llm_workers,
+            "in_flight": in_flight,
+            "template": self.template,
+            "openai": self.completions is not None,
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            routes = {route: stats.snapshot() for route, stats in sorted(self.stats.items())}
+            in_flight = self.in_flight
+        data: Dict[str, Any] = {"uptime": round(time.time() - self.started, 1), "in_flight": in_flight, "routes": routes}
+        if self.completions is not None:
+            data["llm_cache"] = {"hits": self.completions.hits, "misses": self.completions.misses}
+        return data
+
+    def document_text(self, body: bytes, query: Dict[str, str], request: Optional[Dict[str, Any]]) -> str:
+        """Testo da ``{"text": ...}`` oppure dal file nel corpo (``?name=`` per il formato)."""
+        if request is not None:
+            text = request.get("text")
+            if not isinstance(text, str) or not text.strip():
+                raise HTTPError(400, "Campo 'text' mancante o vuoto")
+            return text
+        name = query.get("name", "")
+        if not file_kind(name):
+            raise HTTPError(400, "Indicare ?name= con estensione .pdf, .docx, .xlsx o .xls, oppure inviare JSON con 'text'")
+        text = self.run(self.processes, _text, body, name)["testo"]
+        if not text.strip():
+            raise HTTPError(422, "Nessun testo estratto dal documento")
+        return text
+
+    def formulario(self, body: bytes, query: Dict[str, str]) -> str:
+        if self.template is None:
+            raise HTTPError(404, "Servizio avviato senza --template: /v1/formulario non disponibile")
+        compact = query.get("compact", "") in ("1", "true", "si", "sì")
+        return self.run(self.processes, _formulario, body, query.get("id_domanda") or None, compact)
+
+    def text(self, body: bytes, query: Dict[str, str]) -> Dict[str, Any]:
+        name = query.get("name", "")
+        if not file_kind(name):
+            raise HTTPError(400, "Indicare ?name= con estensione .pdf, .docx, .xlsx o .xls")
+        return self.run(self.processes, _text, body, name)
+
+    def extract(self, body: bytes, query: Dict[str, str], request: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        options = request or query
+        text = self.document_text(body, query, request)
+        create = self.create()
+        model = options.get("model") or extractor_core.DEFAULT_MODEL
+        if options.get("mode", "single") == "chunked":
+            max_chunk_tokens = positive_int(options, "max_chunk_tokens", 6000)
+            workers = positive_int(options, "request_workers", 4, self.args.llm_workers)
+            result = self.run(self.threads, lambda: extractor_core.extract_criteria_chunked(
+                create, text, model=model, max_chunk_tokens=max_chunk_tokens, workers=workers,
+            ))
+            return {"criteri": result.criteria, "note": [m for _, m in result.notes],
+                    "errori": [f"blocco {i + 1}: {e}" for i, e in result.errors], "blocchi": result.chunks}
+        criteria, notes = self.run(self.threads, extractor_core.request_criteria, create,
+                                   extractor_core.build_user_prompt(text), model)
+        return {"criteri": criteria, "note": [m for _, m in notes], "errori": []}
+
+    def criteria_file(self, name: str) -> bytes:
+        """Byte del file di criteri ``name`` dentro ``--criteria-dir``; mai fuori da quella cartella."""
+        if self.criteria_dir is None:
+            raise HTTPError(400, "?criteria= non abilitato: avviare il servizio con --criteria-dir o inviare 'criteria' nel JSON")
+        path = (self.criteria_dir / name).resolve()
+        if not path.is_relative_to(self.criteria_dir):
+            raise HTTPError(400, f"Percorso dei criteri fuori da --criteria-dir: {name}")
+        try:
+            return path.read_bytes()
+        except OSError:
+            raise HTTPError(404, f"File di criteri non trovato in --criteria-dir: {name}")
+
+    def match(self, body: bytes, query: Dict[str, str], request: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        options = request or query
+        if request is not None:
+            criteria = request.get("criteria")
+            criteria = matcher_core.parse_criteria_json(json.dumps(criteria).encode("utf-8")) if criteria else []
+        elif query.get("criteria"):
+            criteria = matcher_core.parse_criteria_json(self.criteria_file(query["criteria"]))
+        else:
+            criteria = []
+        if not criteria:
+            raise HTTPError(400, "Nessun criterio: inviare 'criteria' nel JSON o ?criteria= con un file in --criteria-dir")
+        text = self.document_text(body, query, request)
+        create = self.create()
+        model = options.get("model") or matcher_core.DEFAULT_MODEL
+        mode = options.get("mode", "single")
+        workers = positive_int(options, "request_workers", 4, self.args.llm_workers)
+        if mode == "retrieval":
+            top_k = positive_int(options, "top_k", 4)
+            group_size = positive_int(options, "group_size", 5)
+            result = self.run(self.threads, lambda: match_with_retrieval(
+                create, criteria, text, top_k=top_k, group_size=group_size, workers=workers, model=model,
+            ))
+            errors = [f"criteri {', '.join(ids)}: {error}" for ids, error in result.errors]
+            return {"risultati": result.results, "note": [m for _, m in result.notes], "errori": errors}
+        if mode == "planned":
+            result = self.run(self.threads, lambda: match_planned(create, criteria, text, workers=workers, model=model))
+            errors = [f"criteri {', '.join(ids)}: {error}" for ids, error in result.errors]
+            return {"risultati": result.results, "note": [m for _, m in result.notes], "errori": errors,
+                    "richieste": result.requests}
+        if mode != "single":
+            raise HTTPError(400, f"Modalità sconosciuta: {mode} (single, planned, retrieval)")
+        results, notes = self.run(self.threads, matcher_core.request_matches, create,
+                                  matcher_core.build_user_prompt(criteria, text), model)
+        return {"risultati": results, "note": [m for _, m in notes], "errori": []}
+
+
+# ---------------------------------------------------------------------------
+# HTTP
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service: Service
+    ROUTES = ("/v1/formulario", "/v1/text", "/v1/extract", "/v1/match")
+
+    def log_message(self, fmt: str, *args: Any) -> None:
+        if self.service.args.verbose:
+            super().log_message(fmt, *args)
+
+    def _reply(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        raw = (body if isinstance(body, str) else json.dumps(body, ensure_ascii=False)).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(raw)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _handle(self, route: str, fn: Callable[[], Any]) -> None:
+        started = time.perf_counter()
+        status = 200
+        try:
+            self._reply(200, fn())
+        except HTTPError as exc:
+            status = exc.status
+            self._reply(exc.status, {"errore": str(exc)}, exc.headers)
+        except (ValueError, KeyError, zipfile.BadZipFile) as exc:  # input non valido (JSON, criteri, file)
+            status = 400
+            self._reply(400, {"errore": f"{type(exc).__name__}: {exc}"})
+        except openai.APIError as exc:
+            status = 502
+            self._reply(502, {"errore": f"Errore API OpenAI: {exc}"})
+        except Exception as exc:
+            status = 500
+            self._reply(500, {"errore": f"{type(exc).__name__}: {exc}"})
+        finally:
+            self.service.record(route, status, time.perf_counter() - started)
+
+    def do_GET(self) -> None:
+        route = urlsplit(self.path).path.rstrip("/")
+        if route == "/health":
+            self._handle(route, self.service.health)
+        elif route == "/metrics":
+            self._handle(route, self.service.metrics)
+        else:
+            self._reply(404, {"errore": f"Endpoint sconosciuto: {route}"})
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        route = url.path.rstrip("/")
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        length = self.headers.get("Content-Length")
+        error = None
+        if length is None:
+            error = HTTPError(411, "Content-Length mancante")
+        else:
+            try:
+                size = int(length)
+            except ValueError:
+                size = -1
+            if size < 0:
+                error = HTTPError(400, f"Content-Length non valido: {length!r}")
+            elif size > self.service.args.max_bytes:
+                error = HTTPError(413, f"Corpo oltre {self.service.args.max_bytes} byte")
+        if error is not None:
+            self.close_connection = True  # il corpo non letto resta nel socket
+
+            if route not in self.ROUTES:
+                self._reply(error.status, {"errore": str(error)})
+                return
+
+            def reject() -> Any:
+                raise error
+
+            self._handle(route, reject)  # conteggiata in /metrics come le altre risposte della route
+            return
+        body = self.rfile.read(size)
+        is_json = self.headers.get("Content-Type", "").split(";")[0].strip() == "application/json"
+
+        def request() -> Optional[Dict[str, Any]]:
+            if not is_json:
+                return None
+            data = json.loads(body or b"{}")
+            if not isinstance(data, dict):
+                raise HTTPError(400, "Il corpo JSON deve essere un oggetto")
+            return data
+
+        service = self.service
+        routes: Dict[str, Callable[[], Any]] = {
+            "/v1/formulario": lambda: service.formulario(body, query),
+            "/v1/text": lambda: service.text(body, query),
+            "/v1/extract": lambda: service.extract(body, query, request()),
+            "/v1/match": lambda: service.match(body, query, request()),
+        }
+        if route not in self.ROUTES:
+            self._reply(404, {"errore": f"Endpoint sconosciuto: {route}"})
+            return
+        self._handle(route, routes[route])
+
+
+def serve(service: Service, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """Avvia il server in un thread daemon e lo restituisce (``server.server_port`` per la porta)."""
+    handler = type("BoundServiceHandler", (ServiceHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(description="Servizio HTTP locale per formulari, testo dei documenti ed estrazione/matching AI")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--template", help="Template JSON per /v1/formulario (senza, l'endpoint risponde 404)")
+    p.add_argument("--workers", type=int, default=max(1, min(4, os.cpu_count() or 1)),
+                   help="Processi per la lettura di Excel e documenti")
+    p.add_argument("--llm-workers", type=int, default=8,
+                   help="Chiamate al modello contemporanee in tutto il servizio, comprese quelle in parallelo "
+                        "dentro una richiesta; anche il massimo di 'request_workers' per richiesta")
+    p.add_argument("--criteria-dir", help="Cartella da cui /v1/match può leggere ?criteria=<file> (senza, il parametro è rifiutato)")
+    p.add_argument("--queue", type=int, default=16, help="Richieste in attesa oltre i worker prima di rispondere 503")
+    p.add_argument("--max-bytes", type=int, default=100 * 1024 * 1024, help="Dimensione massima del corpo")
+    p.add_argument("--retries", type=int, default=3, help="Tentativi aggiuntivi del client OpenAI su 429/5xx")
+    p.add_argument("--timeout", type=float, default=600.0, help="Timeout per chiamata OpenAI in secondi")
+    p.add_argument("--cache-dir", help="Cartella della cache dei testi (default quella condivisa con le app)")
+    p.add_argument("--no-cache", action="store_true", help="Non usare la cache di testi e risposte")
+    p.add_argument("--verbose", action="store_true", help="Log di ogni richiesta")
+    return p
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    if args.template and not Path(args.template).is_file():
+        sys.exit(f"[FATAL] Template non trovato: {args.template}")
+    t0 = time.perf_counter()
+    service = Service(args)
+    server = serve(service, args.host, args.port)
+    print(f"[INFO] Servizio su http://{args.host}:{server.server_port} pronto in {time.perf_counter() - t0:.1f}s "
+          f"({args.workers} processi, {args.llm_workers} richieste al modello, coda {args.queue})")
+    if service.completions is None:
+        print(f"[WARN] Client OpenAI non configurato: /v1/extract e /v1/match risponderanno 503 ({service.openai_error})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        service.close()
+        print(f"[FINE] {json.dumps(service.metrics()['routes'], ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()